@@ -1,10 +1,34 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from models import MsgPayload
-from routers.vigia import router as vigia_router
+from routers.vigia import router as vigia_router, crear_worker_pool
+from services.http_client import init_http_client, close_http_client
+from services.executors import init_executors, shutdown_executors
 from dotenv import load_dotenv
 load_dotenv()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un solo cliente HTTP con pool de conexiones por proceso, compartido por los assistants
+    await init_http_client()
+    # Pools de procesos/hilos para el parseo y la descompresión, fuera del event loop
+    init_executors()
+    # Workers de la cola de solicitudes dentro del proceso (JOB_WORKERS=0 si corren aparte con worker.py)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    worker_pool = crear_worker_pool(JOB_WORKERS) if JOB_WORKERS > 0 else None
+    if worker_pool:
+        await worker_pool.start()
+    yield
+    if worker_pool:
+        await worker_pool.stop()
+    shutdown_executors()
+    await close_http_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Habilitar CORS para todos los orígenes (puedes personalizar los parámetros)
 app.add_middleware(
@@ -1,32 +1,34 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from flask import json
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import Headers
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from bson import ObjectId
-from io import BytesIO, StringIO
+from io import BytesIO
 from models import TipoAsistenteEnum
-from openpyxl import load_workbook
-from openpyxl.cell.cell import MergedCell
 from dotenv import load_dotenv
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from fastapi import UploadFile
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
 
-import zipfile
-import rarfile
 import tempfile
 import os
 import asyncio
 import pandas as pd
-
-from services.openai_assistant  import OpenAIAssistant
+from collections import Counter
+
+from services.proveedores import AssistantBackend, crear_assistant, elegir_proveedor
+from services.http_client import get_http_client
+from services.file_cache import FileCache, hash_fileobj
+from services.jobs import JobQueue, WorkerPool
+from services.progress import progress_bus, format_sse, ETAPAS_FINALES
+from services.excel import LibroExcel, cargar_libro_excel, filas_como_texto
+from services.executors import run_cpu, run_io
+from services.archivos import ExtractorArchivos, LimitesDescompresion
+from services.clasificacion import clasificar_archivos
+from services.texto_local import TIPOS_CON_TEXTO, extraer_texto_local
+from services.pdf_hojas import renderizar_tabla_pdf, renderizar_tablas_pdf, tabla_hoja, tablas_excel_bytes
+from services.rate_limit import ContadorMongo, configurar_contador_compartido
+from services.run_tracker import run_tracker
 
 # Cargar variables de entorno
 load_dotenv()
@@ -35,6 +37,20 @@ load_dotenv()
 MONGO_URL = os.getenv("MONGO_URL")
 client = AsyncIOMotorClient(MONGO_URL)
 db = client["RFPScrum"]
+# Cache de anexos subidos (SHA-256 -> file_id) con TTL y contador de referencias
+file_cache = FileCache(db.ArchivoCache, ttl_hours=float(os.getenv("ANEXOS_CACHE_TTL_HOURS", "168")))
+# Archivos recibidos (Excel y anexos) mientras la solicitud espera en la cola
+fs_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="SolicitudArchivos")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+# Cola de solicitudes con lease, heartbeat y reintentos
+job_queue = JobQueue(
+    db.Jobs,
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "300")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+)
+# Presupuesto de requests/tokens por minuto compartido entre workers (por defecto, solo por proceso)
+if os.getenv("RATE_LIMIT_SHARED", "false").lower() in ("1", "true", "yes"):
+    configurar_contador_compartido(ContadorMongo(db.RateLimit))
 
 # --- Modelos Pydantic ---
 class SolicitudModel(BaseModel):
@@ -56,62 +72,37 @@ class SolicitudModel(BaseModel):
     Cuestionario: Optional[str] = None
     Analisis: Optional[str] = None
     Mensaje: Optional[str] = None
+    VectorStoreID: Optional[str] = None
+    ProveedorIA: Optional[str] = None
+    Etapa: Optional[str] = None
+    Manifiesto: Optional[List[dict]] = None
     class Config:
         from_attributes = True  # Pydantic v2
 
-async def descomprimir_anexos_recursivo(anexos: list) -> list:
-    archivos_finales = []
-
-    def leer_fileobj(fileobj):
-        return fileobj.read()
-
-    async def procesar_archivo(fileobj, filename):
-        ext = filename.lower().split('.')[-1]
-        if ext == 'zip':
-            with tempfile.TemporaryDirectory() as tmpdir:
-                path = os.path.join(tmpdir, filename)
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                with open(path, "wb") as f:
-                    f.write(leer_fileobj(fileobj))
-                with zipfile.ZipFile(path, 'r') as zf:
-                    for info in zf.infolist():
-                        if info.is_dir():
-                            continue
-                        inner_name = info.filename
-                        inner_bytes = zf.read(inner_name)
-                        if inner_name.lower().endswith(('.zip', '.rar')):
-                            await procesar_archivo(BytesIO(inner_bytes), inner_name)
-                        else:
-                            archivos_finales.append(
-                                UploadFile(file=BytesIO(inner_bytes), filename=os.path.basename(inner_name))
-                            )
-        elif ext == 'rar':
-            with tempfile.TemporaryDirectory() as tmpdir:
-                path = os.path.join(tmpdir, filename)
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                with open(path, "wb") as f:
-                    f.write(leer_fileobj(fileobj))
-                with rarfile.RarFile(path) as rf:
-                    for info in rf.infolist():
-                        if info.is_dir():
-                            continue
-                        inner_name = info.filename
-                        inner_bytes = rf.read(inner_name)
-                        if inner_name.lower().endswith(('.zip', '.rar')):
-                            await procesar_archivo(BytesIO(inner_bytes), inner_name)
-                        else:
-                            archivos_finales.append(
-                                UploadFile(file=BytesIO(inner_bytes), filename=os.path.basename(inner_name))
-                            )
-        else:
-            archivos_finales.append(
-                UploadFile(file=BytesIO(leer_fileobj(fileobj)), filename=filename)
-            )
-
-    for anexo in anexos:
-        await procesar_archivo(anexo.file, anexo.filename)
+def leer_contenido(fileobj) -> bytes:
+    fileobj.seek(0)
+    return fileobj.read()
 
-    return archivos_finales
+async def descomprimir_anexos_recursivo(anexos: list, omitidos: Optional[list] = None) -> list:
+    """
+    Descomprime los anexos zip/rar (también anidados) en streaming a archivos temporales, con los límites
+    ARCHIVE_* aplicados a toda la solicitud (los archivos que los superan se omiten y se registran).
+    Los comprimidos se extraen en paralelo (ARCHIVE_EXTRACT_CONCURRENCY a la vez) y lo que queda en memoria
+    se acota con ARCHIVE_MAX_MEMORY_BYTES. Retorna UploadFiles con los archivos finales en el orden original;
+    si se indica omitidos, agrega ahí los (nombre, motivo) de lo que no se extrajo.
+    """
+    extractor = ExtractorArchivos(
+        LimitesDescompresion.desde_entorno(),
+        SPOOL_MAX_BYTES,
+        max_memoria_bytes=int(os.getenv("ARCHIVE_MAX_MEMORY_BYTES", str(256 * 1024 * 1024)))
+    )
+    archivos = await extractor.extraer_anexos(
+        [(anexo.filename, anexo.file) for anexo in anexos],
+        max_concurrency=int(os.getenv("ARCHIVE_EXTRACT_CONCURRENCY", "4"))
+    )
+    if omitidos is not None:
+        omitidos.extend(extractor.omitidos)
+    return [UploadFile(file=archivo, filename=nombre) for nombre, archivo in archivos]
 
 def extraer_hojas_excel_plano(excel_file) -> str:
     """
@@ -124,6 +115,7 @@ def extraer_hojas_excel_plano(excel_file) -> str:
     6. Req del servicio
 
     Maneja celdas combinadas y retorna un string legible y coherente.
+    Acepta un UploadFile o un LibroExcel ya parseado (ver services/excel.py).
     """
     hojas_objetivo = [
         "1.Datos del proveedor",
@@ -136,31 +128,15 @@ def extraer_hojas_excel_plano(excel_file) -> str:
         "5. Experiencia Certificaciones",
         "6. Req del servicio"
     ]
-    contents = excel_file.file.read()
-    wb = load_workbook(filename=BytesIO(contents), data_only=True)
+    libro = cargar_libro_excel(excel_file)
     resultado = []
 
     for hoja in hojas_objetivo:
-        if hoja not in wb.sheetnames:
+        if hoja not in libro:
             resultado.append(f"--- {hoja} ---\n[Hoja no encontrada]\n")
             continue
-        ws = wb[hoja]
-        # Crear una matriz con los valores de las celdas, rellenando celdas combinadas
-        data = []
-        for row in ws.iter_rows():
-            data_row = []
-            for cell in row:
-                if isinstance(cell, MergedCell):
-                    # Buscar el valor de la celda superior izquierda del rango combinado
-                    valor = None
-                    for merged_range in ws.merged_cells.ranges:
-                        if cell.coordinate in merged_range:
-                            valor = ws.cell(merged_range.min_row, merged_range.min_col).value
-                            break
-                    data_row.append(valor)
-                else:
-                    data_row.append(cell.value)
-            data.append(data_row)
+        # Matriz con los valores de las celdas, con celdas combinadas ya rellenadas
+        data = libro[hoja].valores()
         df = pd.DataFrame(data)
         df.dropna(axis=0, how='all', inplace=True)
         df.dropna(axis=1, how='all', inplace=True)
@@ -197,9 +173,8 @@ def extraer_hojas_excel_json(excel_file: UploadFile) -> dict:
         "1.Datos del proveedor": [ {col1: val1, col2: val2, ...}, ... ],
         ...
     }
+    Acepta un UploadFile o un LibroExcel ya parseado.
     """
-    from openpyxl.cell.cell import MergedCell
-
     hojas_objetivo = [
         "1.Datos del proveedor",
         "2. Roles",
@@ -208,24 +183,15 @@ def extraer_hojas_excel_json(excel_file: UploadFile) -> dict:
         "5. Experiencia",
         "6. Req del servicio"
     ]
-    contents = excel_file.file.read()
-    wb = load_workbook(filename=BytesIO(contents), data_only=True)
+    libro = cargar_libro_excel(excel_file)
     resultado = {}
 
     for hoja in hojas_objetivo:
-        if hoja not in wb.sheetnames:
+        if hoja not in libro:
             resultado[hoja] = []
             continue
-        ws = wb[hoja]
-        # Rellenar celdas combinadas
-        for merged in ws.merged_cells.ranges:
-            valor = ws.cell(merged.min_row, merged.min_col).value
-            for row in ws.iter_rows(merged.min_row, merged.max_row, merged.min_col, merged.max_col):
-                for cell in row:
-                    if not isinstance(cell, MergedCell):
-                        cell.value = valor
-
-        data = list(ws.values)
+        # Valores con las celdas combinadas rellenadas
+        data = libro[hoja].valores()
         # Eliminar filas y columnas completamente vacías
         df = pd.DataFrame(data)
         df.dropna(axis=0, how='all', inplace=True)
@@ -245,107 +211,229 @@ def extraer_hojas_excel_json(excel_file: UploadFile) -> dict:
 
     return resultado
 
+def nombre_pdf_hoja(sheet_name: str) -> str:
+    return "".join([c if c.isalnum() else "_" for c in sheet_name]) + ".pdf"
+
 def extraer_hojas_excel_a_pdfs(excel_file: UploadFile, output_dir: str = "pdfs_generados") -> list:
     """
     Recibe un archivo Excel y guarda un PDF por cada hoja en la ruta indicada,
-    con formato de tabla, colores y márgenes adecuados.
+    con formato de tabla, colores y márgenes adecuados (anchos de columna según el contenido;
+    las tablas anchas van en horizontal o divididas en bloques de columnas).
     Retorna una lista con las rutas de los PDFs generados.
+    Acepta un UploadFile o un LibroExcel ya parseado.
+    Para renderizar en paralelo y en memoria, ver renderizar_excel_a_pdfs.
     """
     import os
-    from reportlab.lib.pagesizes import letter
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet
 
-    contents = excel_file.file.read()
-    xls = pd.ExcelFile(BytesIO(contents))
+    libro = cargar_libro_excel(excel_file)
     pdf_paths = []
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    styles = getSampleStyleSheet()
-    page_width, page_height = letter
-    left_margin = right_margin = 30
-    top_margin = bottom_margin = 30
-    usable_width = page_width - left_margin - right_margin
-
-    for sheet_name in xls.sheet_names:
-        df = xls.parse(sheet_name)
-        df = df.fillna("")
-        data = [list(df.columns)] + df.values.tolist()
-
-        # Calcular anchos de columna
-        num_cols = len(data[0])
-        if num_cols == 0:
+    for sheet_name in libro.sheetnames:
+        tabla = tabla_hoja(libro, sheet_name)
+        if not tabla[0]:
             continue
-        col_width = usable_width / num_cols
-        col_widths = [col_width] * num_cols
-
-        safe_sheet_name = "".join([c if c.isalnum() else "_" for c in sheet_name])
-        pdf_path = os.path.join(output_dir, f"{safe_sheet_name}.pdf")
-        doc = SimpleDocTemplate(
-            pdf_path,
-            pagesize=letter,
-            leftMargin=left_margin,
-            rightMargin=right_margin,
-            topMargin=top_margin,
-            bottomMargin=bottom_margin
-        )
-        elements = []
-
-        # Título
-        elements.append(Paragraph(f"Hoja: {sheet_name}", styles['Title']))
-        elements.append(Spacer(1, 12))
-
-        # Tabla
-        table = Table(data, colWidths=col_widths, repeatRows=1)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#dbe5f1")),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor("#17375d")),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#f2f2f2")]),
-            ('LEFTPADDING', (0, 0), (-1, -1), 4),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        elements.append(table)
-        doc.build(elements)
+        pdf_path = os.path.join(output_dir, nombre_pdf_hoja(sheet_name))
+        with open(pdf_path, "wb") as f:
+            f.write(renderizar_tabla_pdf(sheet_name, tabla))
         pdf_paths.append(pdf_path)
     return pdf_paths
 
+async def renderizar_excel_a_pdfs(excel_file: UploadFile) -> list:
+    """
+    Variante en memoria y en paralelo de extraer_hojas_excel_a_pdfs: cada hoja se renderiza en el
+    pool de procesos (con cache por contenido de la hoja) y se retorna [(nombre_pdf, bytes)] listo para subir.
+    """
+    contents = await run_io(leer_contenido, excel_file.file)
+    tablas = await run_cpu(tablas_excel_bytes, contents)
+    pdfs = await renderizar_tablas_pdf(tablas)
+    return [(nombre_pdf_hoja(sheet_name), pdf) for (sheet_name, _), pdf in zip(tablas, pdfs)]
+
 def extraer_excel_para_assistant(excel_file: UploadFile) -> str:
     """
     Extrae todas las hojas del Excel y las convierte en texto plano tipo tabla,
     omitiendo filas completamente vacías.
+    Acepta un UploadFile o un LibroExcel ya parseado.
     """
-    contents = excel_file.file.read()
-    xls = pd.ExcelFile(BytesIO(contents))
+    libro = cargar_libro_excel(excel_file)
     resultado = []
 
-    for sheet_name in xls.sheet_names:
-        df = xls.parse(sheet_name)
+    for sheet_name in libro.sheetnames:
+        df = libro[sheet_name].dataframe()
         df = df.fillna("")
         texto_hoja = f"\n=== Hoja: {sheet_name} ===\n"
         headers = [str(h).strip() for h in df.columns]
         texto_hoja += " | ".join(headers) + "\n"
         texto_hoja += "-" * (len(texto_hoja) - 1) + "\n"
-        for _, row in df.iterrows():
-            fila = [str(x).strip() for x in row]
-            # Omitir filas donde todos los valores están vacíos
-            if any(fila):
-                texto_hoja += " | ".join(fila) + "\n"
+        # Filas renderizadas por columnas, omitiendo filas donde todos los valores están vacíos
+        lineas = filas_como_texto(df)
+        if lineas:
+            texto_hoja += "\n".join(lineas) + "\n"
         resultado.append(texto_hoja)
 
     return "\n".join(resultado)
 
+def extraer_excel_para_assistant_bytes(contents: bytes) -> str:
+    """
+    Variante de extraer_excel_para_assistant que recibe los bytes del Excel, para ejecutarse
+    en el pool de procesos (entrada y salida serializables).
+    """
+    return extraer_excel_para_assistant(LibroExcel.desde_bytes(contents))
+
+async def filtrar_anexos_indexables(anexos: list) -> tuple:
+    """
+    Clasifica los anexos por sus primeros bytes (services/clasificacion.py) y retorna
+    (anexos a subir, manifiesto). Los anexos incluidos llevan el nombre con la extensión del tipo
+    detectado y su MIME type; el manifiesto registra cada archivo con el motivo de inclusión o exclusión.
+    """
+    manifiesto = await run_io(clasificar_archivos, [(anexo.filename, anexo.file) for anexo in anexos])
+    incluidos = [
+        UploadFile(file=anexo.file, filename=entrada["NombreSubida"], headers=Headers({"content-type": entrada["MimeType"]}))
+        for anexo, entrada in zip(anexos, manifiesto)
+        if entrada["Incluido"]
+    ]
+    excluidos = len(anexos) - len(incluidos)
+    if excluidos:
+        motivos = Counter(entrada["Motivo"] for entrada in manifiesto if not entrada["Incluido"])
+        print(f"[Vigia] {excluidos}/{len(anexos)} anexos excluidos: {dict(motivos)}")
+    return incluidos, manifiesto
+
+async def convertir_anexos_a_texto(anexos: list, entradas: list, max_concurrency: int = 4) -> list:
+    """
+    Reemplaza los PDF/DOCX/PPTX/XLSX por un .txt con su texto extraído localmente (services/texto_local.py,
+    en el pool de procesos) cuando la extracción da suficiente texto; si no, se conserva el original.
+    entradas son las entradas del manifiesto de cada anexo y se actualizan con el resultado.
+    Umbrales: LOCAL_TEXT_MIN_CHARS y LOCAL_TEXT_MIN_CHARS_PER_PAGE (solo PDF).
+    """
+    min_caracteres = int(os.getenv("LOCAL_TEXT_MIN_CHARS", "200"))
+    min_por_pagina = int(os.getenv("LOCAL_TEXT_MIN_CHARS_PER_PAGE", "100"))
+    semaforo = asyncio.Semaphore(max_concurrency)
+
+    async def convertir(anexo, entrada):
+        if entrada["Tipo"] not in TIPOS_CON_TEXTO:
+            return anexo
+        async with semaforo:
+            contenido = await run_io(leer_contenido, anexo.file)
+            texto = await run_cpu(extraer_texto_local, contenido, entrada["Tipo"], min_caracteres, min_por_pagina)
+        anexo.file.seek(0)
+        entrada["TextoLocal"] = texto is not None
+        if texto is None:
+            return anexo
+        datos = texto.encode("utf-8")
+        entrada.update({"NombreSubida": f"{entrada['NombreSubida']}.txt", "MimeType": "text/plain", "BytesSubida": len(datos)})
+        return UploadFile(file=BytesIO(datos), filename=entrada["NombreSubida"], headers=Headers({"content-type": "text/plain"}))
+
+    convertidos = await asyncio.gather(*(convertir(anexo, entrada) for anexo, entrada in zip(anexos, entradas)))
+    reemplazados = [e for e in entradas if e.get("TextoLocal")]
+    if reemplazados:
+        antes = sum(e["Bytes"] for e in reemplazados)
+        despues = sum(e["BytesSubida"] for e in reemplazados)
+        print(f"[Vigia] Texto extraído localmente de {len(reemplazados)} anexos: {antes / 1_048_576:.2f} MB -> {despues / 1_048_576:.2f} MB")
+    return list(convertidos)
+
+async def subir_anexos_concurrente(
+    assistant: AssistantBackend,
+    anexos: list,
+    max_concurrency: int = 8,
+    file_cache: Optional[FileCache] = None,
+    cache_prefijo: str = "",
+    referencias: Optional[list] = None,
+    solicitud_id: Optional[str] = None
+) -> list:
+    """
+    Sube los anexos en paralelo con un máximo de max_concurrency subidas simultáneas.
+    Si se indica file_cache, cada anexo se identifica por su SHA-256 y se reutiliza el file_id
+    ya subido cuando el contenido está en cache y el archivo sigue existiendo en OpenAI;
+    contenidos repetidos dentro de la misma solicitud se suben una sola vez. cache_prefijo separa en la
+    cache los file_id de cada proveedor de assistant (un file_id de OpenAI no existe en Azure).
+    En referencias se agrega cada file_id con referencia tomada en la cache, a medida que se toma,
+    para soltarlas aunque la etapa se interrumpa; si se indica solicitud_id, además se registra en
+    ReferenciasCache de la solicitud, para que el siguiente intento las suelte si el worker cae.
+    Retorna una lista en el mismo orden de entrada con {"filename", "id", "error", "hash", "reused"}
+    por archivo y reporta el throughput (archivos/s y MB/s) de la etapa.
+    """
+    semaforo = asyncio.Semaphore(max_concurrency)
+    total_bytes = 0
+    en_curso = {}
+
+    async def tomar_referencia(file_id):
+        if referencias is not None:
+            referencias.append(file_id)
+        if solicitud_id:
+            await db.Solicitud.update_one({"SolicitudID": solicitud_id}, {"$push": {"ReferenciasCache": file_id}})
+
+    async def soltar_referencia(file_id):
+        if referencias is not None and file_id in referencias:
+            referencias.remove(file_id)
+        if solicitud_id:
+            await db.Solicitud.update_one({"SolicitudID": solicitud_id}, {"$pull": {"ReferenciasCache": file_id}})
+
+    async def subir_contenido(anexo, content_hash):
+        nonlocal total_bytes
+        async with semaforo:
+            if file_cache and content_hash:
+                file_id = await file_cache.acquire(content_hash)
+                if file_id:
+                    await tomar_referencia(file_id)
+                    if await assistant.file_exists(file_id):
+                        print(f"[Vigia] Anexo reutilizado desde cache: {anexo.filename} ({file_id})")
+                        return file_id, True
+                    await file_cache.invalidate(content_hash, file_id)
+                    await soltar_referencia(file_id)
+            anexo.file.seek(0, os.SEEK_END)
+            size = anexo.file.tell()
+            anexo.file.seek(0)
+            anexo_upload = await assistant.upload_file_from_formdata_v2(
+                anexo, anexo.filename, mime_type=anexo.content_type
+            )
+            if not anexo_upload:
+                raise RuntimeError("No se pudo subir el archivo")
+            total_bytes += size
+            file_id = anexo_upload["id"]
+            if file_cache and content_hash:
+                file_id = await file_cache.put(content_hash, file_id, anexo.filename)
+                await tomar_referencia(file_id)
+            return file_id, False
+
+    async def subir(anexo):
+        content_hash = None
+        try:
+            if file_cache:
+                content_hash = cache_prefijo + await run_io(hash_fileobj, anexo.file)
+                if content_hash not in en_curso:
+                    en_curso[content_hash] = asyncio.ensure_future(subir_contenido(anexo, content_hash))
+                file_id, reutilizado = await en_curso[content_hash]
+            else:
+                file_id, reutilizado = await subir_contenido(anexo, None)
+            return {"filename": anexo.filename, "id": file_id, "error": None, "hash": content_hash, "reused": reutilizado}
+        except Exception as e:
+            return {"filename": anexo.filename, "id": None, "error": str(e), "hash": content_hash, "reused": False}
+
+    inicio = asyncio.get_running_loop().time()
+    resultados = await asyncio.gather(*(subir(anexo) for anexo in anexos))
+    duracion = max(asyncio.get_running_loop().time() - inicio, 1e-6)
+    exitosos = sum(1 for r in resultados if r["id"])
+    reutilizados = sum(1 for r in resultados if r["reused"])
+    print(f"[Vigia] Subidos {exitosos}/{len(resultados)} anexos ({reutilizados} desde cache) en {duracion:.1f}s "
+          f"({exitosos / duracion:.2f} archivos/s, {total_bytes / duracion / 1_048_576:.2f} MB/s)")
+    for r in resultados:
+        if r["error"]:
+            print(f"[Vigia][ERROR] Anexo no subido {r['filename']}: {r['error']}")
+    return resultados
+
+async def publicar_etapa(solicitud_id: str, etapa: str, **datos):
+    """
+    Registra la etapa del pipeline en Mongo y la publica a los suscriptores SSE / long-poll.
+    """
+    await db.Solicitud.update_one({"SolicitudID": solicitud_id}, {"$set": {"Etapa": etapa}})
+    progress_bus.publish(solicitud_id, etapa, **datos)
+
 async def procesar_solicitud_con_assistant(
     solicitud: SolicitudModel,
     anexos_ids: list,
-    assistant: OpenAIAssistant,
+    assistant: AssistantBackend,
     tipo_asistente: TipoAsistenteEnum
 ):
     cuestionario=solicitud.Cuestionario
@@ -361,12 +449,12 @@ async def procesar_solicitud_con_assistant(
         f"Anexos: {anexos_str}.\n"
         f"Datos del formulario diligenciados por proveedor: {cuestionario if cuestionario else 'No hay datos de formulario.'}\n"  
     )
-    # print(f"[Vigia] Mensaje Assistant: {mensaje}")
     solicitud.Mensaje = mensaje
     await db.Solicitud.update_one({"SolicitudID": solicitud.SolicitudID}, {"$set": solicitud.dict()})
     doc = await db.Solicitud.find_one({"SolicitudID": solicitud.SolicitudID})
     solicitud = SolicitudModel(**doc) 
     
+    await publicar_etapa(solicitud.SolicitudID, "running")
     max_retries = 3
     retries = 0
     required_actions = []
@@ -378,7 +466,8 @@ async def procesar_solicitud_con_assistant(
         required_action = await assistant.run_assistant_flow(
             current_message,
             file_ids=current_file_ids,
-            tipo_asistente=tipo_asistente
+            tipo_asistente=tipo_asistente,
+            vector_store_id=solicitud.VectorStoreID
         )
         if required_action:
             required_actions.append(required_action)
@@ -393,19 +482,189 @@ async def procesar_solicitud_con_assistant(
             (ra["assistant_response"] for ra in required_actions if isinstance(ra, dict) and ra.get("assistant_response")), ""
         )
     solicitud.EstadoGeneral = "done" if required_actions else "failed"
+    solicitud.Etapa = solicitud.EstadoGeneral
     await db.Solicitud.update_one({"SolicitudID": solicitud.SolicitudID}, {"$set": solicitud.dict()})
-    doc = await db.Solicitud.find_one({"SolicitudID": solicitud.SolicitudID})
-    solicitud = SolicitudModel(**doc) 
-    #await assistant.depureFilesV2(current_file_ids)
-    OPENAI_VECTOR_STORAGE_ID = os.getenv("OPENAI_VECTOR_STORAGE_ID")
-    await assistant.delete_all_files_from_vector_store(vector_store_id=OPENAI_VECTOR_STORAGE_ID)
-    await assistant.depureFiles()
+    progress_bus.publish(solicitud.SolicitudID, solicitud.Etapa, EstadoGeneral=solicitud.EstadoGeneral)
     print(f"[Vigia] Solicitud {solicitud.SolicitudID} actualizada tras evaluación")
 
+async def guardar_archivo_gridfs(upload: UploadFile, solicitud_id: str) -> dict:
+    """
+    Persiste un archivo recibido en GridFS para que el worker que tome el job pueda leerlo.
+    """
+    upload.file.seek(0)
+    gridfs_id = await fs_bucket.upload_from_stream(
+        upload.filename, upload.file, metadata={"SolicitudID": solicitud_id}
+    )
+    return {"GridFSID": gridfs_id, "Filename": upload.filename}
+
+async def cargar_archivo_gridfs(ref: dict) -> UploadFile:
+    """
+    Descarga un archivo de GridFS a un SpooledTemporaryFile (pasa a disco si es grande).
+    """
+    destino = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    await fs_bucket.download_to_stream(ref["GridFSID"], destino)
+    destino.seek(0)
+    return UploadFile(file=destino, filename=ref["Filename"])
+
+async def eliminar_archivos_gridfs(payload: dict):
+    for ref in [payload["Excel"]] + payload.get("Anexos", []):
+        try:
+            await fs_bucket.delete(ref["GridFSID"])
+        except Exception as e:
+            print(f"[Vigia][ERROR] No se pudo eliminar de GridFS {ref['Filename']}: {str(e)}")
+
+async def limpiar_intento(solicitud_id: str, assistant: AssistantBackend, vector_store_id: Optional[str], file_ids: list):
+    """
+    Limpia lo que tomó un intento del job, termine bien, falle o se cancele: su vector store, las
+    referencias en la cache de anexos y los archivos que ya no están vivos; además barre huérfanos antiguos.
+    """
+    try:
+        if vector_store_id:
+            await assistant.delete_vector_store(vector_store_id)
+        await file_cache.release(set(file_ids))
+        await db.Solicitud.update_one({"SolicitudID": solicitud_id}, {"$unset": {"ReferenciasCache": ""}})
+        archivos_vivos = await file_cache.live_file_ids()
+        await assistant.depureFilesV2([fid for fid in set(file_ids) if fid not in archivos_vivos])
+        # Barrido de huérfanos (cache expirada, subidas duplicadas); respeta archivos recientes de otras solicitudes
+        ORPHAN_FILES_MIN_AGE_SECONDS = float(os.getenv("ORPHAN_FILES_MIN_AGE_SECONDS", "3600"))
+        await assistant.depureFiles(keep_file_ids=archivos_vivos, min_age_seconds=ORPHAN_FILES_MIN_AGE_SECONDS)
+    except Exception as e:
+        print(f"[Vigia][ERROR] Limpieza del intento de la solicitud {solicitud_id}: {str(e)}")
+
+async def procesar_job_solicitud(job: dict):
+    """
+    Ejecuta en un worker el procesamiento completo de una solicitud encolada:
+    cuestionario, descompresión, subida de anexos, indexación y evaluación con el assistant.
+    Cada intento limpia al terminar (también si falla o se cancela) su vector store y las referencias
+    que tomó en la cache de anexos. Si el intento anterior no alcanzó a limpiar (caída del worker),
+    se limpia lo que dejó registrado: vector store y ReferenciasCache.
+    """
+    payload = job["Payload"]
+    doc = await db.Solicitud.find_one({"SolicitudID": payload["SolicitudID"]})
+    if not doc:
+        print(f"[Vigia][WARN] Solicitud {payload['SolicitudID']} no existe, se descarta el job {job['JobID']}")
+        return
+    solicitud = SolicitudModel(**doc)
+
+    # Lo que dejó un intento anterior interrumpido se limpia con el proveedor que lo creó
+    if solicitud.VectorStoreID or doc.get("ReferenciasCache"):
+        anterior = crear_assistant(solicitud.ProveedorIA or "openai", http_client=get_http_client())
+        await limpiar_intento(solicitud.SolicitudID, anterior, solicitud.VectorStoreID, doc.get("ReferenciasCache") or [])
+    # Proveedor (ASSISTANT_PROVIDER / ASSISTANT_PROVIDERS) elegido para toda la solicitud, con failover si está degradado
+    proveedor = elegir_proveedor()
+    assistant = crear_assistant(proveedor, http_client=get_http_client())
+    solicitud.ProveedorIA = proveedor
+
+    vector_store_id = None
+    referencias: List[str] = []
+    try:
+        # Vector store propio de la solicitud, para que solicitudes concurrentes no compartan ni borren documentos
+        VECTOR_STORE_EXPIRES_DAYS = int(os.getenv("VECTOR_STORE_EXPIRES_DAYS", "2"))
+        vector_store_id = await assistant.create_vector_store(
+            name=f"solicitud-{solicitud.SolicitudID}", expires_after_days=VECTOR_STORE_EXPIRES_DAYS
+        )
+        if not vector_store_id:
+            raise RuntimeError("No se pudo crear el vector store de la solicitud")
+        solicitud.VectorStoreID = vector_store_id
+        solicitud.EstadoGeneral = "En progreso"
+        await db.Solicitud.update_one(
+            {"SolicitudID": solicitud.SolicitudID},
+            {"$set": {"VectorStoreID": vector_store_id, "ProveedorIA": proveedor, "EstadoGeneral": solicitud.EstadoGeneral}}
+        )
+
+        excel_file = await cargar_archivo_gridfs(payload["Excel"])
+        anexos = [await cargar_archivo_gridfs(ref) for ref in payload.get("Anexos", [])]
+        # Extraer cuestionario del Excel
+        excel_bytes = await run_io(leer_contenido, excel_file.file)
+        cuestionario_csv = await run_cpu(extraer_excel_para_assistant_bytes, excel_bytes)
+        await publicar_etapa(solicitud.SolicitudID, "decompressing")
+        omitidos_descompresion = []
+        anexos_descomprimidos = await descomprimir_anexos_recursivo(anexos, omitidos_descompresion)
+        # Clasificar por contenido: solo se suben los formatos que file_search puede indexar
+        anexos_descomprimidos, manifiesto = await filtrar_anexos_indexables(anexos_descomprimidos)
+        manifiesto += [
+            {"Filename": nombre, "NombreSubida": None, "Tipo": None, "MimeType": None, "Bytes": None,
+             "Incluido": False, "Motivo": motivo}
+            for nombre, motivo in omitidos_descompresion
+        ]
+        if os.getenv("LOCAL_TEXT_EXTRACTION", "false").lower() in ("1", "true", "yes"):
+            # Subir el texto extraído localmente en lugar del documento completo
+            anexos_descomprimidos = await convertir_anexos_a_texto(
+                anexos_descomprimidos,
+                [entrada for entrada in manifiesto if entrada["Incluido"]],
+                max_concurrency=int(os.getenv("LOCAL_TEXT_CONCURRENCY", "4"))
+            )
+        if os.getenv("CUESTIONARIO_PDF", "false").lower() in ("1", "true", "yes"):
+            # Versión PDF de cada hoja del cuestionario para file_search, renderizada en paralelo en el worker
+            for nombre_pdf, pdf in await renderizar_excel_a_pdfs(excel_file):
+                nombre_pdf = f"cuestionario_{nombre_pdf}"
+                anexos_descomprimidos.append(
+                    UploadFile(file=BytesIO(pdf), filename=nombre_pdf, headers=Headers({"content-type": "application/pdf"}))
+                )
+                manifiesto.append({"Filename": nombre_pdf, "NombreSubida": nombre_pdf, "Tipo": "pdf",
+                                   "MimeType": "application/pdf", "Bytes": len(pdf), "Incluido": True,
+                                   "Motivo": "cuestionario"})
+        solicitud.Manifiesto = manifiesto
+        # Subir anexos y obtener sus IDs y nombres
+        anexos_ids = []
+        await publicar_etapa(solicitud.SolicitudID, "uploading", Archivos=len(anexos_descomprimidos))
+        if anexos_descomprimidos:
+            ANEXOS_UPLOAD_CONCURRENCY = int(os.getenv("ANEXOS_UPLOAD_CONCURRENCY", "8"))
+            resultados_subida = await subir_anexos_concurrente(
+                assistant, anexos_descomprimidos, ANEXOS_UPLOAD_CONCURRENCY, file_cache=file_cache,
+                cache_prefijo="" if proveedor == "openai" else f"{proveedor}:", referencias=referencias,
+                solicitud_id=solicitud.SolicitudID
+            )
+            anexos_ids = [{"id": r["id"], "filename": r["filename"]} for r in resultados_subida if r["id"]]
+        file_id_list = list(dict.fromkeys(anexo["id"] for anexo in anexos_ids if "id" in anexo and anexo["id"]))
+        # Adjuntar todos los archivos en file batches y esperar solo lo necesario a que se indexen
+        await publicar_etapa(solicitud.SolicitudID, "indexing", Archivos=len(file_id_list))
+        VECTOR_STORE_READY_TIMEOUT = float(os.getenv("VECTOR_STORE_READY_TIMEOUT", "300"))
+        estado_indexacion = await assistant.add_files_to_vector_store_batch(
+            vector_store_id=vector_store_id,
+            file_ids=file_id_list,
+            timeout=VECTOR_STORE_READY_TIMEOUT
+        )
+        if estado_indexacion["failed"] or estado_indexacion["pending"]:
+            print(f"[Vigia][WARN] Indexación incompleta: fallidos={estado_indexacion['failed']} pendientes={estado_indexacion['pending']}")
+
+        solicitud.Anexos = anexos_ids
+        solicitud.Cuestionario = cuestionario_csv
+        await db.Solicitud.update_one({"SolicitudID": solicitud.SolicitudID}, {"$set": solicitud.dict()})
+        await procesar_solicitud_con_assistant(solicitud, anexos_ids, assistant, TipoAsistenteEnum.ambiental)
+        await eliminar_archivos_gridfs(payload)
+    finally:
+        await limpiar_intento(solicitud.SolicitudID, assistant, vector_store_id, referencias)
+
+async def marcar_solicitud_fallida(job: dict, error: str):
+    """
+    Se invoca cuando el job agotó sus reintentos.
+    """
+    payload = job["Payload"]
+    await db.Solicitud.update_one(
+        {"SolicitudID": payload["SolicitudID"]},
+        {"$set": {"EstadoGeneral": "failed", "Etapa": "failed", "FechaFinalizacion": datetime.utcnow()}}
+    )
+    progress_bus.publish(payload["SolicitudID"], "failed", EstadoGeneral="failed", Error=error)
+    await eliminar_archivos_gridfs(payload)
+    print(f"[Vigia][ERROR] Solicitud {payload['SolicitudID']} marcada como fallida: {error}")
+
+def crear_worker_pool(size: int) -> WorkerPool:
+    """
+    Pool de workers que procesa las solicitudes encoladas (en el proceso de la API o en worker.py).
+    """
+    return WorkerPool(
+        job_queue,
+        procesar_job_solicitud,
+        on_failed=marcar_solicitud_fallida,
+        size=size,
+        poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "2"))
+    )
+
 # --- Router FastAPI ---
 router = APIRouter(prefix="/vigia", tags=["Vigia"])
 
-@router.post("/solicitud", response_model=SolicitudModel)
+@router.post("/solicitud", response_model=SolicitudModel, status_code=202)
 async def create_solicitud(
     CodigoProyecto: str = Form(...),
     ProveedorNombre: str = Form(...),
@@ -415,78 +674,98 @@ async def create_solicitud(
     excel_file: UploadFile = File(...),
     anexos: List[UploadFile] = File(None)
 ):
-    # Configuración del assistant
-    # AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-    # AZURE_OPENAI_ASSISTANT_ID = os.getenv("AZURE_OPENAI_ASSISTANT_ID")
-    # AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-    # AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
-    # assistant = AzureOpenAIAssistant(api_key=AZURE_OPENAI_API_KEY
-    #                                  , endpoint=AZURE_OPENAI_ENDPOINT
-    #                                  , assistant_id=AZURE_OPENAI_ASSISTANT_ID
-    #                                  , api_version=AZURE_OPENAI_API_VERSION)
-
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    OPENAI_ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
-    OPENAI_VECTOR_STORAGE_ID = os.getenv("OPENAI_VECTOR_STORAGE_ID")
-    assistant = OpenAIAssistant(api_key=OPENAI_API_KEY
-                                     , assistant_id= OPENAI_ASSISTANT_ID)
-    await assistant.depureFiles()
-    #return
-    # Extraer cuestionario del Excel
-    # cuestionario_csv = extraer_hojas_excel_json(excel_file)
-    # cuestionario_csv = extraer_hojas_excel_plano(excel_file)
-    # rutas_pdfs = extraer_hojas_excel_a_pdfs(excel_file, output_dir="C:/ruta/deseada")
-    cuestionario_csv = extraer_excel_para_assistant(excel_file)
-    anexos_descomprimidos = await descomprimir_anexos_recursivo(anexos)
-    # Excluir archivos de imagen
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
-    anexos_descomprimidos = [
-        anexo for anexo in anexos_descomprimidos
-        if not anexo.filename.lower().endswith(image_extensions)
-    ]
-    # Subir anexos y obtener sus IDs y nombres
-    anexos_ids = []
-    # anexo_upload = await assistant.upload_file_from_formdata_v2(excel_file, excel_file.filename)
-    # if anexo_upload:
-    #    anexos_ids.append({"id": anexo_upload["id"], "filename": excel_file.filename})
-
-    if anexos_descomprimidos:
-        for anexo in anexos_descomprimidos:
-            anexo_upload = await assistant.upload_file_from_formdata_v2(anexo, anexo.filename)
-            if anexo_upload:
-                anexos_ids.append({"id": anexo_upload["id"], "filename": anexo.filename})
-    file_id_list = [anexo["id"] for anexo in anexos_ids if "id" in anexo and anexo["id"]]
-    await assistant.add_files_to_vector_store(vector_store_id=OPENAI_VECTOR_STORAGE_ID, file_ids=file_id_list)
-    print("[Vigia] Esperando 2 minutos para que el vector store procese los archivos...")
-    await asyncio.sleep(120)  # Delay de 2 minutos
+    """
+    Persiste la solicitud y sus archivos y la encola; el procesamiento lo hace un worker
+    (ver procesar_job_solicitud). Responde 202 de inmediato con EstadoGeneral "En cola".
+    """
     solicitud = SolicitudModel(
         CodigoProyecto=CodigoProyecto,
         ProveedorNombre=ProveedorNombre,
         ProveedorNIT=ProveedorNIT,
         FechaCreacion=datetime.utcnow(),
-        EstadoGeneral="En progreso",
+        EstadoGeneral="En cola",
         UsuarioSolicitante=UsuarioSolicitante,
         FuenteExcelPath=excel_file.filename,
-        Anexos=anexos_ids,
-        #Cuestionario=json.dumps(cuestionario_csv, ensure_ascii=False),
-        Cuestionario=cuestionario_csv
+        Etapa="queued"
     )
-
+    payload = {
+        "SolicitudID": solicitud.SolicitudID,
+        "Excel": await guardar_archivo_gridfs(excel_file, solicitud.SolicitudID),
+        "Anexos": [await guardar_archivo_gridfs(anexo, solicitud.SolicitudID) for anexo in anexos or []]
+    }
     await db.Solicitud.insert_one(solicitud.dict())
+    await job_queue.enqueue("solicitud", payload, job_id=solicitud.SolicitudID)
     print(f"[Vigia] Solicitud creada con ID: {solicitud.SolicitudID}")
-
-    # Procesar los asistentes de forma asíncrona
-    asyncio.create_task(procesar_solicitud_con_assistant(solicitud, anexos_ids, assistant, TipoAsistenteEnum.ambiental))
-
     return solicitud
 
 @router.get("/solicitud/{solicitud_id}", response_model=SolicitudModel)
-async def get_solicitud(solicitud_id: str):
+async def get_solicitud(
+    solicitud_id: str,
+    wait: Optional[float] = Query(None, ge=0, le=60, description="Long-poll: segundos a esperar un cambio de etapa")
+):
+    if wait:
+        # Long-poll: responde al siguiente cambio de etapa (o al vencer wait) en lugar de obligar a consultar en bucle
+        with progress_bus.subscribe(solicitud_id) as queue:
+            doc = progress_bus.last(solicitud_id) or await db.Solicitud.find_one(
+                {"SolicitudID": solicitud_id}, {"Etapa": 1, "EstadoGeneral": 1}
+            )
+            if doc and doc.get("Etapa") not in ETAPAS_FINALES and doc.get("EstadoGeneral") not in ETAPAS_FINALES:
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
     doc = await db.Solicitud.find_one({"SolicitudID": solicitud_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Solicitud not found")
     return SolicitudModel(**doc)
 
+@router.get("/solicitud/{solicitud_id}/events")
+async def solicitud_events(solicitud_id: str, request: Request):
+    """
+    Stream SSE con las transiciones de etapa de la solicitud (queued, decompressing, uploading,
+    indexing, running, done, failed). Se cierra al llegar a done o failed.
+    """
+    SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+    proyeccion = {"_id": 0, "SolicitudID": 1, "Etapa": 1, "EstadoGeneral": 1}
+    doc = await db.Solicitud.find_one({"SolicitudID": solicitud_id}, proyeccion)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Solicitud not found")
+
+    async def eventos():
+        with progress_bus.subscribe(solicitud_id) as queue:
+            # Etapa actual: la última publicada en este proceso o, si el pipeline corre en otro, la de Mongo
+            actual = progress_bus.last(solicitud_id) or await db.Solicitud.find_one(
+                {"SolicitudID": solicitud_id}, proyeccion
+            ) or doc
+            yield format_sse(actual)
+            etapa = actual.get("Etapa")
+            while etapa not in ETAPAS_FINALES and actual.get("EstadoGeneral") not in ETAPAS_FINALES:
+                if await request.is_disconnected():
+                    return
+                try:
+                    actual = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Keep-alive; además cubre workers en otro proceso (worker.py), que no publican en este bus
+                    yield ": keepalive\n\n"
+                    actual = await db.Solicitud.find_one({"SolicitudID": solicitud_id}, proyeccion) or actual
+                    if actual.get("Etapa") == etapa:
+                        continue
+                etapa = actual.get("Etapa")
+                yield format_sse(actual)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/runs/activos")
+async def runs_activos():
+    """
+    Runs del assistant en seguimiento en este proceso (estado, consultas y próxima consulta).
+    """
+    return run_tracker.snapshot()
+
 @router.get("/solicitudes", response_model=List[SolicitudModel])
 async def list_solicitudes():
     solicitudes = []
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from typing import BinaryIO, List, Tuple
+
+import rarfile
+
+from services.executors import run_io
+
+EXTENSIONES_COMPRIMIDOS = ('.zip', '.rar')
+# Piso del tamaño comprimido para la tasa máxima: un miembro de pocos bytes (o vacío) puede
+# expandirse hasta max_ratio * 4 KB sin que la tasa se dispare por redondeo
+RATIO_MIN_BYTES_COMPRIMIDOS = 4 * 1024
+
+
+class ArchivoRechazadoError(Exception):
+    """
+    Un miembro de un comprimido no se extrae (supera un límite); la extracción sigue con los demás.
+    """
+
+
+class LimiteDescompresionError(ArchivoRechazadoError):
+    """
+    Se alcanzó un límite global de la extracción (bytes totales o cantidad de archivos); no se extrae nada más.
+    """
+
+
+class LimitesDescompresion:
+    """
+    Límites contra comprimidos maliciosos o desproporcionados (zip bombs), configurables por entorno:
+    ARCHIVE_MAX_TOTAL_BYTES, ARCHIVE_MAX_MEMBERS, ARCHIVE_MAX_RATIO y ARCHIVE_MAX_DEPTH.
+    """
+
+    def __init__(self, max_total_bytes: int = 2 * 1024 ** 3, max_miembros: int = 5000, max_ratio: float = 200,
+                 max_profundidad: int = 3, chunk_size: int = 1024 * 1024):
+        self.max_total_bytes = max_total_bytes
+        self.max_miembros = max_miembros
+        self.max_ratio = max_ratio
+        self.max_profundidad = max_profundidad
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def desde_entorno(cls) -> "LimitesDescompresion":
+        return cls(
+            max_total_bytes=int(os.getenv("ARCHIVE_MAX_TOTAL_BYTES", str(2 * 1024 ** 3))),
+            max_miembros=int(os.getenv("ARCHIVE_MAX_MEMBERS", "5000")),
+            max_ratio=float(os.getenv("ARCHIVE_MAX_RATIO", "200")),
+            max_profundidad=int(os.getenv("ARCHIVE_MAX_DEPTH", "3"))
+        )
+
+
+class ExtractorArchivos:
+    """
+    Extrae comprimidos zip/rar (también anidados) en streaming: cada miembro se copia por bloques a un
+    SpooledTemporaryFile (en memoria hasta spool_max_bytes, luego a disco) y los comprimidos se abren
+    directamente desde su archivo, sin copiarlos completos a memoria.
+    Una instancia acumula los bytes y archivos extraídos de toda una solicitud para aplicar los límites,
+    y con max_memoria_bytes acota lo que queda en memoria entre todos los archivos extraídos
+    (al superarlo, los siguientes van directo a disco).
+    """
+
+    def __init__(self, limites: LimitesDescompresion, spool_max_bytes: int = 8 * 1024 * 1024,
+                 max_memoria_bytes: int = 256 * 1024 * 1024):
+        self.limites = limites
+        self.spool_max_bytes = spool_max_bytes
+        self.max_memoria_bytes = max_memoria_bytes
+        self.total_bytes = 0
+        self.memoria_bytes = 0
+        self.miembros = 0
+        self.detenido = False
+        self.omitidos: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def extraer(self, fileobj: BinaryIO, filename: str) -> List[Tuple[str, BinaryIO]]:
+        """
+        Versión secuencial: retorna [(nombre, archivo)] con los archivos finales del anexo en orden;
+        si no es un comprimido, retorna el propio archivo.
+        """
+        if not es_comprimido(filename):
+            fileobj.seek(0)
+            return [(filename, fileobj)]
+        return self._extraer_recursivo(fileobj, filename, 1)
+
+    def _extraer_recursivo(self, fileobj: BinaryIO, filename: str, profundidad: int) -> List[Tuple[str, BinaryIO]]:
+        archivos = []
+        for nombre, archivo in self.extraer_nivel(fileobj, filename, profundidad):
+            if es_comprimido(nombre):
+                with archivo:
+                    archivos.extend(self._extraer_recursivo(archivo, nombre, profundidad + 1))
+            else:
+                archivos.append((nombre, archivo))
+        return archivos
+
+    async def extraer_anexos(self, anexos: List[Tuple[str, BinaryIO]], max_concurrency: int = 4) -> List[Tuple[str, BinaryIO]]:
+        """
+        Extrae todos los anexos de una solicitud en paralelo: cada comprimido (de primer nivel o anidado)
+        se abre en el pool de I/O en cuanto se descubre, con max_concurrency extracciones simultáneas
+        como máximo. El resultado conserva el orden de la extracción secuencial.
+        """
+        semaforo = asyncio.Semaphore(max_concurrency)
+
+        async def procesar(nombre: str, archivo: BinaryIO, profundidad: int) -> List[Tuple[str, BinaryIO]]:
+            if not es_comprimido(nombre):
+                return [(nombre, archivo)]
+            async with semaforo:
+                miembros = await run_io(self.extraer_nivel, archivo, nombre, profundidad)
+            if profundidad > 1:
+                archivo.close()
+            partes = await asyncio.gather(*(procesar(n, a, profundidad + 1) for n, a in miembros))
+            return [item for parte in partes for item in parte]
+
+        for _, archivo in anexos:
+            archivo.seek(0)
+        partes = await asyncio.gather(*(procesar(nombre, archivo, 1) for nombre, archivo in anexos))
+        return [item for parte in partes for item in parte]
+
+    def extraer_nivel(self, fileobj: BinaryIO, filename: str, profundidad: int) -> List[Tuple[str, BinaryIO]]:
+        """
+        Extrae un solo nivel de un comprimido: retorna sus miembros en orden, incluidos los comprimidos
+        internos sin abrir (para que quien llama decida cómo recorrerlos). Es bloqueante.
+        Los límites que se superan se registran en omitidos y no propagan error.
+        """
+        miembros: List[Tuple[str, BinaryIO]] = []
+        try:
+            if self.detenido:
+                raise LimiteDescompresionError("límite de descompresión alcanzado en otro archivo de la solicitud")
+            if profundidad > self.limites.max_profundidad:
+                self._omitir(filename, f"supera la profundidad máxima de anidamiento ({self.limites.max_profundidad})")
+                return miembros
+            fileobj.seek(0)
+            if filename.lower().endswith('.zip'):
+                with zipfile.ZipFile(fileobj) as zf:
+                    self._extraer_miembros(zf, zf.infolist(), miembros)
+            else:
+                # unrar necesita una ruta: el comprimido se vuelca a disco por bloques una sola vez
+                tmp = tempfile.NamedTemporaryFile(suffix=".rar", delete=False)
+                try:
+                    with tmp:
+                        shutil.copyfileobj(fileobj, tmp, self.limites.chunk_size)
+                    with rarfile.RarFile(tmp.name) as rf:
+                        self._extraer_miembros(rf, rf.infolist(), miembros)
+                finally:
+                    os.unlink(tmp.name)
+        except LimiteDescompresionError as e:
+            self._omitir(filename, str(e))
+            self.detenido = True
+        return miembros
+
+    def _extraer_miembros(self, comprimido, infos: list, miembros: list):
+        for info in infos:
+            if info.is_dir():
+                continue
+            inner_name = info.filename
+            with self._lock:
+                self.miembros += 1
+                if self.miembros > self.limites.max_miembros:
+                    raise LimiteDescompresionError(f"supera el máximo de {self.limites.max_miembros} archivos")
+            try:
+                contenido = self._copiar_miembro(comprimido, info)
+            except LimiteDescompresionError:
+                raise
+            except ArchivoRechazadoError as e:
+                self._omitir(inner_name, str(e))
+                continue
+            # Los comprimidos internos conservan su ruta (para detectar la extensión), los finales solo el nombre
+            miembros.append((inner_name if es_comprimido(inner_name) else os.path.basename(inner_name), contenido))
+
+    def _copiar_miembro(self, comprimido, info) -> BinaryIO:
+        with self._lock:
+            disponible = self.limites.max_total_bytes - self.total_bytes
+            en_memoria = self.memoria_bytes < self.max_memoria_bytes
+        if info.file_size > disponible:
+            raise LimiteDescompresionError(f"supera el máximo de {self.limites.max_total_bytes} bytes descomprimidos")
+        # El tamaño declarado en la cabecera puede ser falso: los límites se verifican sobre los bytes reales
+        max_ratio_bytes = self.limites.max_ratio * max(info.compress_size, RATIO_MIN_BYTES_COMPRIMIDOS)
+        destino = tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes if en_memoria else 1)
+        escritos = 0
+        try:
+            with comprimido.open(info) as origen:
+                for bloque in iter(lambda: origen.read(self.limites.chunk_size), b""):
+                    if escritos + len(bloque) > max_ratio_bytes:
+                        raise ArchivoRechazadoError(f"tasa de compresión mayor a {self.limites.max_ratio}:1")
+                    with self._lock:
+                        if self.total_bytes + len(bloque) > self.limites.max_total_bytes:
+                            raise LimiteDescompresionError(
+                                f"supera el máximo de {self.limites.max_total_bytes} bytes descomprimidos"
+                            )
+                        # Se reservan a medida que se escriben, para que las extracciones en paralelo compartan el límite
+                        self.total_bytes += len(bloque)
+                    escritos += len(bloque)
+                    destino.write(bloque)
+        except BaseException:
+            with self._lock:
+                self.total_bytes -= escritos
+            destino.close()
+            raise
+        if en_memoria and escritos <= self.spool_max_bytes:
+            with self._lock:
+                self.memoria_bytes += escritos
+        destino.seek(0)
+        return destino
+
+    def _omitir(self, nombre: str, motivo: str):
+        self.omitidos.append((nombre, motivo))
+        print(f"[Archivos][WARN] {nombre} omitido: {motivo}")
+
+
+def es_comprimido(filename: str) -> bool:
+    return filename.lower().endswith(EXTENSIONES_COMPRIMIDOS)
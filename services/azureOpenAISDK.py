@@ -1,39 +1,80 @@
-from openai import AzureOpenAI
-import pandas as pd
-import io
+import asyncio
+import os
+import time
+import httpx
+from openai import AsyncAzureOpenAI, NotFoundError
 from typing import Optional, Dict, Any, List
 from models import TipoAsistenteEnum
+from services.excel import convertir_excel_a_texto
+from services.openai_assistant import OpenAIAssistant
+from services.rate_limit import RateLimiter, estimar_tokens, obtener_rate_limiter
+from services.run_tracker import RunTracker, run_tracker as run_tracker_compartido
+
+# Parámetros con los que se crean los runs con el SDK
+SDK_RUN_OPTIONS: Dict[str, Any] = {
+    "temperature": 0.2,
+    "top_p": 1,
+    "max_prompt_tokens": 12000,
+    "max_completion_tokens": 4000,
+    "parallel_tool_calls": False,
+    "truncation_strategy": {"type": "auto"}
+}
 
 class AzureOpenAISDKAssistant:
-    def __init__(self, api_key: str, endpoint: str, assistant_id: str, api_version: str = "2024-05-01-preview"):
+    """
+    Assistant de Azure OpenAI sobre el SDK oficial en su versión asíncrona (AsyncAzureOpenAI):
+    ninguna llamada bloquea el event loop. Los reintentos los hace el SDK (backoff con jitter y
+    Retry-After) hasta RETRY_MAX_ATTEMPTS intentos; el presupuesto de requests y el polling de runs
+    son los compartidos con los demás assistants (services/rate_limit.py y services/run_tracker.py).
+    El flujo del run es el de OpenAIAssistant: archivos por vector store, run en streaming (stream_runs)
+    y polling si el stream no está disponible o se corta.
+    """
+
+    def __init__(self, api_key: str, endpoint: str, assistant_id: str, api_version: str = "2024-05-01-preview",
+                 http_client: Optional[httpx.AsyncClient] = None, rate_limiter: Optional[RateLimiter] = None,
+                 run_tracker: Optional[RunTracker] = None, stream_runs: bool = True):
         self.api_key = api_key
         self.endpoint = endpoint
         self.assistant_id = assistant_id
         self.api_version = api_version
-        self.client = AzureOpenAI(
+        # http_client: el cliente compartido del proceso (pool de conexiones), si se inyecta
+        self.client = AsyncAzureOpenAI(
             api_key=api_key,
             azure_endpoint=endpoint,
-            api_version=api_version
+            api_version=api_version,
+            max_retries=max(int(os.getenv("RETRY_MAX_ATTEMPTS", "3")) - 1, 0),
+            http_client=http_client
         )
+        self.rate_limiter = rate_limiter or obtener_rate_limiter(httpx.URL(endpoint).host)
+        self.tokens_por_hilo: Dict[str, int] = {}
+        self.run_tracker = run_tracker or run_tracker_compartido
+        self.stream_runs = stream_runs
+        self.run_options = dict(SDK_RUN_OPTIONS)
 
-    async def create_thread(self) -> str:
-        thread = self.client.beta.threads.create()
+    async def create_thread(self, vector_store_id: Optional[str] = None) -> str:
+        kwargs = {}
+        if vector_store_id:
+            kwargs["tool_resources"] = {"file_search": {"vector_store_ids": [vector_store_id]}}
+        await self.rate_limiter.adquirir("threads")
+        thread = await self.client.beta.threads.create(**kwargs)
         thread_id = thread.id
         print(f"[AzureOpenAI SDK] Thread creado: {thread_id}")
         return thread_id
 
     async def create_message(self, thread_id: str, content: str) -> str:
-        message = self.client.beta.threads.messages.create(
+        await self.rate_limiter.adquirir("threads")
+        message = await self.client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=content
         )
+        self.tokens_por_hilo[thread_id] = self.tokens_por_hilo.get(thread_id, 0) + estimar_tokens(content)
         print(f"[AzureOpenAI SDK] Mensaje creado en thread {thread_id}: {message.id}")
         return message.id
 
     async def create_message_with_files(self, thread_id: str, content: str, file_ids: Optional[List[str]]) -> Optional[str]:
         if not file_ids:
-            return self.create_message(thread_id, content)
+            return await self.create_message(thread_id, content)
         message_ids = []
         for i in range(0, len(file_ids), 5):
             batch = file_ids[i:i+5]
@@ -47,46 +88,51 @@ class AzureOpenAISDKAssistant:
                 }
                 for fid in batch
             ]
-            message = self.client.beta.threads.messages.create(
+            await self.rate_limiter.adquirir("threads")
+            message = await self.client.beta.threads.messages.create(
                 thread_id=thread_id,
                 role="user",
                 content=[{"type": "text", "text": f"{content} (Archivos {i+1}-{i+len(batch)})"}],
                 attachments=attachments
             )
+            self.tokens_por_hilo[thread_id] = self.tokens_por_hilo.get(thread_id, 0) + estimar_tokens(content)
             print(f"[AzureOpenAI SDK] Mensaje con archivos creado en thread {thread_id}: {message.id}")
             message_ids.append(message.id)
         return message_ids[-1] if message_ids else None
 
+    async def reservar_tokens_run(self, thread_id: str):
+        """
+        Espera presupuesto de tokens por minuto para un run (mensajes del hilo más RATE_LIMIT_RUN_EXTRA_TOKENS).
+        """
+        extra = int(os.getenv("RATE_LIMIT_RUN_EXTRA_TOKENS", "8000"))
+        await self.rate_limiter.adquirir_tokens(self.tokens_por_hilo.get(thread_id, 0) + extra)
+
     async def create_run(self, thread_id: str) -> str:
-        run = self.client.beta.threads.runs.create(
+        await self.reservar_tokens_run(thread_id)
+        await self.rate_limiter.adquirir("runs")
+        run = await self.client.beta.threads.runs.create(
             thread_id=thread_id,
             assistant_id=self.assistant_id,
-            temperature=0.2,
-            top_p=1,
-            max_prompt_tokens=12000,
-            max_completion_tokens=4000,
-            parallel_tool_calls=False,
-            truncation_strategy={"type": "auto"}
+            **self.run_options
         )
         print(f"[AzureOpenAI SDK] Run creado en thread {thread_id}: {run.id}")
         return run.id
 
-    async def get_run_status(self, thread_id: str, run_id: str, max_retries: int = 10, retry_interval: float = 2.0) -> Dict[str, Any]:
-        import asyncio
-        attempt = 0
-        while attempt < max_retries:
-            try:
-                run_status = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread_id,
-                    run_id=run_id
-                )
-                return run_status.dict()
-            except Exception as e:
-                print(f"[AzureOpenAI SDK][ERROR] get_run_status intento {attempt+1}: {str(e)}")
-            attempt += 1
-            await asyncio.sleep(retry_interval)
-        print(f"[AzureOpenAI SDK][ERROR] get_run_status falló tras {max_retries} intentos para run {run_id}")
-        return {}
+    async def get_run_status(self, thread_id: str, run_id: str, max_retries: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Estado del run como dict (mismo formato que el API REST), o {} si falla tras los reintentos del SDK.
+        """
+        client = self.client if max_retries is None else self.client.with_options(max_retries=max_retries)
+        try:
+            await self.rate_limiter.adquirir("polling")
+            run_status = await client.beta.threads.runs.retrieve(
+                thread_id=thread_id,
+                run_id=run_id
+            )
+            return run_status.model_dump()
+        except Exception as e:
+            print(f"[AzureOpenAI SDK][ERROR] get_run_status falló para run {run_id}: {str(e)}")
+            return {}
 
     async def wait_for_required_action(
         self,
@@ -94,111 +140,197 @@ class AzureOpenAISDKAssistant:
         run_id: str,
         tipo_asistente: TipoAsistenteEnum,
         interval: float = 10.0,
-        timeout: float = 10000.0
+        timeout: float = 10000.0,
+        required_action_response: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
-        import asyncio
-        elapsed = 0
-        required_action_detected = False
-        required_action_response = None
-        failed_retries = 0
-        while elapsed < timeout:
-            run_status = self.get_run_status(thread_id, run_id)
+        """
+        Espera a que el run pida la función o termine; el polling lo hace el tracker compartido.
+        failed es un estado final, como en OpenAIAssistant. interval se conserva por compatibilidad.
+        required_action_response es la acción ya atendida en stream_run antes de cortarse el stream.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        required_action_detected = required_action_response is not None
+        while loop.time() < deadline:
+            try:
+                run_status = await self.run_tracker.esperar(
+                    thread_id, run_id, self.get_run_status, timeout=deadline - loop.time()
+                )
+            except asyncio.TimeoutError:
+                break
             status = run_status.get("status")
             print(f"[AzureOpenAI SDK] status ({tipo_asistente.value}) {status}")
             if status == "requires_action" and run_status.get("required_action"):
-                required_action_detected = True
-                required_action = run_status["required_action"]
-                required_action_response = required_action
-                tool_calls = required_action.get("submit_tool_outputs", {}).get("tool_calls", [])
-                tool_outputs = [
-                    {
-                        "tool_call_id": call["id"],
-                        "output": "Ok, función ejecutada correctamente."
-                    }
-                    for call in tool_calls
-                ]
-                self.client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread_id,
-                    run_id=run_id,
-                    tool_outputs=tool_outputs
-                )
-                print(f"[AzureOpenAI SDK] Acción requerida completada en run {run_id} ({tipo_asistente.value})")
+                try:
+                    required_action_detected = True
+                    required_action = run_status["required_action"]
+                    required_action_response = required_action
+                    await self.rate_limiter.adquirir("runs")
+                    await self.client.beta.threads.runs.submit_tool_outputs(
+                        thread_id=thread_id,
+                        run_id=run_id,
+                        tool_outputs=OpenAIAssistant._tool_outputs(required_action)
+                    )
+                    print(f"[AzureOpenAI SDK] Acción requerida completada en run {run_id} ({tipo_asistente.value})")
+                except Exception as e:
+                    print(f"[AzureOpenAI SDK][ERROR] wait_for_required_action al procesar required_action en run {run_id}: {str(e)}")
+                    # Continúa esperando el siguiente estado
             if status == "completed":
                 if not required_action_detected:
                     retry_message = (
                         "Por favor, ejecuta la función configurada en el assistant y entrega el resultado de la revisión."
                     )
-                    self.create_message(thread_id, retry_message)
-                    new_run_id = self.create_run(thread_id)
+                    await self.create_message(thread_id, retry_message)
+                    new_run_id = await self.create_run(thread_id)
                     print(f"[AzureOpenAI SDK] Run adicional creado en thread {thread_id}: {new_run_id} (no hubo required_action inicial)")
-                    return await self.wait_for_required_action(thread_id, new_run_id, tipo_asistente, interval, timeout)
-                assistant_response = self.get_completed_run_response(thread_id, run_id)
+                    return await self.wait_for_required_action(
+                        thread_id, new_run_id, tipo_asistente, interval, max(deadline - loop.time(), 0)
+                    )
+                assistant_response = await self.get_completed_run_response(thread_id, run_id)
                 print(f"[AzureOpenAI SDK] Run completado en thread {thread_id}: {run_id}")
                 return {
                     "required_action": required_action_response,
                     "assistant_response": assistant_response,
                     "last_run_status": run_status
                 }
-            if status == "failed":
-                failed_retries += 1
-                print(f"[AzureOpenAI SDK] Run {run_id} estado (failed), reintento {failed_retries}/4")
-                if failed_retries < 4:
-                    await asyncio.sleep(interval*10)
-                    elapsed += interval
-                    continue
-                else:
-                    return {
-                        "required_action": required_action_response,
-                        "assistant_response": status,
-                        "last_run_status": run_status
-                    }
-            if status in ["cancelling", "cancelled", "incomplete", "expired"]:
+            if status in OpenAIAssistant.RUN_TERMINAL_STATUSES:
                 print(f"[AzureOpenAI SDK] Run {run_id} estado ({status})")
                 return {
                     "required_action": required_action_response,
                     "assistant_response": status,
                     "last_run_status": run_status
                 }
-            await asyncio.sleep(interval)
-            elapsed += interval
         print(f"[AzureOpenAI SDK] wait_for_required_action Timeout esperando required_action o completion en run {run_id}")
         raise TimeoutError("wait_for_required_action Run did not reach required_action or completed state in time.")
 
-    async def get_completed_run_response(self, thread_id: str, run_id: str, max_retries: int = 5, retry_interval: float = 2.0) -> Optional[str]:
-        import asyncio
-        attempt = 0
-        while attempt < max_retries:
-            try:
-                messages = self.client.beta.threads.messages.list(thread_id=thread_id)
-                assistant_texts = []
-                for msg in messages.data:
-                    if msg.role == "assistant":
-                        for c in msg.content:
-                            if c.type == "text":
-                                text_obj = c.text
-                                if isinstance(text_obj, dict):
-                                    assistant_texts.append(text_obj.get("value", ""))
-                                elif isinstance(text_obj, str):
-                                    assistant_texts.append(text_obj)
-                return "\n".join(assistant_texts) if assistant_texts else None
-            except Exception as e:
-                print(f"[AzureOpenAI SDK][ERROR] get_completed_run_response intento {attempt+1}: {str(e)}")
-            attempt += 1
-            await asyncio.sleep(retry_interval)
-        print(f"[AzureOpenAI SDK][ERROR] get_completed_run_response falló tras {max_retries} intentos para thread {thread_id}, run {run_id}")
-        return None
+    async def stream_run(
+        self,
+        thread_id: str,
+        tipo_asistente: TipoAsistenteEnum,
+        timeout: float = 10000.0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Mismo contrato que OpenAIAssistant.stream_run, con los streams de eventos del SDK: envía los
+        tool outputs al llegar thread.run.requires_action y recoge la respuesta en thread.run.completed.
+        Si el stream se corta con el run ya creado, continúa por polling sobre ese run; si no se llegó
+        a crear, lanza la excepción para que el llamador use polling.
+        """
+        run_id = None
+        run_status: Dict[str, Any] = {}
+        required_action_response = None
+        try:
+            await self.reservar_tokens_run(thread_id)
+            await self.rate_limiter.adquirir("runs")
+            stream = await self.client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=self.assistant_id,
+                stream=True,
+                **self.run_options
+            )
+            while stream is not None:
+                siguiente = False
+                async with stream:
+                    async for evento in stream:
+                        if not evento.event.startswith("thread.run.") or evento.event.startswith("thread.run.step"):
+                            continue
+                        run_status = evento.data.model_dump()
+                        run_id = run_status.get("id", run_id)
+                        status = run_status.get("status")
+                        if evento.event == "thread.run.created":
+                            print(f"[AzureOpenAI SDK] Run creado en thread {thread_id}: {run_id} (stream)")
+                        if status == "requires_action" and run_status.get("required_action"):
+                            required_action_response = run_status["required_action"]
+                            siguiente = True
+                            break
+                        if status == "completed" or status in OpenAIAssistant.RUN_TERMINAL_STATUSES:
+                            break
+                stream = None
+                if siguiente:
+                    await self.rate_limiter.adquirir("runs")
+                    stream = await self.client.beta.threads.runs.submit_tool_outputs(
+                        run_id,
+                        thread_id=thread_id,
+                        tool_outputs=OpenAIAssistant._tool_outputs(required_action_response),
+                        stream=True
+                    )
+                    print(f"[AzureOpenAI SDK] Acción requerida completada en run {run_id} ({tipo_asistente.value}) (stream)")
+            if not run_id:
+                raise RuntimeError("El stream terminó sin crear el run")
+        except Exception as e:
+            if not run_id:
+                raise
+            print(f"[AzureOpenAI SDK][WARN] stream_run interrumpido en run {run_id}, se continúa por polling: {str(e)}")
+            return await self.wait_for_required_action(
+                thread_id, run_id, tipo_asistente=tipo_asistente, timeout=timeout,
+                required_action_response=required_action_response
+            )
+
+        status = run_status.get("status")
+        if status == "completed":
+            if not required_action_response:
+                retry_message = (
+                    "Por favor, ejecuta la función configurada en el assistant y entrega el resultado de la revisión."
+                )
+                await self.create_message(thread_id, retry_message)
+                print(f"[AzureOpenAI SDK] Run adicional en thread {thread_id} (no hubo required_action inicial)")
+                return await self.stream_run(thread_id, tipo_asistente, timeout)
+            assistant_response = await self.get_completed_run_response(thread_id, run_id)
+            print(f"[AzureOpenAI SDK] Run completado en thread {thread_id}: {run_id}")
+            return {
+                "required_action": required_action_response,
+                "assistant_response": assistant_response,
+                "last_run_status": run_status
+            }
+        if status in OpenAIAssistant.RUN_TERMINAL_STATUSES:
+            print(f"[AzureOpenAI SDK] Run {run_id} estado ({status})")
+            return {
+                "required_action": required_action_response,
+                "assistant_response": status,
+                "last_run_status": run_status
+            }
+        # El stream terminó sin estado final: seguir por polling
+        return await self.wait_for_required_action(
+            thread_id, run_id, tipo_asistente=tipo_asistente, timeout=timeout,
+            required_action_response=required_action_response
+        )
+
+    async def get_completed_run_response(self, thread_id: str, run_id: str, max_retries: Optional[int] = None) -> Optional[str]:
+        client = self.client if max_retries is None else self.client.with_options(max_retries=max_retries)
+        try:
+            await self.rate_limiter.adquirir("polling")
+            messages = await client.beta.threads.messages.list(thread_id=thread_id)
+        except Exception as e:
+            print(f"[AzureOpenAI SDK][ERROR] get_completed_run_response falló para thread {thread_id}, run {run_id}: {str(e)}")
+            return None
+        assistant_texts = []
+        for msg in messages.data:
+            if msg.role == "assistant":
+                for c in msg.content:
+                    if c.type == "text":
+                        # c.text es un objeto Text del SDK con el contenido en .value
+                        assistant_texts.append(c.text.value)
+        return "\n".join(assistant_texts) if assistant_texts else None
 
     async def run_assistant_flow(
         self,
         user_message: str,
         tipo_asistente: TipoAsistenteEnum,
-        file_ids: Optional[List[str]] = None
+        file_ids: Optional[List[str]] = None,
+        vector_store_id: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
+        """
+        Mismo flujo que OpenAIAssistant.run_assistant_flow: los archivos se consultan por file_search en
+        el vector store de la solicitud (no se adjuntan al mensaje) y el run va en streaming si stream_runs,
+        con polling como respaldo.
+        """
         try:
-            thread_id = await self.create_thread()
-            if file_ids:
-                await self.create_message_with_files(thread_id, "Estos son los archivos que debes revisar", file_ids)
+            thread_id = await self.create_thread(vector_store_id=vector_store_id)
             await self.create_message(thread_id, user_message)
+            if self.stream_runs:
+                try:
+                    return await self.stream_run(thread_id, tipo_asistente=tipo_asistente)
+                except Exception as e:
+                    print(f"[AzureOpenAI SDK][WARN] Streaming de runs no disponible, se usa polling: {str(e)}")
             run_id = await self.create_run(thread_id)
             result = await self.wait_for_required_action(thread_id, run_id, tipo_asistente=tipo_asistente)
             return result
@@ -206,59 +338,181 @@ class AzureOpenAISDKAssistant:
             print(f"[AzureOpenAI SDK][ERROR] run_assistant_flow Unexpected error: {str(e)}")
             return None
 
-    async def upload_file_from_formdata_v2(self, file, filename: str, purpose: str = "assistants") -> Optional[Dict[str, Any]]:
+    async def upload_file_from_formdata_v2(self, file, filename: str, purpose: str = "assistants",
+                                           mime_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
         try:
             file_bytes = await file.read()
             if filename.lower().endswith((".xlsx", ".xls")):
-                excel_io = io.BytesIO(file_bytes)
-                df = pd.read_excel(excel_io)
-                csv_buffer = io.StringIO()
-                df.to_csv(csv_buffer, index=False)
-                file_bytes = csv_buffer.getvalue().encode('utf-8')
+                # Convierte todas las hojas a texto CSV en el pool de procesos (con cache por contenido)
+                file_bytes = await convertir_excel_a_texto(file_bytes)
                 filename = filename.rsplit('.', 1)[0] + ".txt"
-            file_obj = io.BytesIO(file_bytes)
-            file_response = self.client.files.create(
-                file=file_obj,
+                mime_type = "text/plain"
+            await self.rate_limiter.adquirir("files")
+            # (nombre, contenido, mime): con un BytesIO sin nombre el archivo se subía sin extensión
+            file_response = await self.client.files.create(
+                file=(filename, file_bytes, mime_type or "application/octet-stream"),
                 purpose=purpose
             )
             print(f"[AzureOpenAI SDK] Archivo subido: {file_response.id} ({filename})")
-            return file_response.dict()
+            return file_response.model_dump()
         except Exception as e:
             print(f"[AzureOpenAI SDK][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
             return None
 
-    async def depureFiles(self):
+    async def _eliminar_archivo(self, file_id: str) -> bool:
+        """
+        Elimina un archivo; un error se registra y no detiene la eliminación de los demás.
+        """
         try:
-            files = self.client.files.list()
-            print(f"[AzureOpenAI SDK] Archivos encontrados: {len(files.data)})")
-            for file in files.data:
-                file_id = file.id
-                if file_id:
-                    self.client.files.delete(file_id)
-                    print(f"[AzureOpenAI SDK] Archivo eliminado: {file_id}")
+            await self.rate_limiter.adquirir("files")
+            await self.client.files.delete(file_id)
+            print(f"[AzureOpenAI SDK] Archivo eliminado: {file_id}")
+            return True
+        except Exception as e:
+            print(f"[AzureOpenAI SDK][ERROR] No se pudo eliminar archivo: {file_id} - {str(e)}")
+            return False
+
+    async def depureFiles(self, keep_file_ids: Optional[set] = None, min_age_seconds: float = 0):
+        """
+        Elimina los archivos del recurso excepto los de keep_file_ids y los creados hace menos de min_age_seconds.
+        """
+        limite = time.time() - min_age_seconds
+        try:
+            await self.rate_limiter.adquirir("files")
+            # El listado del SDK pagina solo al iterarlo con async for
+            files = [file async for file in self.client.files.list()]
+            print(f"[AzureOpenAI SDK] Archivos encontrados: {len(files)}")
+            for file in files:
+                if min_age_seconds and file.created_at > limite:
+                    continue
+                if file.id and (not keep_file_ids or file.id not in keep_file_ids):
+                    await self._eliminar_archivo(file.id)
         except Exception as e:
             print(f"[AzureOpenAI SDK][ERROR] depureFiles Unexpected error: {str(e)}")
 
     async def depureFilesV2(self, current_file_ids: list):
+        """
+        Elimina solo los archivos cuyos IDs estén en current_file_ids, sin listar los del recurso.
+        """
+        for file_id in current_file_ids:
+            await self._eliminar_archivo(file_id)
+
+    async def file_exists(self, file_id: str) -> bool:
+        """
+        Solo un 404 cuenta como inexistente; otros errores (tras los reintentos del SDK) se asumen transitorios.
+        """
         try:
-            files = self.client.files.list()
-            print(f"[AzureOpenAI SDK] Archivos encontrados: {len(files.data)})")
-            for file in files.data:
-                file_id = file.id
-                if file_id and file_id in current_file_ids:
-                    self.client.files.delete(file_id)
-                    print(f"[AzureOpenAI SDK] Archivo eliminado: {file_id}")
+            await self.rate_limiter.adquirir("files")
+            await self.client.files.retrieve(file_id)
+            return True
+        except NotFoundError:
+            return False
         except Exception as e:
-            print(f"[AzureOpenAI SDK][ERROR] depureFilesV2 Unexpected error: {str(e)}")
-    
+            print(f"[AzureOpenAI SDK][WARN] file_exists {file_id} sin verificar, se asume existente: {str(e)}")
+            return True
+
+    async def create_vector_store(self, name: str, expires_after_days: Optional[int] = None) -> Optional[str]:
+        kwargs: Dict[str, Any] = {"name": name}
+        if expires_after_days:
+            kwargs["expires_after"] = {"anchor": "last_active_at", "days": expires_after_days}
+        try:
+            await self.rate_limiter.adquirir("vector_stores")
+            vector_store = await self.client.vector_stores.create(**kwargs)
+            print(f"[AzureOpenAI SDK] Vector store creado: {vector_store.id} ({name})")
+            return vector_store.id
+        except Exception as e:
+            print(f"[AzureOpenAI SDK][ERROR] create_vector_store Unexpected error: {str(e)}")
+            return None
+
+    async def delete_vector_store(self, vector_store_id: str) -> bool:
+        try:
+            await self.rate_limiter.adquirir("vector_stores")
+            await self.client.vector_stores.delete(vector_store_id)
+            print(f"[AzureOpenAI SDK] Vector store eliminado: {vector_store_id}")
+            return True
+        except Exception as e:
+            print(f"[AzureOpenAI SDK][ERROR] delete_vector_store {vector_store_id}: {str(e)}")
+            return False
+
+    async def add_files_to_vector_store_batch(
+        self,
+        vector_store_id: str,
+        file_ids: List[str],
+        max_retries: int = 3,
+        timeout: float = 300.0,
+        batch_size: int = 500
+    ) -> Dict[str, List[str]]:
+        """
+        Mismo contrato que OpenAIAssistant.add_files_to_vector_store_batch: file batches de hasta batch_size
+        archivos (el SDK espera la indexación con create_and_poll) y nuevo batch solo con los que fallaron.
+        timeout es el plazo total de la operación, no el de cada intento.
+        Retorna {"completed": [...], "failed": [...], "pending": [...]}.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        resultado = {"completed": [], "failed": [], "pending": []}
+        for i in range(0, len(file_ids), batch_size):
+            restantes = file_ids[i:i+batch_size]
+            intento = 0
+            while restantes and intento < max_retries:
+                if deadline - loop.time() <= 0:
+                    # Plazo total vencido: lo que no se alcanzó a intentar sigue pendiente y lo que ya falló, fallido
+                    if not intento:
+                        resultado["pending"].extend(restantes)
+                        restantes = []
+                    break
+                intento += 1
+                try:
+                    await self.rate_limiter.adquirir("vector_stores")
+                    batch = await asyncio.wait_for(
+                        self.client.vector_stores.file_batches.create_and_poll(vector_store_id, file_ids=restantes),
+                        max(deadline - loop.time(), 0)
+                    )
+                    await self.rate_limiter.adquirir("polling")
+                    fallidos = {
+                        archivo.id async for archivo in self.client.vector_stores.file_batches.list_files(
+                            batch.id, vector_store_id=vector_store_id, filter="failed"
+                        )
+                    }
+                except asyncio.TimeoutError:
+                    # Plazo vencido: no se reintenta lo que sigue en proceso
+                    resultado["pending"].extend(restantes)
+                    restantes = []
+                    break
+                except Exception as e:
+                    print(f"[AzureOpenAI SDK][ERROR] add_files_to_vector_store_batch {vector_store_id}: {str(e)}")
+                    break
+                resultado["completed"].extend(fid for fid in restantes if fid not in fallidos)
+                restantes = [fid for fid in restantes if fid in fallidos]
+                if restantes:
+                    print(f"[AzureOpenAI SDK][WARN] {len(restantes)} archivos fallaron en batch {batch.id} (intento {intento}/{max_retries})")
+                    if intento < max_retries:
+                        # Quitar la asociación fallida antes de volver a adjuntar el archivo
+                        for file_id in restantes:
+                            await self.remove_file_from_vector_store(vector_store_id, file_id)
+            resultado["failed"].extend(restantes)
+        return resultado
+
+    async def remove_file_from_vector_store(self, vector_store_id: str, file_id: str) -> bool:
+        """
+        Quita un archivo del vector store (no lo elimina de /files).
+        """
+        try:
+            await self.rate_limiter.adquirir("vector_stores")
+            await self.client.vector_stores.files.delete(file_id, vector_store_id=vector_store_id)
+            return True
+        except Exception as e:
+            print(f"[AzureOpenAI SDK][ERROR] remove_file_from_vector_store {file_id}: {str(e)}")
+            return False
+
     SUPPORTED_EXTENSIONS = [
     ".c", ".cpp", ".cs", ".css", ".doc", ".docx", ".go", ".html", ".java", ".js", ".json",
     ".md", ".pdf", ".php", ".pptx", ".py", ".rb", ".sh", ".tex", ".ts", ".txt"
     ]
 
+    @staticmethod
     def ensure_supported_extension(filename: str) -> str:
-        ext = filename.lower().rsplit('.', 1)[-1]
-        if not any(filename.lower().endswith(e) for e in SUPPORTED_EXTENSIONS):
+        if not any(filename.lower().endswith(e) for e in AzureOpenAISDKAssistant.SUPPORTED_EXTENSIONS):
             # Default to .txt if unsupported
             filename = filename.rsplit('.', 1)[0] + ".txt"
-        return filename
\ No newline at end of file
+        return filename
@@ -0,0 +1,161 @@
+import codecs
+import os
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+# Extensiones que file_search del assistant puede indexar y su MIME type
+MIME_INDEXABLES = {
+    ".c": "text/x-c",
+    ".cpp": "text/x-c++",
+    ".cs": "text/x-csharp",
+    ".css": "text/css",
+    ".doc": "application/msword",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".go": "text/x-golang",
+    ".html": "text/html",
+    ".java": "text/x-java",
+    ".js": "text/javascript",
+    ".json": "application/json",
+    ".md": "text/markdown",
+    ".pdf": "application/pdf",
+    ".php": "text/x-php",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".py": "text/x-python",
+    ".rb": "text/x-ruby",
+    ".sh": "application/x-sh",
+    ".tex": "text/x-tex",
+    ".ts": "application/typescript",
+    ".txt": "text/plain",
+}
+EXTENSIONES_BINARIAS = {".doc", ".docx", ".pdf", ".pptx"}
+# Excel no es indexable, pero upload_file_from_formdata_v2 lo convierte a texto antes de subirlo
+MIME_EXCEL = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".xls": "application/vnd.ms-excel",
+}
+
+# Archivos de metadatos del sistema operativo que llegan dentro de los comprimidos
+NOMBRES_METADATOS = {".ds_store", "thumbs.db", "desktop.ini", "ehthumbs.db"}
+
+FIRMAS_IMAGEN = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+FIRMAS_EJECUTABLE = (b"MZ", b"\x7fELF", b"\xca\xfe\xba\xbe", b"\xfe\xed\xfa\xce", b"\xfe\xed\xfa\xcf",
+                     b"\xcf\xfa\xed\xfe", b"\xce\xfa\xed\xfe")
+FIRMA_OLE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+FIRMA_APPLEDOUBLE = b"\x00\x05\x16\x07"
+
+
+def clasificar_archivo(nombre: str, fileobj: BinaryIO, bytes_cabecera: int = 8192) -> Dict[str, Any]:
+    """
+    Clasifica un archivo por sus primeros bytes (no por la extensión) y decide si se sube al assistant.
+    Retorna la entrada del manifiesto: {"Filename", "NombreSubida", "Tipo", "MimeType", "Bytes", "Incluido", "Motivo"}.
+    NombreSubida lleva la extensión del tipo detectado, ya que file_search decide por extensión.
+    Deja el puntero del archivo al inicio.
+    """
+    fileobj.seek(0, os.SEEK_END)
+    tamano = fileobj.tell()
+    fileobj.seek(0)
+    cabecera = fileobj.read(bytes_cabecera)
+    fileobj.seek(0)
+    tipo, extension, motivo = _detectar_tipo(nombre, fileobj, cabecera, tamano)
+    mime = MIME_INDEXABLES.get(extension) or MIME_EXCEL.get(extension)
+    nombre_subida = nombre
+    if mime and not nombre.lower().endswith(extension):
+        nombre_subida = f"{nombre}{extension}"
+    return {
+        "Filename": nombre,
+        "NombreSubida": nombre_subida,
+        "Tipo": tipo,
+        "MimeType": mime,
+        "Bytes": tamano,
+        "Incluido": motivo is None,
+        "Motivo": motivo or "indexable",
+    }
+
+
+def clasificar_archivos(archivos: List[Tuple[str, BinaryIO]]) -> List[Dict[str, Any]]:
+    """
+    Clasifica una lista de (nombre, archivo). Es bloqueante: se ejecuta en el pool de I/O.
+    """
+    return [clasificar_archivo(nombre, archivo) for nombre, archivo in archivos]
+
+
+def _detectar_tipo(nombre: str, fileobj: BinaryIO, cabecera: bytes, tamano: int) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Retorna (tipo, extensión a usar al subir, motivo de exclusión o None si se incluye).
+    """
+    base = os.path.basename(nombre).lower()
+    extension = os.path.splitext(base)[1]
+    if tamano == 0:
+        return "vacio", None, "archivo vacío"
+    if base in NOMBRES_METADATOS or base.startswith("._") or base.startswith("~$") \
+            or cabecera.startswith(FIRMA_APPLEDOUBLE):
+        return "metadatos", None, "metadatos del sistema operativo"
+    if cabecera.startswith(b"%PDF"):
+        return "pdf", ".pdf", None
+    for firma, tipo in FIRMAS_IMAGEN:
+        if cabecera.startswith(firma):
+            return tipo, None, "imagen"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "webp", None, "imagen"
+    if cabecera[:2] == b"BM" and int.from_bytes(cabecera[2:6], "little") == tamano:
+        # "BM" solo es una firma fiable junto con el tamaño del archivo que declara la cabecera BMP
+        return "bmp", None, "imagen"
+    if cabecera.startswith(b"PK\x03\x04"):
+        return _detectar_tipo_zip(fileobj)
+    if cabecera.startswith(FIRMA_OLE):
+        # Formatos binarios de Office: se distinguen por extensión (Thumbs.db ya se descartó)
+        if extension == ".doc":
+            return "doc", ".doc", None
+        if extension == ".xls":
+            return "xls", ".xls", None
+        return "ole", None, "formato no indexable"
+    if cabecera.startswith(b"{\\rtf"):
+        return "rtf", None, "formato no indexable"
+    if _es_texto(cabecera):
+        if extension in MIME_INDEXABLES and extension not in EXTENSIONES_BINARIAS:
+            return "texto", extension, None
+        # csv, xml, log, sin extensión...: se sube como .txt
+        return "texto", ".txt", None
+    # Después de descartar texto: un .txt que empieza con "MZ" no es un ejecutable
+    if cabecera.startswith(FIRMAS_EJECUTABLE):
+        return "ejecutable", None, "ejecutable"
+    return "binario", None, "formato no indexable"
+
+
+def _detectar_tipo_zip(fileobj: BinaryIO) -> Tuple[str, Optional[str], Optional[str]]:
+    # Los formatos Office Open XML son zip: se distinguen por el directorio central, sin descomprimir
+    try:
+        with zipfile.ZipFile(fileobj) as zf:
+            nombres = zf.namelist()
+    except zipfile.BadZipFile:
+        return "zip", None, "comprimido dañado"
+    finally:
+        fileobj.seek(0)
+    if any(n.startswith("word/") for n in nombres):
+        return "docx", ".docx", None
+    if any(n.startswith("ppt/") for n in nombres):
+        return "pptx", ".pptx", None
+    if any(n.startswith("xl/") for n in nombres):
+        return "xlsx", ".xlsx", None
+    return "zip", None, "comprimido no extraído"
+
+
+def _es_texto(cabecera: bytes) -> bool:
+    if b"\x00" in cabecera:
+        return False
+    try:
+        # final=False: la cabecera puede cortar un carácter multibyte al final
+        codecs.getincrementaldecoder("utf-8")().decode(cabecera, final=False)
+        return True
+    except UnicodeDecodeError:
+        pass
+    texto = cabecera.decode("cp1252", errors="replace")
+    imprimibles = sum(1 for c in texto if c.isprintable() or c in "\r\n\t")
+    return imprimibles / max(len(texto), 1) > 0.95
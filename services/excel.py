@@ -0,0 +1,399 @@
+import csv
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.reader.workbook import WorkbookParser
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.xml.constants import ARC_WORKBOOK
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+from services.executors import run_cpu, run_io
+
+# Motor de lectura de .xlsx: "auto" usa python-calamine si está instalado y si no openpyxl en modo read_only
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "auto").lower()
+
+Rango = Tuple[int, int, int, int]
+
+
+def mapa_desde_rangos(filas: List[List[Any]], rangos: List[Rango]) -> Dict[Tuple[int, int], Any]:
+    """
+    Mapa (fila, columna) -> valor de la celda superior izquierda de cada rango combinado, construido una
+    sola vez por hoja a partir de los rangos (min_fila, min_col, max_fila, max_col) y de la matriz de
+    valores ya leída (los lectores en streaming no tienen ws.merged_cells).
+    """
+    mapa = {}
+    for min_fila, min_col, max_fila, max_col in rangos:
+        ancla = filas[min_fila - 1] if min_fila <= len(filas) else []
+        valor = ancla[min_col - 1] if min_col <= len(ancla) else None
+        for fila in range(min_fila, max_fila + 1):
+            for columna in range(min_col, max_col + 1):
+                mapa[(fila, columna)] = valor
+    return mapa
+
+
+def completar_matriz(filas: List[List[Any]], rangos: List[Rango]) -> List[List[Any]]:
+    """
+    Deja la matriz rectangular y cubriendo los rangos combinados, como iter_rows en modo normal
+    (donde las MergedCell amplían las dimensiones de la hoja).
+    """
+    alto = max([len(filas)] + [rango[2] for rango in rangos])
+    ancho = max([len(fila) for fila in filas] + [rango[3] for rango in rangos] + [0])
+    filas.extend([] for _ in range(alto - len(filas)))
+    for fila in filas:
+        fila.extend([None] * (ancho - len(fila)))
+    return filas
+
+
+def leer_hoja_streaming(ws, rangos: List[Rango]) -> List[List[Any]]:
+    """
+    Lee una hoja de un libro abierto con read_only=True en una sola pasada (iter_rows con values_only)
+    y la deja con la misma forma que en modo normal. En read_only openpyxl no expone ws.merged_cells:
+    los rangos combinados se leen aparte del XML de la hoja (rangos_combinados_xlsx).
+    """
+    # Sin la dimensión declarada en el XML (puede estar desactualizada), cada fila trae solo hasta su última celda
+    ws.reset_dimensions()
+    filas = [list(fila) for fila in ws.iter_rows(values_only=True)]
+    # Las <row> finales sin celdas (solo formato de fila) no amplían la hoja en modo normal
+    while filas and not filas[-1]:
+        filas.pop()
+    return completar_matriz(filas, rangos)
+
+
+# <mergeCell ref="A1:C2"/> dentro del XML de una hoja
+_RE_MERGE_CELL = re.compile(rb'<(?:\w+:)?mergeCell\b[^>]*?\bref="([A-Z]+[0-9]+(?::[A-Z]+[0-9]+)?)"')
+
+
+def rangos_combinados_xlsx(archive: zipfile.ZipFile, ruta: str, chunk_size: int = 1024 * 1024) -> List[Rango]:
+    """
+    Busca los rangos combinados de una hoja recorriendo su XML por bloques, sin parsear las celdas.
+    Lo usan los motores que no informan las celdas combinadas (calamine).
+    """
+    rangos = []
+    resto = b""
+    with archive.open(ruta) as src:
+        for bloque in iter(lambda: src.read(chunk_size), b""):
+            datos = resto + bloque
+            fin = 0
+            for match in _RE_MERGE_CELL.finditer(datos):
+                rango = CellRange(match.group(1).decode())
+                rangos.append((rango.min_row, rango.min_col, rango.max_row, rango.max_col))
+                fin = match.end()
+            # Conserva la cola por si una etiqueta quedó partida entre dos bloques
+            resto = datos[max(fin, len(datos) - 256):]
+    return rangos
+
+
+def rellenar_combinadas(filas: List[List[Any]], mapa: Dict[Tuple[int, int], Any]) -> List[List[Any]]:
+    if not mapa:
+        return filas
+    return [
+        [mapa.get((fila, columna), valor) for columna, valor in enumerate(valores, start=1)]
+        for fila, valores in enumerate(filas, start=1)
+    ]
+
+
+def _convertir_celda_pandas(valor: Any) -> Any:
+    """
+    Misma conversión que aplica pandas al leer con openpyxl (OpenpyxlReader._convert_cell),
+    para que los DataFrames construidos desde el libro parseado coincidan con pd.ExcelFile.parse.
+    """
+    if valor is None:
+        return ""
+    if isinstance(valor, str) and valor in ERROR_CODES:
+        return float("nan")
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        entero = int(valor)
+        return entero if entero == valor else float(valor)
+    return valor
+
+
+def filas_como_texto(df: pd.DataFrame, omitir_vacias: bool = True) -> List[str]:
+    """
+    Convierte las filas del DataFrame en líneas "v1 | v2 | ..." con el mismo resultado que recorrer
+    df.iterrows() aplicando str(x).strip() a cada valor, pero operando por columnas.
+    Con omitir_vacias descarta las filas en las que todos los valores quedan vacíos.
+    """
+    if df.shape[0] == 0 or df.shape[1] == 0:
+        return [] if omitir_vacias or df.shape[0] == 0 else [""] * df.shape[0]
+    # to_numpy() aplica el mismo dtype común que iterrows a cada fila (p. ej. enteros a float si hay
+    # columnas float); astype(object) conserva el formato de str() en fechas (Timestamp), y map(str)
+    # en lugar de astype(str) mantiene "nan"/"NaT"/"None" como texto en vez de convertirlos en nulos
+    celdas = pd.DataFrame(df.to_numpy()).astype(object)
+    columnas = [celdas[c].map(str).str.strip() for c in celdas.columns]
+    lineas = columnas[0].str.cat(columnas[1:], sep=" | ") if len(columnas) > 1 else columnas[0]
+    if omitir_vacias:
+        mascara = np.logical_or.reduce([columna.to_numpy() != "" for columna in columnas])
+        lineas = lineas[mascara]
+    return lineas.tolist()
+
+
+class HojaExcel:
+    """
+    Hoja de un libro ya parseado. Guarda los valores crudos y el mapa de celdas combinadas,
+    y expone vistas derivadas (calculadas una sola vez):
+    - valores(): matriz completa con celdas combinadas rellenadas.
+    - columnas: arreglos por columna, sin filas ni columnas completamente vacías.
+    - dataframe(): DataFrame equivalente a pd.ExcelFile.parse(hoja) (encabezado en la primera fila).
+    """
+
+    def __init__(self, nombre: str, filas: List[List[Any]], combinadas: Optional[Dict[Tuple[int, int], Any]] = None,
+                 dataframe: Optional[pd.DataFrame] = None):
+        self.nombre = nombre
+        self.filas = filas
+        self.combinadas = combinadas or {}
+        self._valores = None
+        self._columnas = None
+        self._dataframe = dataframe
+
+    def valores(self) -> List[List[Any]]:
+        if self._valores is None:
+            self._valores = rellenar_combinadas(self.filas, self.combinadas)
+        return self._valores
+
+    @property
+    def columnas(self) -> List[List[Any]]:
+        if self._columnas is None:
+            filas = [fila for fila in self.valores() if any(v is not None for v in fila)]
+            ancho = max((len(fila) for fila in filas), default=0)
+            columnas = [[fila[i] if i < len(fila) else None for fila in filas] for i in range(ancho)]
+            self._columnas = [col for col in columnas if any(v is not None for v in col)]
+        return self._columnas
+
+    def dataframe(self) -> pd.DataFrame:
+        if self._dataframe is None:
+            data = []
+            ultima_con_datos = -1
+            for numero, fila in enumerate(self.filas):
+                convertida = [_convertir_celda_pandas(v) for v in fila]
+                while convertida and convertida[-1] == "":
+                    convertida.pop()
+                if convertida:
+                    ultima_con_datos = numero
+                data.append(convertida)
+            data = data[:ultima_con_datos + 1]
+            if data:
+                ancho = max(len(fila) for fila in data)
+                data = [fila + [""] * (ancho - len(fila)) for fila in data]
+            try:
+                self._dataframe = TextParser(data, header=0, skip_blank_lines=False).read()
+            except EmptyDataError:
+                self._dataframe = pd.DataFrame()
+        # Copia: los renderizadores modifican el DataFrame (fillna, etc.)
+        return self._dataframe.copy()
+
+
+class LibroExcel:
+    """
+    Representación intermedia de un libro Excel: se lee y parsea una sola vez por carga y todos
+    los renderizadores (texto plano, JSON, PDF, texto para el assistant) trabajan sobre ella.
+    Las hojas se leen en streaming y solo al accederlas, así un renderizador que usa unas pocas
+    hojas (hojas_objetivo) no materializa el resto del libro.
+    """
+
+    def __init__(self, hojas: Dict[str, HojaExcel], content_hash: str, nombres: Optional[List[str]] = None,
+                 cargador: Optional[Callable[[str], HojaExcel]] = None):
+        self.hojas = dict(hojas)
+        self.content_hash = content_hash
+        self._nombres = list(nombres) if nombres is not None else list(self.hojas)
+        self._cargador = cargador
+        self._lock = threading.Lock()
+
+    @property
+    def sheetnames(self) -> List[str]:
+        return list(self._nombres)
+
+    def __contains__(self, nombre: str) -> bool:
+        return nombre in self._nombres
+
+    def __getitem__(self, nombre: str) -> HojaExcel:
+        if nombre not in self._nombres:
+            raise KeyError(nombre)
+        with self._lock:
+            if nombre not in self.hojas:
+                self.hojas[nombre] = self._cargador(nombre)
+            return self.hojas[nombre]
+
+    @classmethod
+    def desde_bytes(cls, contents: bytes, content_hash: Optional[str] = None) -> "LibroExcel":
+        content_hash = content_hash or hashlib.sha256(contents).hexdigest()
+        if contents[:8] == b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1":
+            # .xls (formato binario antiguo): openpyxl no lo soporta, se lee con pandas/xlrd
+            xls = pd.ExcelFile(BytesIO(contents))
+
+            def cargar_xls(nombre: str) -> HojaExcel:
+                crudo = xls.parse(nombre, header=None)
+                filas = crudo.astype(object).where(crudo.notna(), None).values.tolist()
+                return HojaExcel(nombre, filas, dataframe=xls.parse(nombre))
+
+            return cls({}, content_hash, xls.sheet_names, cargar_xls)
+        if _motor_excel() == "calamine":
+            return cls._desde_calamine(contents, content_hash)
+        # read_only: no carga estilos ni el árbol de celdas; cada hoja se recorre en streaming al pedirla
+        wb = load_workbook(filename=BytesIO(contents), read_only=True, data_only=True, keep_links=False)
+        archive = zipfile.ZipFile(BytesIO(contents))
+        rutas = _rutas_hojas(archive)
+
+        def cargar_openpyxl(nombre: str) -> HojaExcel:
+            rangos = rangos_combinados_xlsx(archive, rutas[nombre]) if nombre in rutas else []
+            filas = leer_hoja_streaming(wb[nombre], rangos)
+            return HojaExcel(nombre, filas, mapa_desde_rangos(filas, rangos))
+
+        return cls({}, content_hash, [ws.title for ws in wb.worksheets], cargar_openpyxl)
+
+    @classmethod
+    def _desde_calamine(cls, contents: bytes, content_hash: str) -> "LibroExcel":
+        from python_calamine import CalamineWorkbook
+
+        wb = CalamineWorkbook.from_filelike(BytesIO(contents))
+        archive = zipfile.ZipFile(BytesIO(contents))
+        rutas = _rutas_hojas(archive)
+
+        def cargar_calamine(nombre: str) -> HojaExcel:
+            filas = [
+                [_convertir_celda_calamine(v) for v in fila]
+                for fila in wb.get_sheet_by_name(nombre).to_python(skip_empty_area=False)
+            ]
+            rangos = rangos_combinados_xlsx(archive, rutas[nombre]) if nombre in rutas else []
+            filas = completar_matriz(filas, rangos)
+            return HojaExcel(nombre, filas, mapa_desde_rangos(filas, rangos))
+
+        return cls({}, content_hash, [n for n in wb.sheet_names if n in rutas], cargar_calamine)
+
+
+def _rutas_hojas(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """
+    Nombre de hoja -> ruta de su XML dentro del .xlsx.
+    """
+    parser = WorkbookParser(archive, ARC_WORKBOOK)
+    parser.parse()
+    return {sheet.name: rel.target for sheet, rel in parser.find_sheets()}
+
+
+def _motor_excel() -> str:
+    if EXCEL_ENGINE in ("auto", "calamine") and importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+    if EXCEL_ENGINE == "calamine":
+        print("[Excel][WARN] EXCEL_ENGINE=calamine pero 'python-calamine' no está instalado, se usa openpyxl")
+    return "openpyxl"
+
+
+def _convertir_celda_calamine(valor: Any) -> Any:
+    """
+    Normaliza los valores de calamine a los tipos que entrega openpyxl: celdas vacías como None,
+    números enteros como int y fechas como datetime.
+    """
+    if isinstance(valor, str) and valor == "":
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, date) and not isinstance(valor, datetime):
+        return datetime(valor.year, valor.month, valor.day)
+    return valor
+
+
+def _celda_vacia(valor: Any) -> bool:
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def excel_a_texto_bytes(contents: bytes) -> bytes:
+    """
+    Convierte todas las hojas de un Excel a texto CSV en UTF-8 para subirlo al assistant, con un
+    encabezado "=== Hoja: nombre ===" por hoja y sin filas ni columnas vacías (las hojas vacías se omiten).
+    Las filas se escriben con csv.writer directo a un buffer de bytes, sin armar el CSV completo como str,
+    y cada hoja se libera al terminar de escribirla.
+    Recibe y retorna bytes para poder ejecutarse en el pool de procesos (services/executors.py).
+    """
+    libro = LibroExcel.desde_bytes(contents)
+    buffer = BytesIO()
+    salida = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
+    writer = csv.writer(salida, lineterminator="\n")
+    primera = True
+    for nombre in libro.sheetnames:
+        hoja = libro[nombre]
+        filas = hoja.valores()
+        columnas = sorted({j for fila in filas for j, valor in enumerate(fila) if not _celda_vacia(valor)})
+        if columnas:
+            salida.write(("" if primera else "\n") + f"=== Hoja: {nombre} ===\n")
+            primera = False
+            for fila in filas:
+                valores = [fila[j] if j < len(fila) else None for j in columnas]
+                if all(_celda_vacia(valor) for valor in valores):
+                    continue
+                writer.writerow(["" if valor is None else valor for valor in valores])
+        libro.hojas.pop(nombre, None)
+    salida.flush()
+    salida.detach()
+    return buffer.getvalue()
+
+
+# Cache por hash de contenido (LRU) de los textos ya convertidos en upload_file_from_formdata_v2
+_cache_textos: "OrderedDict[str, bytes]" = OrderedDict()
+EXCEL_TEXT_CACHE_MAX_ENTRIES = int(os.getenv("EXCEL_TEXT_CACHE_MAX_ENTRIES", "32"))
+
+
+async def convertir_excel_a_texto(contents: bytes) -> bytes:
+    """
+    excel_a_texto_bytes en el pool de procesos, reutilizando el resultado si el mismo contenido
+    ya se convirtió en este proceso (el mismo anexo en varias solicitudes o reintentos).
+    """
+    content_hash = await run_io(lambda: hashlib.sha256(contents).hexdigest())
+    texto = _cache_textos.get(content_hash)
+    if texto is not None:
+        _cache_textos.move_to_end(content_hash)
+        return texto
+    texto = await run_cpu(excel_a_texto_bytes, contents)
+    _cache_textos[content_hash] = texto
+    while len(_cache_textos) > EXCEL_TEXT_CACHE_MAX_ENTRIES:
+        _cache_textos.popitem(last=False)
+    return texto
+
+
+# Cache en memoria por hash de contenido (LRU) de libros ya parseados, acotada en entradas y en bytes:
+# cada libro retiene sus bytes, el workbook abierto y las hojas leídas
+_cache_libros: "OrderedDict[str, Tuple[LibroExcel, int]]" = OrderedDict()
+_cache_libros_lock = threading.Lock()
+EXCEL_CACHE_MAX_ENTRIES = int(os.getenv("EXCEL_CACHE_MAX_ENTRIES", "4"))
+EXCEL_CACHE_MAX_BYTES = int(os.getenv("EXCEL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def cargar_libro_excel(excel_file) -> LibroExcel:
+    """
+    Retorna el LibroExcel de un UploadFile (o lo devuelve tal cual si ya es un LibroExcel).
+    Lee el archivo desde el inicio sin consumirlo para otros usos, y reutiliza el libro parseado
+    si el mismo contenido ya se procesó. Un libro más grande que EXCEL_CACHE_MAX_BYTES no se cachea,
+    para no retener en memoria los libros de 20-50 MB.
+    """
+    if isinstance(excel_file, LibroExcel):
+        return excel_file
+    fileobj = getattr(excel_file, "file", excel_file)
+    fileobj.seek(0)
+    contents = fileobj.read()
+    fileobj.seek(0)
+    content_hash = hashlib.sha256(contents).hexdigest()
+    with _cache_libros_lock:
+        entrada = _cache_libros.get(content_hash)
+        if entrada is not None:
+            _cache_libros.move_to_end(content_hash)
+            return entrada[0]
+    libro = LibroExcel.desde_bytes(contents, content_hash)
+    if len(contents) > EXCEL_CACHE_MAX_BYTES:
+        return libro
+    with _cache_libros_lock:
+        _cache_libros[content_hash] = (libro, len(contents))
+        while len(_cache_libros) > EXCEL_CACHE_MAX_ENTRIES or sum(n for _, n in _cache_libros.values()) > EXCEL_CACHE_MAX_BYTES:
+            _cache_libros.popitem(last=False)
+    return libro
@@ -0,0 +1,63 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Executors compartidos por proceso. Se crean y se cierran en el lifespan de FastAPI (main.py) y en worker.py
+# para sacar del event loop el trabajo bloqueante de la ingesta:
+# - CPU (parseo de Excel, conversión a CSV): pool de procesos, usa todos los núcleos sin competir por el GIL.
+# - I/O (lectura de archivos temporales, descompresión, hashing): pool de hilos.
+_cpu_executor: Optional[Executor] = None
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def crear_cpu_executor() -> Executor:
+    """
+    Construye el executor para trabajo CPU según las variables de entorno:
+    CPU_EXECUTOR ("process" o "thread"), CPU_EXECUTOR_WORKERS (0 = un worker por núcleo)
+    y CPU_EXECUTOR_START_METHOD (spawn por defecto, seguro con hilos y event loop en el proceso padre).
+    Las funciones enviadas al pool de procesos deben ser de nivel de módulo y recibir/retornar
+    datos serializables con pickle (bytes, str, listas, dicts).
+    """
+    workers = int(os.getenv("CPU_EXECUTOR_WORKERS", "0")) or os.cpu_count() or 1
+    if os.getenv("CPU_EXECUTOR", "process").lower() == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cpu")
+    contexto = multiprocessing.get_context(os.getenv("CPU_EXECUTOR_START_METHOD", "spawn"))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+
+
+def crear_io_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=int(os.getenv("IO_EXECUTOR_WORKERS", "16")), thread_name_prefix="io")
+
+
+def init_executors():
+    global _cpu_executor, _io_executor
+    if _cpu_executor is None:
+        _cpu_executor = crear_cpu_executor()
+    if _io_executor is None:
+        _io_executor = crear_io_executor()
+    print(f"[Executors] Executors inicializados (cpu={type(_cpu_executor).__name__}, io={_io_executor._max_workers} hilos)")
+
+
+def shutdown_executors():
+    global _cpu_executor, _io_executor
+    for executor in (_cpu_executor, _io_executor):
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    _cpu_executor = _io_executor = None
+    print("[Executors] Executors cerrados")
+
+
+async def run_cpu(func: Callable[..., Any], *args) -> Any:
+    """
+    Ejecuta func(*args) en el executor de CPU. Sin lifespan (scripts, pruebas) usa el pool de hilos por defecto.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_cpu_executor, func, *args)
+
+
+async def run_io(func: Callable[..., Any], *args) -> Any:
+    """
+    Ejecuta func(*args) en el executor de I/O. Sin lifespan (scripts, pruebas) usa el pool de hilos por defecto.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, func, *args)
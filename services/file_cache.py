@@ -0,0 +1,132 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional, Iterable, Set
+from pymongo import ReturnDocument
+
+
+def hash_fileobj(fileobj, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Calcula el SHA-256 del contenido de un archivo leyendo por bloques y deja el puntero al inicio.
+    """
+    sha = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        sha.update(chunk)
+    fileobj.seek(0)
+    return sha.hexdigest()
+
+
+class FileCache:
+    """
+    Cache SHA-256 -> file_id de OpenAI en una colección Mongo.
+    Cada documento lleva un contador de referencias (solicitudes en curso que usan el archivo)
+    y una fecha de expiración con índice TTL; al expirar, Mongo elimina el documento y el
+    archivo queda disponible para depureFiles.
+    """
+
+    def __init__(self, collection, ttl_hours: float = 168):
+        self.collection = collection
+        self.ttl = timedelta(hours=ttl_hours)
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index("ContentHash", unique=True)
+        await self.collection.create_index("FileID")
+        await self.collection.create_index("ExpiresAt", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    async def acquire(self, content_hash: str) -> Optional[str]:
+        """
+        Si el hash está en cache y no ha expirado, suma una referencia, renueva el TTL
+        y retorna el file_id; si no, retorna None.
+        """
+        await self.ensure_indexes()
+        now = datetime.utcnow()
+        doc = await self.collection.find_one_and_update(
+            {"ContentHash": content_hash, "ExpiresAt": {"$gt": now}, "Invalido": {"$ne": True}},
+            {"$inc": {"RefCount": 1}, "$set": {"ExpiresAt": now + self.ttl, "LastUsed": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["FileID"] if doc else None
+
+    async def put(self, content_hash: str, file_id: str, filename: str) -> str:
+        """
+        Registra un archivo recién subido con una referencia. Si otra solicitud registró el mismo
+        hash en paralelo, conserva el file_id existente y lo retorna (el duplicado queda huérfano
+        y lo limpia depureFiles). Una entrada invalidada (archivo que ya no existe) se reemplaza
+        por el archivo nuevo sumando una referencia a las que aún tienen otras solicitudes; el file_id
+        anterior queda en FileIDsAnteriores para que release e invalidate de esas solicitudes lo encuentren.
+        """
+        await self.ensure_indexes()
+        now = datetime.utcnow()
+        anterior = await self.collection.find_one({"ContentHash": content_hash, "Invalido": True})
+        if anterior:
+            reemplazo = await self.collection.find_one_and_update(
+                {"ContentHash": content_hash, "FileID": anterior["FileID"], "Invalido": True},
+                {
+                    "$set": {"FileID": file_id, "Filename": filename, "FechaCreacion": now,
+                             "Invalido": False, "ExpiresAt": now + self.ttl, "LastUsed": now},
+                    "$inc": {"RefCount": 1},
+                    "$addToSet": {"FileIDsAnteriores": anterior["FileID"]}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            if reemplazo:
+                return reemplazo["FileID"]
+        doc = await self.collection.find_one_and_update(
+            {"ContentHash": content_hash},
+            {
+                "$setOnInsert": {"FileID": file_id, "Filename": filename, "FechaCreacion": now},
+                "$inc": {"RefCount": 1},
+                "$set": {"ExpiresAt": now + self.ttl, "LastUsed": now}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["FileID"]
+
+    async def invalidate(self, content_hash: str, file_id: str):
+        """
+        El archivo cacheado ya no existe (404 definitivo): suelta la referencia tomada con acquire y
+        elimina la entrada solo si ninguna otra solicitud la usa. Si otras la tienen, se marca inválida
+        para que acquire no la entregue y put la reemplace; su RefCount se conserva.
+        """
+        await self.collection.update_one(
+            {"ContentHash": content_hash, "$or": [{"FileID": file_id}, {"FileIDsAnteriores": file_id}],
+             "RefCount": {"$gt": 0}},
+            {"$inc": {"RefCount": -1}}
+        )
+        result = await self.collection.delete_one(
+            {"ContentHash": content_hash, "FileID": file_id, "RefCount": {"$lte": 0}}
+        )
+        if not result.deleted_count:
+            await self.collection.update_one(
+                {"ContentHash": content_hash, "FileID": file_id},
+                {"$set": {"Invalido": True}}
+            )
+
+    async def release(self, file_ids: Iterable[str]):
+        """
+        Resta una referencia a cada file_id (al terminar la solicitud que los usaba), también si la
+        entrada ya fue reemplazada por un archivo nuevo.
+        """
+        file_ids = list(file_ids)
+        if not file_ids:
+            return
+        await self.collection.update_many(
+            {"$or": [{"FileID": {"$in": file_ids}}, {"FileIDsAnteriores": {"$in": file_ids}}], "RefCount": {"$gt": 0}},
+            {"$inc": {"RefCount": -1}}
+        )
+
+    async def live_file_ids(self) -> Set[str]:
+        """
+        file_ids que no deben eliminarse: en uso por alguna solicitud o aún vigentes en cache.
+        """
+        now = datetime.utcnow()
+        cursor = self.collection.find(
+            {"$or": [{"RefCount": {"$gt": 0}}, {"ExpiresAt": {"$gt": now}}]},
+            {"FileID": 1}
+        )
+        return {doc["FileID"] async for doc in cursor}
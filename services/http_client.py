@@ -0,0 +1,53 @@
+import os
+import importlib.util
+import httpx
+from typing import Optional
+
+# Cliente HTTP compartido por proceso. Se crea y se cierra en el lifespan de FastAPI (main.py)
+# para reutilizar conexiones (keep-alive) en lugar de abrir un handshake TCP + TLS por llamada.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def crear_http_client() -> httpx.AsyncClient:
+    """
+    Construye un httpx.AsyncClient con pool de conexiones configurable por variables de entorno:
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT y HTTP2 (solo si el paquete h2 está instalado).
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("HTTP_TIMEOUT", "60")),
+        connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    )
+    http2 = os.getenv("HTTP2", "false").lower() in ("1", "true", "yes")
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("[HTTP][WARN] HTTP2 habilitado pero el paquete 'h2' no está instalado, se usa HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = crear_http_client()
+        print("[HTTP] Cliente HTTP compartido inicializado")
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        print("[HTTP] Cliente HTTP compartido cerrado")
+
+
+def get_http_client() -> Optional[httpx.AsyncClient]:
+    """
+    Retorna el cliente compartido, o None si el lifespan no se ha ejecutado (scripts, pruebas).
+    """
+    return _http_client
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+from pymongo import ReturnDocument
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+JobFailedHandler = Callable[[Dict[str, Any], str], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    Cola de trabajos persistida en Mongo. Un worker reclama un job con un lease (LeaseUntil) que
+    renueva con heartbeats; si el worker muere, el lease vence y otro worker lo retoma.
+    Estados: pending -> running -> done | failed (o de vuelta a pending para reintentar).
+    """
+
+    def __init__(self, collection, lease_seconds: float = 300, max_attempts: int = 3, retry_delay_seconds: float = 30):
+        self.collection = collection
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.retry_delay = timedelta(seconds=retry_delay_seconds)
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index("JobID", unique=True)
+        await self.collection.create_index([("Estado", 1), ("DisponibleDesde", 1), ("FechaCreacion", 1)])
+        await self.collection.create_index([("Estado", 1), ("LeaseUntil", 1)])
+        self._indexes_ready = True
+
+    async def enqueue(self, tipo: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        await self.ensure_indexes()
+        now = datetime.utcnow()
+        job_id = job_id or str(uuid.uuid4())
+        await self.collection.insert_one({
+            "JobID": job_id,
+            "Tipo": tipo,
+            "Estado": "pending",
+            "Payload": payload,
+            "Intentos": 0,
+            "MaxIntentos": self.max_attempts,
+            "DisponibleDesde": now,
+            "LeaseUntil": None,
+            "WorkerID": None,
+            "Error": None,
+            "FechaCreacion": now,
+            "FechaActualizacion": now
+        })
+        print(f"[Jobs] Job encolado: {job_id} ({tipo})")
+        return job_id
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Reclama el job pendiente más antiguo, o uno en ejecución cuyo lease ya venció (worker caído).
+        """
+        await self.ensure_indexes()
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"Estado": "pending", "DisponibleDesde": {"$lte": now}},
+                {"Estado": "running", "LeaseUntil": {"$lt": now}}
+            ]},
+            {
+                "$set": {"Estado": "running", "WorkerID": worker_id, "LeaseUntil": now + self.lease, "FechaActualizacion": now},
+                "$inc": {"Intentos": 1}
+            },
+            sort=[("FechaCreacion", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Renueva el lease. Retorna False si el job ya no pertenece a este worker.
+        """
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"JobID": job_id, "WorkerID": worker_id, "Estado": "running"},
+            {"$set": {"LeaseUntil": now + self.lease, "FechaActualizacion": now}}
+        )
+        return result.modified_count == 1
+
+    async def complete(self, job_id: str, worker_id: str):
+        await self.collection.update_one(
+            {"JobID": job_id, "WorkerID": worker_id},
+            {"$set": {"Estado": "done", "LeaseUntil": None, "Error": None, "FechaActualizacion": datetime.utcnow()}}
+        )
+
+    async def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> bool:
+        """
+        Registra un fallo. Si quedan intentos, el job vuelve a pending tras retry_delay (creciente por intento);
+        si no, queda en failed. Retorna True si el fallo es definitivo.
+        """
+        now = datetime.utcnow()
+        definitivo = job.get("Intentos", 0) >= job.get("MaxIntentos", self.max_attempts)
+        update = {"Error": error, "LeaseUntil": None, "FechaActualizacion": now}
+        if definitivo:
+            update["Estado"] = "failed"
+        else:
+            update["Estado"] = "pending"
+            update["DisponibleDesde"] = now + self.retry_delay * job.get("Intentos", 1)
+        await self.collection.update_one({"JobID": job["JobID"], "WorkerID": worker_id}, {"$set": update})
+        return definitivo
+
+
+class WorkerPool:
+    """
+    Pool de workers asyncio que consumen una JobQueue. Puede correr dentro del proceso de la API
+    (lifespan de FastAPI) o en procesos separados (worker.py) para escalar horizontalmente.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: JobHandler,
+        on_failed: Optional[JobFailedHandler] = None,
+        size: int = 2,
+        poll_interval: float = 2.0
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.on_failed = on_failed
+        self.size = size
+        self.poll_interval = poll_interval
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self._stop.clear()
+        for i in range(self.size):
+            self._tasks.append(asyncio.create_task(self._run(f"{self.prefix}-{i}")))
+        print(f"[Jobs] {self.size} workers iniciados ({self.prefix})")
+
+    async def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        print(f"[Jobs] Workers detenidos ({self.prefix})")
+
+    async def wait(self):
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                job = await self.queue.claim(worker_id)
+            except Exception as e:
+                print(f"[Jobs][ERROR] {worker_id} no pudo reclamar job: {str(e)}")
+                job = None
+            if not job:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job, worker_id)
+
+    async def _execute(self, job: Dict[str, Any], worker_id: str):
+        job_id = job["JobID"]
+        if job["Intentos"] > job["MaxIntentos"]:
+            # El job agotó sus intentos por caídas del worker (el lease venció sin registrar fallo)
+            await self._fail(job, worker_id, "Intentos agotados (worker caído o lease vencido)")
+            return
+        print(f"[Jobs] {worker_id} ejecuta job {job_id} (intento {job['Intentos']}/{job['MaxIntentos']})")
+        task = asyncio.create_task(self.handler(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, worker_id, task))
+        try:
+            await task
+            await self.queue.complete(job_id, worker_id)
+            print(f"[Jobs] Job {job_id} completado")
+        except asyncio.CancelledError:
+            if self._stop.is_set():
+                # Apagado: el lease vencerá y otro worker retoma el job
+                raise
+            print(f"[Jobs][WARN] Job {job_id} cancelado: lease perdido")
+        except Exception as e:
+            print(f"[Jobs][ERROR] Job {job_id} falló: {str(e)}")
+            await self._fail(job, worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+
+    async def _fail(self, job: Dict[str, Any], worker_id: str, error: str):
+        definitivo = await self.queue.fail(job, worker_id, error)
+        if definitivo and self.on_failed:
+            try:
+                await self.on_failed(job, error)
+            except Exception as e:
+                print(f"[Jobs][ERROR] on_failed job {job['JobID']}: {str(e)}")
+
+    async def _heartbeat(self, job_id: str, worker_id: str, task: asyncio.Task):
+        intervalo = self.queue.lease.total_seconds() / 3
+        while not task.done():
+            await asyncio.sleep(intervalo)
+            try:
+                if not await self.queue.heartbeat(job_id, worker_id):
+                    task.cancel()
+                    return
+            except Exception as e:
+                print(f"[Jobs][ERROR] heartbeat job {job_id}: {str(e)}")
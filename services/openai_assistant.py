@@ -1,61 +1,135 @@
-import io
-import pandas as pd
+import os
+import time
 from flask import json
 import httpx
 import asyncio
-from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 from models import TipoAsistenteEnum
+from services.excel import convertir_excel_a_texto
+from services.rate_limit import RateLimiter, estimar_tokens, obtener_rate_limiter
+from services.retry import PoliticaReintentos, ejecutar_con_reintentos, obtener_circuito
+from services.run_tracker import RunTracker, run_tracker as run_tracker_compartido
+from services.transporte import TransporteOpenAI
 
 class OpenAIAssistant:
-    def __init__(self, api_key: str, assistant_id: str):
+    """
+    Assistant sobre la API REST de Assistants v2. El proveedor (OpenAI o Azure OpenAI) lo define el
+    transporte (services/transporte.py); run_options se agrega al crear cada run y, con
+    reprompt_sin_accion, un run que termina sin pedir la función se repite una vez con un recordatorio.
+    """
+    RUN_TERMINAL_STATUSES = ("cancelling", "failed", "cancelled", "incomplete", "expired")
+
+    def __init__(
+        self,
+        api_key: str,
+        assistant_id: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+        stream_runs: bool = True,
+        stream_read_timeout: float = 300.0,
+        retry_policy: Optional[PoliticaReintentos] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        run_tracker: Optional[RunTracker] = None,
+        transporte: Optional[TransporteOpenAI] = None,
+        run_options: Optional[Dict[str, Any]] = None,
+        reprompt_sin_accion: bool = True
+    ):
         self.api_key = api_key
         self.assistant_id = assistant_id
-        self.base_url = "https://api.openai.com/v1"
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "OpenAI-Beta": "assistants=v2"
-        }
-
-    async def create_thread(self) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/threads",
-                headers=self.headers
-            )
-            response.raise_for_status()
-            thread_id = response.json()["id"]
-            print(f"[OpenAI] Thread creado: {thread_id}")
-            return thread_id
+        self.http_client = http_client
+        self.stream_runs = stream_runs
+        self.stream_timeout = httpx.Timeout(stream_read_timeout, connect=10.0)
+        self.retry_policy = retry_policy or PoliticaReintentos.desde_entorno()
+        self.transporte = transporte or TransporteOpenAI(api_key)
+        self.base_url = self.transporte.base_url
+        self.run_options = run_options or {}
+        self.reprompt_sin_accion = reprompt_sin_accion
+        # Limitador compartido por todos los assistants del proceso que apuntan al mismo host
+        self.rate_limiter = rate_limiter or obtener_rate_limiter(self.transporte.host)
+        # Tokens estimados de los mensajes de cada hilo: un run vuelve a procesar el hilo completo
+        self.tokens_por_hilo: Dict[str, int] = {}
+        self.run_tracker = run_tracker or run_tracker_compartido
+        self.headers = {**self.transporte.headers, "Content-Type": "application/json"}
+
+    @asynccontextmanager
+    async def _client(self):
+        """
+        Entrega el cliente HTTP compartido (pool de conexiones) si fue inyectado;
+        si no, abre un cliente temporal que se cierra al salir del bloque.
+        """
+        if self.http_client is not None:
+            yield self.http_client
+        else:
+            async with httpx.AsyncClient() as client:
+                yield client
+
+    def _url(self, ruta: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return self.transporte.url(ruta, params)
+
+    async def _reintentar(self, endpoint: str, descripcion: str, operacion, max_intentos: Optional[int] = None,
+                          base: Optional[float] = None, limite: Optional[str] = None):
+        """
+        Ejecuta operacion() con la política de reintentos (services/retry.py) y el circuito del endpoint,
+        compartido con las demás solicitudes del proceso. Propaga el error si no se logra.
+        """
+        politica = self.retry_policy.con(max_intentos, base) if max_intentos or base else self.retry_policy
+        circuito = obtener_circuito(f"{self.transporte.host}/{endpoint}")
+
+        async def operacion_limitada():
+            # Cada intento (también los reintentos) consume presupuesto de la clase de endpoint
+            await self.rate_limiter.adquirir(limite or endpoint)
+            return await operacion()
+
+        return await ejecutar_con_reintentos(operacion_limitada, politica, circuito, f"[{self.transporte.nombre}] {descripcion}")
+
+    async def create_thread(self, vector_store_id: Optional[str] = None) -> str:
+        """
+        Crea un hilo. Si se indica vector_store_id, el file_search del hilo (y de sus runs)
+        queda apuntando a ese vector store mediante tool_resources.
+        """
+        payload = {}
+        if vector_store_id:
+            payload["tool_resources"] = {"file_search": {"vector_store_ids": [vector_store_id]}}
+
+        async def crear():
+            async with self._client() as client:
+                response = await client.post(
+                    self._url("/threads"),
+                    headers=self.headers,
+                    json=payload
+                )
+                response.raise_for_status()
+                return response.json()["id"]
+
+        thread_id = await self._reintentar("threads", "create_thread", crear)
+        print(f"[{self.transporte.nombre}] Thread creado: {thread_id}")
+        return thread_id
 
     async def create_message(self, thread_id: str, content: str) -> Optional[str]:
-        max_attempts = 3
-        attempt = 0
-        while attempt < max_attempts:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/threads/{thread_id}/messages",
-                        headers=self.headers,
-                        json={"role": "user", "content": content}
-                    )
-                    response.raise_for_status()
-                    message_id = response.json()["id"]
-                    print(f"[OpenAI] Mensaje creado en thread {thread_id}: {message_id}")
-                    return message_id
-            except Exception as e:
-                attempt += 1
-                print(f"[OpenAI][ERROR] create_message intento {attempt} en thread {thread_id}: {str(e)}")
-                if attempt < max_attempts:
-                    await asyncio.sleep(2)  # Espera antes de reintentar
-        print(f"[OpenAI][ERROR] create_message falló tras {max_attempts} intentos en thread {thread_id}")
-        return None
+        async def enviar():
+            async with self._client() as client:
+                response = await client.post(
+                    self._url(f"/threads/{thread_id}/messages"),
+                    headers=self.headers,
+                    json={"role": "user", "content": content}
+                )
+                response.raise_for_status()
+                return response.json()["id"]
+
+        try:
+            message_id = await self._reintentar("threads", f"create_message en thread {thread_id}", enviar)
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] create_message falló en thread {thread_id}: {str(e)}")
+            return None
+        self.tokens_por_hilo[thread_id] = self.tokens_por_hilo.get(thread_id, 0) + estimar_tokens(content)
+        print(f"[{self.transporte.nombre}] Mensaje creado en thread {thread_id}: {message_id}")
+        return message_id
 
     async def create_message_with_files(self, thread_id: str, content: str, file_ids: Optional[List[str]]) -> Optional[str]:
         """
         Crea un mensaje en el hilo del asistente incluyendo archivos adjuntos.
         Si hay más de 5 archivos, los envía en lotes de 5 por mensaje.
-        Captura y loguea cualquier excepción por lote, reintentando hasta 3 veces.
+        Captura y loguea cualquier excepción por lote, reintentando según la política de reintentos.
         Devuelve None si todos los lotes fallan.
         """
         try:
@@ -86,79 +160,81 @@ class OpenAIAssistant:
                     ],
                     "attachments": attachments
                 }
-                success = False
-                attempts = 0
-                while not success and attempts < 3:
-                    try:
-                        async with httpx.AsyncClient() as client:
-                            response = await client.post(
-                                f"{self.base_url}/threads/{thread_id}/messages",
-                                headers=self.headers,
-                                json=message_payload
-                            )
-                            print("message_payload enviado a OpenAI:", message_payload)
-                            print("response recibido de OpenAI:", response.json())
-                            response.raise_for_status()
-                            message_id = response.json()["id"]
-                            print(f"[OpenAI] Mensaje con archivos creado en thread {thread_id}: {message_id} (Archivos {i+1}-{i+len(batch)})")
-                            message_ids.append(message_id)
-                            success = True
-                    except Exception as e:
-                        attempts += 1
-                        print(f"[OpenAI][ERROR] create_message_with_files intento {attempts} (Archivos {i+1}-{i+len(batch)}): {str(e)}")
-                        if attempts < 3:
-                            await asyncio.sleep(2)  # Espera antes de reintentar
+
+                async def enviar():
+                    async with self._client() as client:
+                        response = await client.post(
+                            self._url(f"/threads/{thread_id}/messages"),
+                            headers=self.headers,
+                            json=message_payload
+                        )
+                        response.raise_for_status()
+                        return response.json()["id"]
+
+                try:
+                    message_id = await self._reintentar(
+                        "threads", f"create_message_with_files (Archivos {i+1}-{i+len(batch)})", enviar
+                    )
+                    print(f"[{self.transporte.nombre}] Mensaje con archivos creado en thread {thread_id}: {message_id} (Archivos {i+1}-{i+len(batch)})")
+                    message_ids.append(message_id)
+                    self.tokens_por_hilo[thread_id] = self.tokens_por_hilo.get(thread_id, 0) + estimar_tokens(content)
+                except Exception as e:
+                    print(f"[{self.transporte.nombre}][ERROR] create_message_with_files (Archivos {i+1}-{i+len(batch)}): {str(e)}")
                 await asyncio.sleep(5)  # Delay de 5 segundos entre lotes
             # Retorna el último message_id (o lista si prefieres)
             return message_ids[-1] if message_ids else None
         except Exception as e:
-            print(f"[OpenAI][ERROR] create_message_with_files Unexpected error fuera del ciclo: {str(e)}")
+            print(f"[{self.transporte.nombre}][ERROR] create_message_with_files Unexpected error fuera del ciclo: {str(e)}")
             return None
 
     async def create_run(self, thread_id: str) -> Optional[str]:
-        max_attempts = 3
-        attempt = 0
-        while attempt < max_attempts:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/threads/{thread_id}/runs",
-                        headers=self.headers,
-                        json={"assistant_id": self.assistant_id}
-                    )
-                    response.raise_for_status()
-                    run_id = response.json()["id"]
-                    print(f"[OpenAI] Run creado en thread {thread_id}: {run_id}")
-                    return run_id
-            except Exception as e:
-                attempt += 1
-                print(f"[OpenAI][ERROR] create_run intento {attempt} en thread {thread_id}: {str(e)}")
-                if attempt < max_attempts:
-                    await asyncio.sleep(2)  # Espera antes de reintentar
-        print(f"[OpenAI][ERROR] create_run falló tras {max_attempts} intentos en thread {thread_id}")
-        return None
+        async def crear():
+            async with self._client() as client:
+                response = await client.post(
+                    self._url(f"/threads/{thread_id}/runs"),
+                    headers=self.headers,
+                    json={"assistant_id": self.assistant_id, **self.run_options}
+                )
+                response.raise_for_status()
+                return response.json()["id"]
+
+        try:
+            await self.reservar_tokens_run(thread_id)
+            run_id = await self._reintentar("runs", f"create_run en thread {thread_id}", crear)
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] create_run falló en thread {thread_id}: {str(e)}")
+            return None
+        print(f"[{self.transporte.nombre}] Run creado en thread {thread_id}: {run_id}")
+        return run_id
+
+    async def reservar_tokens_run(self, thread_id: str):
+        """
+        Espera presupuesto de tokens por minuto para un run: los mensajes del hilo más
+        RATE_LIMIT_RUN_EXTRA_TOKENS (instrucciones del assistant y fragmentos de file_search).
+        """
+        extra = int(os.getenv("RATE_LIMIT_RUN_EXTRA_TOKENS", "8000"))
+        await self.rate_limiter.adquirir_tokens(self.tokens_por_hilo.get(thread_id, 0) + extra)
 
     async def get_run_status(self, thread_id: str, run_id: str, max_retries: int = 10, retry_interval: float = 2.0) -> Dict[str, Any]:
         """
-        Consulta el estado de un run en OpenAI. Si la petición falla, reintenta hasta max_retries veces.
+        Consulta el estado de un run en OpenAI. Si la petición falla con un error transitorio, reintenta
+        hasta max_retries veces con backoff exponencial desde retry_interval.
         """
-        attempt = 0
-        while attempt < max_retries:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{self.base_url}/threads/{thread_id}/runs/{run_id}",
-                        headers=self.headers
-                    )
-                    response.raise_for_status()
-                    return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"[OpenAI][ERROR] get_run_status intento {attempt+1}: {e.response.status_code} - {e.response.text}")
-            except Exception as e:
-                print(f"[OpenAI][ERROR] get_run_status intento {attempt+1}: {str(e)}")
-            attempt += 1
-            await asyncio.sleep(retry_interval)
-        print(f"[OpenAI][ERROR] get_run_status falló tras {max_retries} intentos para run {run_id}")
+        async def consultar():
+            async with self._client() as client:
+                response = await client.get(
+                    self._url(f"/threads/{thread_id}/runs/{run_id}"),
+                    headers=self.headers
+                )
+                response.raise_for_status()
+                return response.json()
+
+        try:
+            return await self._reintentar("runs", f"get_run_status run {run_id}", consultar, max_retries, retry_interval, limite="polling")
+        except httpx.HTTPStatusError as e:
+            print(f"[{self.transporte.nombre}][ERROR] get_run_status falló para run {run_id}: {e.response.status_code} - {e.response.text}")
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] get_run_status falló para run {run_id}: {str(e)}")
         return {}
 
     async def wait_for_required_action(
@@ -166,132 +242,265 @@ class OpenAIAssistant:
         thread_id: str,
         run_id: str,
         tipo_asistente: TipoAsistenteEnum,
-        interval: float = 10.0,
-        timeout: float = 10000.0
+        timeout: float = 10000.0,
+        required_action_response: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
-        elapsed = 0
-        required_action_detected = False
-        required_action_response = None
-        while elapsed < timeout:
-            run_status = await self.get_run_status(thread_id, run_id)
+        """
+        Espera a que el run pida la función o termine. El polling lo hace el tracker compartido
+        (services/run_tracker.py), con intervalos cortos al inicio y tras enviar tool outputs.
+        required_action_response es la acción ya atendida antes de llegar aquí (por ejemplo, en
+        stream_run antes de cortarse el stream): cuenta como detectada y se retorna con el resultado.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        required_action_detected = required_action_response is not None
+        while loop.time() < deadline:
+            try:
+                run_status = await self.run_tracker.esperar(
+                    thread_id, run_id, self.get_run_status, timeout=deadline - loop.time()
+                )
+            except asyncio.TimeoutError:
+                break
             status = run_status.get("status")
-            print(f"[OpenAI] status ({tipo_asistente.value}) {status}")
+            print(f"[{self.transporte.nombre}] status ({tipo_asistente.value}) {status}")
             if status == "requires_action" and run_status.get("required_action"):
                 try:
                     required_action_detected = True
                     required_action = run_status["required_action"]
                     required_action_response = required_action
-                    tool_calls = required_action.get("submit_tool_outputs", {}).get("tool_calls", [])
-                    tool_outputs = [
-                        {
-                            "tool_call_id": call["id"],
-                            "output": "Ok, función ejecutada correctamente."
-                        }
-                        for call in tool_calls
-                    ]
-                    async with httpx.AsyncClient() as client:
-                        response = await client.post(
-                            f"{self.base_url}/threads/{thread_id}/runs/{run_id}/submit_tool_outputs",
-                            headers=self.headers,
-                            json={"tool_outputs": tool_outputs}
-                        )
-                        response.raise_for_status()
-                    print(f"[OpenAI] Acción requerida completada en run {run_id} ({tipo_asistente.value})")
+
+                    async def enviar_tool_outputs():
+                        async with self._client() as client:
+                            response = await client.post(
+                                self._url(f"/threads/{thread_id}/runs/{run_id}/submit_tool_outputs"),
+                                headers=self.headers,
+                                json={"tool_outputs": self._tool_outputs(required_action)}
+                            )
+                            response.raise_for_status()
+
+                    await self._reintentar("runs", f"submit_tool_outputs run {run_id}", enviar_tool_outputs)
+                    print(f"[{self.transporte.nombre}] Acción requerida completada en run {run_id} ({tipo_asistente.value})")
                 except Exception as e:
-                    print(f"[OpenAI][ERROR] wait_for_required_action al procesar required_action en run {run_id}: {str(e)}")
+                    print(f"[{self.transporte.nombre}][ERROR] wait_for_required_action al procesar required_action en run {run_id}: {str(e)}")
                     # Continúa esperando el siguiente estado
             if status == "completed":
-                if not required_action_detected:
+                if not required_action_detected and self.reprompt_sin_accion:
                     retry_message = (
                         "Por favor, ejecuta la función configurada en el assistant y entrega el resultado de la revisión."
                     )
                     await self.create_message(thread_id, retry_message)
                     new_run_id = await self.create_run(thread_id)
-                    print(f"[OpenAI] Run adicional creado en thread {thread_id}: {new_run_id} (no hubo required_action inicial)")
-                    return await self.wait_for_required_action(thread_id, new_run_id, tipo_asistente, interval, timeout)
+                    print(f"[{self.transporte.nombre}] Run adicional creado en thread {thread_id}: {new_run_id} (no hubo required_action inicial)")
+                    return await self.wait_for_required_action(
+                        thread_id, new_run_id, tipo_asistente, max(deadline - loop.time(), 0)
+                    )
                 assistant_response = await self.get_completed_run_response(thread_id, run_id)
-                print(f"[OpenAI] Run completado en thread {thread_id}: {run_id}")
+                print(f"[{self.transporte.nombre}] Run completado en thread {thread_id}: {run_id}")
                 return {
                     "required_action": required_action_response,
                     "assistant_response": assistant_response,
                     "last_run_status": run_status
                 }
-            if status in ["cancelling","failed", "cancelled","incomplete","expired"]:
-                print(f"[OpenAI] Run {run_id} estado ({status})")
+            if status in self.RUN_TERMINAL_STATUSES:
+                print(f"[{self.transporte.nombre}] Run {run_id} estado ({status})")
                 return {
                     "required_action": required_action_response,
                     "assistant_response": status,
                     "last_run_status": run_status
                 }
-            await asyncio.sleep(interval)
-            elapsed += interval
         
-        print(f"[OpenAI] wait_for_required_action Timeout esperando required_action o completion en run {run_id}")
+        print(f"[{self.transporte.nombre}] wait_for_required_action Timeout esperando required_action o completion en run {run_id}")
         raise TimeoutError("wait_for_required_action Run did not reach required_action or completed state in time.")
 
+    @staticmethod
+    def _tool_outputs(required_action: Dict[str, Any]) -> List[Dict[str, str]]:
+        tool_calls = required_action.get("submit_tool_outputs", {}).get("tool_calls", [])
+        return [
+            {
+                "tool_call_id": call["id"],
+                "output": "Ok, función ejecutada correctamente."
+            }
+            for call in tool_calls
+        ]
+
+    @staticmethod
+    async def _iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[Optional[str], str]]:
+        """
+        Interpreta un cuerpo text/event-stream y entrega pares (event, data).
+        """
+        event, data = None, []
+        async for line in response.aiter_lines():
+            if line == "":
+                if data:
+                    yield event, "\n".join(data)
+                event, data = None, []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].lstrip())
+        if data:
+            yield event, "\n".join(data)
+
+    async def stream_run(
+        self,
+        thread_id: str,
+        tipo_asistente: TipoAsistenteEnum,
+        timeout: float = 10000.0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Crea un run con stream=true y reacciona a los eventos a medida que llegan: en
+        thread.run.requires_action envía los tool outputs (también en streaming) y en
+        thread.run.completed recoge la respuesta, sin esperas entre consultas.
+        Si el stream se corta con el run ya creado, continúa por polling sobre ese run;
+        si el streaming no está disponible, lanza la excepción para que el llamador use polling.
+        """
+        url = self._url(f"/threads/{thread_id}/runs")
+        payload: Dict[str, Any] = {"assistant_id": self.assistant_id, **self.run_options, "stream": True}
+        run_id = None
+        run_status: Dict[str, Any] = {}
+        required_action_response = None
+        try:
+            await self.reservar_tokens_run(thread_id)
+            while True:
+                siguiente = None
+                await self.rate_limiter.adquirir("runs")
+                async with self._client() as client:
+                    async with client.stream("POST", url, headers=self.headers, json=payload, timeout=self.stream_timeout) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            response.raise_for_status()
+                        if "tool_outputs" in payload:
+                            print(f"[{self.transporte.nombre}] Acción requerida completada en run {run_id} ({tipo_asistente.value}) (stream)")
+                        async for event, data in self._iter_sse(response):
+                            if data == "[DONE]":
+                                break
+                            if event == "error":
+                                raise RuntimeError(f"Evento de error en stream: {data}")
+                            if not event or not event.startswith("thread.run.") or event.startswith("thread.run.step"):
+                                continue
+                            run_status = json.loads(data)
+                            run_id = run_status.get("id", run_id)
+                            status = run_status.get("status")
+                            if event == "thread.run.created":
+                                print(f"[{self.transporte.nombre}] Run creado en thread {thread_id}: {run_id} (stream)")
+                            if status == "requires_action" and run_status.get("required_action"):
+                                required_action_response = run_status["required_action"]
+                                siguiente = {"tool_outputs": self._tool_outputs(required_action_response), "stream": True}
+                                break
+                            if status == "completed" or status in self.RUN_TERMINAL_STATUSES:
+                                break
+                if not siguiente:
+                    break
+                url = self._url(f"/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+                payload = siguiente
+        except Exception as e:
+            if not run_id:
+                raise
+            print(f"[{self.transporte.nombre}][WARN] stream_run interrumpido en run {run_id}, se continúa por polling: {str(e)}")
+            return await self.wait_for_required_action(
+                thread_id, run_id, tipo_asistente=tipo_asistente, timeout=timeout,
+                required_action_response=required_action_response
+            )
+
+        status = run_status.get("status")
+        if status == "completed":
+            if not required_action_response and self.reprompt_sin_accion:
+                retry_message = (
+                    "Por favor, ejecuta la función configurada en el assistant y entrega el resultado de la revisión."
+                )
+                await self.create_message(thread_id, retry_message)
+                print(f"[{self.transporte.nombre}] Run adicional en thread {thread_id} (no hubo required_action inicial)")
+                return await self.stream_run(thread_id, tipo_asistente, timeout)
+            assistant_response = await self.get_completed_run_response(thread_id, run_id)
+            print(f"[{self.transporte.nombre}] Run completado en thread {thread_id}: {run_id}")
+            return {
+                "required_action": required_action_response,
+                "assistant_response": assistant_response,
+                "last_run_status": run_status
+            }
+        if status in self.RUN_TERMINAL_STATUSES:
+            print(f"[{self.transporte.nombre}] Run {run_id} estado ({status})")
+            return {
+                "required_action": required_action_response,
+                "assistant_response": status,
+                "last_run_status": run_status
+            }
+        # El stream terminó sin estado final: seguir por polling
+        return await self.wait_for_required_action(
+            thread_id, run_id, tipo_asistente=tipo_asistente, timeout=timeout,
+            required_action_response=required_action_response
+        )
+
     async def get_completed_run_response(self, thread_id: str, run_id: str, max_retries: int = 5, retry_interval: float = 2.0) -> Optional[str]:
         """
         Consulta la respuesta del asistente cuando el run está completado.
         Retorna el contenido de texto de todos los mensajes del asistente, separados por salto de línea.
-        Si la petición falla, reintenta hasta max_retries veces.
+        Si la petición falla con un error transitorio, reintenta hasta max_retries veces.
         """
-        attempt = 0
-        while attempt < max_retries:
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{self.base_url}/threads/{thread_id}/messages",
-                        headers=self.headers
-                    )
-                    response.raise_for_status()
-                    messages = response.json().get("data", [])
-                    assistant_texts = []
-                    for msg in messages:
-                        if msg.get("role") == "assistant":
-                            content = msg.get("content")
-                            if isinstance(content, list):
-                                for c in content:
-                                    if c.get("type") == "text":
-                                        text_obj = c.get("text")
-                                        if isinstance(text_obj, dict):
-                                            assistant_texts.append(text_obj.get("value", ""))
-                                        elif isinstance(text_obj, str):
-                                            assistant_texts.append(text_obj)
-                            elif isinstance(content, str):
-                                assistant_texts.append(content)
-                    return "\n".join(assistant_texts) if assistant_texts else None
-            except httpx.HTTPStatusError as e:
-                print(f"[OpenAI][ERROR] get_completed_run_response intento {attempt+1}: {e.response.status_code} - {e.response.text}")
-            except Exception as e:
-                print(f"[OpenAI][ERROR] get_completed_run_response intento {attempt+1}: {str(e)}")
-            attempt += 1
-            await asyncio.sleep(retry_interval)
-        print(f"[OpenAI][ERROR] get_completed_run_response falló tras {max_retries} intentos para thread {thread_id}, run {run_id}")
-        return None
+        async def consultar():
+            async with self._client() as client:
+                response = await client.get(
+                    self._url(f"/threads/{thread_id}/messages"),
+                    headers=self.headers
+                )
+                response.raise_for_status()
+                return response.json().get("data", [])
+
+        try:
+            messages = await self._reintentar(
+                "threads", f"get_completed_run_response run {run_id}", consultar, max_retries, retry_interval, limite="polling"
+            )
+        except httpx.HTTPStatusError as e:
+            print(f"[{self.transporte.nombre}][ERROR] get_completed_run_response falló para thread {thread_id}, run {run_id}: {e.response.status_code} - {e.response.text}")
+            return None
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] get_completed_run_response falló para thread {thread_id}, run {run_id}: {str(e)}")
+            return None
+        assistant_texts = []
+        for msg in messages:
+            if msg.get("role") == "assistant":
+                content = msg.get("content")
+                if isinstance(content, list):
+                    for c in content:
+                        if c.get("type") == "text":
+                            text_obj = c.get("text")
+                            if isinstance(text_obj, dict):
+                                assistant_texts.append(text_obj.get("value", ""))
+                            elif isinstance(text_obj, str):
+                                assistant_texts.append(text_obj)
+                elif isinstance(content, str):
+                    assistant_texts.append(content)
+        return "\n".join(assistant_texts) if assistant_texts else None
 
     async def run_assistant_flow(
         self,
         user_message: str,
         tipo_asistente: TipoAsistenteEnum,
-        file_ids: Optional[List[str]] = None
+        file_ids: Optional[List[str]] = None,
+        vector_store_id: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """
-        Ejecuta el flujo completo: crea hilo, mensaje (con archivos si hay), run y espera el llamado a función.
+        Ejecuta el flujo completo: crea hilo, mensaje, run y espera el llamado a función.
+        Si se indica vector_store_id, el hilo usa ese vector store para file_search (los archivos
+        no se adjuntan al mensaje).
         Retorna el required_action si se dispara, None si termina sin requerir acción.
         """
         try:
-            thread_id = await self.create_thread()
-            #if file_ids:
-            #    await self.create_message_with_files(thread_id, "Estos son los archivos que debes revisar", file_ids)
+            thread_id = await self.create_thread(vector_store_id=vector_store_id)
             await self.create_message(thread_id, user_message)
+            if self.stream_runs:
+                try:
+                    return await self.stream_run(thread_id, tipo_asistente=tipo_asistente)
+                except Exception as e:
+                    print(f"[{self.transporte.nombre}][WARN] Streaming de runs no disponible, se usa polling: {str(e)}")
             run_id = await self.create_run(thread_id)
             result = await self.wait_for_required_action(thread_id, run_id, tipo_asistente=tipo_asistente)
             return result
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] run_assistant_flow {tipo_asistente.value} {e.response.status_code} - {e.response.text}")
+            print(f"[{self.transporte.nombre}][ERROR] run_assistant_flow {tipo_asistente.value} {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] run_assistant_flow Unexpected error: {str(e)}")
+            print(f"[{self.transporte.nombre}][ERROR] run_assistant_flow Unexpected error: {str(e)}")
             return None
 
     async def upload_file_from_formdata(self, file, filename: str, purpose: str = "assistants") -> Optional[Dict[str, Any]]:
@@ -299,154 +508,242 @@ class OpenAIAssistant:
         Sube un archivo recibido como FormData (por ejemplo, desde FastAPI) al API de OpenAI.
         """
         try:
-            async with httpx.AsyncClient() as client:
-                files = {"file": (filename, await file.read(), "application/octet-stream")}
-                data = {"purpose": purpose}
-                response = await client.post(
-                    f"{self.base_url}/files",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "OpenAI-Beta": "assistants=v2"
-                    },
-                    data=data,
-                    files=files
-                )
-                response.raise_for_status()
-                file_id = response.json().get("id")
-                print(f"[OpenAI] Archivo subido: {file_id} ({filename})")
-                return response.json()
+            file_bytes = await file.read()
+
+            async def subir():
+                async with self._client() as client:
+                    files = {"file": (filename, file_bytes, "application/octet-stream")}
+                    data = {"purpose": purpose}
+                    response = await client.post(
+                        self._url("/files"),
+                        headers=self.transporte.headers,
+                        data=data,
+                        files=files
+                    )
+                    response.raise_for_status()
+                    return response.json()
+
+            resultado = await self._reintentar("files", f"upload {filename}", subir)
+            print(f"[{self.transporte.nombre}] Archivo subido: {resultado.get('id')} ({filename})")
+            return resultado
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] Upload file:{filename} {e.response.status_code} - {e.response.text}")
+            print(f"[{self.transporte.nombre}][ERROR] Upload file:{filename} {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
+            print(f"[{self.transporte.nombre}][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
             return None     
 
-    async def upload_file_from_formdata_v2(self, file, filename: str, purpose: str = "assistants") -> Optional[Dict[str, Any]]:
+    async def upload_file_from_formdata_v2(self, file, filename: str, purpose: str = "assistants",
+                                           mime_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Sube un archivo recibido como FormData (por ejemplo, desde FastAPI) al API de OpenAI.
-        Si el archivo es Excel, lo convierte a CSV antes de subirlo.
-        Excluye archivos de imagen.
+        Si el archivo es Excel, convierte todas sus hojas a texto CSV antes de subirlo.
+        Qué archivos se suben lo decide el clasificador por contenido (services/clasificacion.py), que ya
+        excluye imágenes y formatos no indexables. mime_type es el tipo que detectó; si no se indica se usa
+        application/octet-stream.
         """
         try:
-            image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
-            if filename.lower().endswith(image_extensions):
-                print(f"[OpenAI][INFO] Archivo excluido por ser imagen: {filename}")
-                return None
             file_bytes = await file.read()
             # Detecta si es un archivo Excel por la extensión
             if filename.lower().endswith(('.xlsx', '.xls')):
-                # Convierte el Excel a CSV
-                excel_io = io.BytesIO(file_bytes)
-                df = pd.read_excel(excel_io)
-                csv_buffer = io.StringIO()
-                df.to_csv(csv_buffer, index=False)
-                file_bytes = csv_buffer.getvalue().encode('utf-8')
+                # Convierte todas las hojas a texto CSV en el pool de procesos (con cache por contenido)
+                file_bytes = await convertir_excel_a_texto(file_bytes)
                 filename = filename.rsplit('.', 1)[0] + ".txt"
                 mime_type = "text"
             else:
-                mime_type = "application/octet-stream"
-            async with httpx.AsyncClient() as client:
-                files = {"file": (filename, file_bytes, mime_type)}
-                data = {"purpose": purpose}
-                response = await client.post(
-                    f"{self.base_url}/files",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "OpenAI-Beta": "assistants=v2"
-                    },
-                    data=data,
-                    files=files
-                )
-                response.raise_for_status()
-                file_id = response.json().get("id")
-                print(f"[OpenAI] Archivo subido: {file_id} ({filename})")
-                return response.json()
+                mime_type = mime_type or "application/octet-stream"
+
+            async def subir():
+                async with self._client() as client:
+                    files = {"file": (filename, file_bytes, mime_type)}
+                    data = {"purpose": purpose}
+                    response = await client.post(
+                        self._url("/files"),
+                        headers=self.transporte.headers,
+                        data=data,
+                        files=files
+                    )
+                    response.raise_for_status()
+                    return response.json()
+
+            resultado = await self._reintentar("files", f"upload {filename}", subir)
+            print(f"[{self.transporte.nombre}] Archivo subido: {resultado.get('id')} ({filename})")
+            return resultado
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] Upload file:{filename} {e.response.status_code} - {e.response.text}")
+            print(f"[{self.transporte.nombre}][ERROR] Upload file:{filename} {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
+            print(f"[{self.transporte.nombre}][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
             return None
 
-    async def depureFiles(self):
+    async def file_exists(self, file_id: str) -> bool:
+        """
+        Verifica que un archivo siga existiendo (por ejemplo, antes de reutilizarlo desde cache).
+        Solo un 404 cuenta como inexistente: los errores transitorios se reintentan y, si persisten,
+        se asume que existe para no invalidar una entrada de cache que otra solicitud está usando.
+        """
+        async def consultar():
+            async with self._client() as client:
+                response = await client.get(
+                    self._url(f"/files/{file_id}"),
+                    headers=self.headers
+                )
+                if response.status_code == 404:
+                    return False
+                response.raise_for_status()
+                return True
+
+        try:
+            return await self._reintentar("files", f"file_exists {file_id}", consultar)
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][WARN] file_exists {file_id} sin verificar, se asume existente: {str(e)}")
+            return True
+
+    async def depureFiles(self, keep_file_ids: Optional[set] = None, min_age_seconds: float = 0):
         """
-        Consulta todos los archivos en OpenAI y los elimina uno por uno.
+        Consulta todos los archivos en OpenAI y los elimina uno por uno,
+        excepto los indicados en keep_file_ids (referencias vivas en la cache de anexos)
+        y los creados hace menos de min_age_seconds (posiblemente en uso por otra solicitud).
         """
+        limite = time.time() - min_age_seconds
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._client() as client:
                 # Obtener la lista de archivos
+                await self.rate_limiter.adquirir("files")
                 response = await client.get(
-                    f"{self.base_url}/files",
+                    self._url("/files"),
                     headers=self.headers
                 )
                 response.raise_for_status()
                 files = response.json().get("data", [])
-                print(f"[OpenAI] Archivos encontrados: {len(files)}")
+                print(f"[{self.transporte.nombre}] Archivos encontrados: {len(files)}")
                 # Eliminar cada archivo
                 for file in files:
                     file_id = file.get("id")
-                    if file_id:
+                    if min_age_seconds and file.get("created_at", 0) > limite:
+                        continue
+                    if file_id and (not keep_file_ids or file_id not in keep_file_ids):
+                        await self.rate_limiter.adquirir("files")
                         del_response = await client.delete(
-                            f"{self.base_url}/files/{file_id}",
+                            self._url(f"/files/{file_id}"),
                             headers=self.headers
                         )
                         if del_response.status_code == 200:
-                            print(f"[OpenAI] Archivo eliminado: {file_id}")
+                            print(f"[{self.transporte.nombre}] Archivo eliminado: {file_id}")
                         else:
-                            print(f"[OpenAI][ERROR] No se pudo eliminar archivo: {file_id} - {del_response.status_code}")
+                            print(f"[{self.transporte.nombre}][ERROR] No se pudo eliminar archivo: {file_id} - {del_response.status_code}")
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] depureFiles Unexpected error: {str(e)}")
+
+    async def depureFilesV2(self, current_file_ids: list):
+        """
+        Elimina solo los archivos cuyos IDs estén en current_file_ids.
+        """
+        try:
+            async with self._client() as client:
+                for file_id in current_file_ids:
+                    await self.rate_limiter.adquirir("files")
+                    del_response = await client.delete(
+                        self._url(f"/files/{file_id}"),
+                        headers=self.headers
+                    )
+                    if del_response.status_code == 200:
+                        print(f"[{self.transporte.nombre}] Archivo eliminado: {file_id}")
+                    else:
+                        print(f"[{self.transporte.nombre}][ERROR] No se pudo eliminar archivo: {file_id} - {del_response.status_code}")
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] depureFilesV2 Unexpected error: {str(e)}")
+
+    async def create_vector_store(self, name: str, expires_after_days: Optional[int] = None) -> Optional[str]:
+        """
+        Crea un vector store dedicado (por ejemplo, uno por solicitud). Con expires_after_days,
+        OpenAI lo elimina solo tras ese tiempo sin actividad, como respaldo si la limpieza no corre.
+        """
+        payload: Dict[str, Any] = {"name": name}
+        if expires_after_days:
+            payload["expires_after"] = {"anchor": "last_active_at", "days": expires_after_days}
+
+        async def crear():
+            async with self._client() as client:
+                response = await client.post(
+                    self._url("/vector_stores"),
+                    headers=self.headers,
+                    json=payload
+                )
+                response.raise_for_status()
+                return response.json()["id"]
+
+        try:
+            vector_store_id = await self._reintentar("vector_stores", f"create_vector_store {name}", crear)
+            print(f"[{self.transporte.nombre}] Vector store creado: {vector_store_id} ({name})")
+            return vector_store_id
+        except httpx.HTTPStatusError as e:
+            print(f"[{self.transporte.nombre}][ERROR] create_vector_store {e.response.status_code} - {e.response.text}")
+            return None
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] create_vector_store Unexpected error: {str(e)}")
+            return None
+
+    async def delete_vector_store(self, vector_store_id: str) -> bool:
+        """
+        Elimina un vector store (los archivos siguen existiendo en /files).
+        """
+        try:
+            async with self._client() as client:
+                await self.rate_limiter.adquirir("vector_stores")
+                response = await client.delete(
+                    self._url(f"/vector_stores/{vector_store_id}"),
+                    headers=self.headers
+                )
+                response.raise_for_status()
+                print(f"[{self.transporte.nombre}] Vector store eliminado: {vector_store_id}")
+                return True
         except Exception as e:
-            print(f"[OpenAI][ERROR] depureFiles Unexpected error: {str(e)}")
+            print(f"[{self.transporte.nombre}][ERROR] delete_vector_store {vector_store_id}: {str(e)}")
+            return False
 
     async def add_files_to_vector_store(self, vector_store_id: str, file_ids: List[str]) -> Optional[List[Dict[str, Any]]]:
         """
         Agrega archivos a un vector store existente en OpenAI, uno por uno.
-        Reintenta hasta 3 veces por archivo si la API falla.
+        Reintenta los errores transitorios de cada archivo según la política de reintentos.
         Retorna la lista de respuestas del API.
         """
         results = []
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._client() as client:
                 for file_id in file_ids:
-                    payload = {"file_id": file_id}
-                    attempts = 0
-                    success = False
-                    while attempts < 3 and not success:
-                        try:
-                            response = await client.post(
-                                f"{self.base_url}/vector_stores/{vector_store_id}/files",
-                                headers=self.headers,
-                                json=payload
-                            )
-                            if response.status_code == 200:
-                                print(f"[OpenAI] Archivo {file_id} agregado al vector store {vector_store_id}")
-                                results.append(response.json())
-                                success = True
-                            else:
-                                print(f"[OpenAI][ERROR] add_files_to_vector_store {response.status_code} - {response.text}")
-                                attempts += 1
-                                if attempts < 3:
-                                    await asyncio.sleep(2)
-                        except Exception as e:
-                            attempts += 1
-                            print(f"[OpenAI][ERROR] add_files_to_vector_store intento {attempts} para archivo {file_id}: {str(e)}")
-                            if attempts < 3:
-                                await asyncio.sleep(2)
+                    async def agregar():
+                        response = await client.post(
+                            self._url(f"/vector_stores/{vector_store_id}/files"),
+                            headers=self.headers,
+                            json={"file_id": file_id}
+                        )
+                        response.raise_for_status()
+                        return response.json()
+
+                    try:
+                        results.append(await self._reintentar("vector_stores", f"add_files_to_vector_store {file_id}", agregar))
+                        print(f"[{self.transporte.nombre}] Archivo {file_id} agregado al vector store {vector_store_id}")
+                    except httpx.HTTPStatusError as e:
+                        print(f"[{self.transporte.nombre}][ERROR] add_files_to_vector_store {e.response.status_code} - {e.response.text}")
+                    except Exception as e:
+                        print(f"[{self.transporte.nombre}][ERROR] add_files_to_vector_store para archivo {file_id}: {str(e)}")
             return results
         except Exception as e:
-            print(f"[OpenAI][ERROR] add_files_to_vector_store Unexpected error: {str(e)}")
+            print(f"[{self.transporte.nombre}][ERROR] add_files_to_vector_store Unexpected error: {str(e)}")
             return None
 
     async def delete_all_files_from_vector_store(self, vector_store_id: str) -> bool:
         """
         Elimina todos los archivos de un vector store en OpenAI.
-        Reintenta hasta 3 veces por archivo si la API falla.
+        Reintenta los errores transitorios de cada archivo según la política de reintentos.
         """
         try:
             # Obtener la lista de archivos en el vector store
-            async with httpx.AsyncClient() as client:
+            async with self._client() as client:
+                await self.rate_limiter.adquirir("vector_stores")
                 response = await client.get(
-                    f"{self.base_url}/vector_stores/{vector_store_id}/files",
+                    self._url(f"/vector_stores/{vector_store_id}/files"),
                     headers=self.headers
                 )
                 response.raise_for_status()
@@ -454,28 +751,208 @@ class OpenAIAssistant:
                 file_ids = [f.get("id") for f in files if f.get("id")]
                 # Eliminar cada archivo con reintentos
                 for file_id in file_ids:
-                    attempts = 0
-                    success = False
-                    while attempts < 3 and not success:
-                        try:
-                            del_response = await client.delete(
-                                f"{self.base_url}/vector_stores/{vector_store_id}/files/{file_id}",
-                                headers=self.headers
-                            )
-                            if del_response.status_code == 200:
-                                print(f"[OpenAI] Archivo {file_id} eliminado del vector store {vector_store_id}")
-                                success = True
-                            else:
-                                print(f"[OpenAI][ERROR] No se pudo eliminar archivo {file_id} del vector store {vector_store_id} - {del_response.status_code}")
-                                attempts += 1
-                                if attempts < 3:
-                                    await asyncio.sleep(2)
-                        except Exception as e:
-                            attempts += 1
-                            print(f"[OpenAI][ERROR] delete_all_files_from_vector_store intento {attempts} para archivo {file_id}: {str(e)}")
-                            if attempts < 3:
-                                await asyncio.sleep(2)
+                    async def eliminar():
+                        del_response = await client.delete(
+                            self._url(f"/vector_stores/{vector_store_id}/files/{file_id}"),
+                            headers=self.headers
+                        )
+                        del_response.raise_for_status()
+
+                    try:
+                        await self._reintentar("vector_stores", f"delete_all_files_from_vector_store {file_id}", eliminar)
+                        print(f"[{self.transporte.nombre}] Archivo {file_id} eliminado del vector store {vector_store_id}")
+                    except httpx.HTTPStatusError as e:
+                        print(f"[{self.transporte.nombre}][ERROR] No se pudo eliminar archivo {file_id} del vector store {vector_store_id} - {e.response.status_code}")
+                    except Exception as e:
+                        print(f"[{self.transporte.nombre}][ERROR] delete_all_files_from_vector_store para archivo {file_id}: {str(e)}")
             return True
         except Exception as e:
-            print(f"[OpenAI][ERROR] delete_all_files_from_vector_store Unexpected error: {str(e)}")
-            return False
\ No newline at end of file
+            print(f"[{self.transporte.nombre}][ERROR] delete_all_files_from_vector_store Unexpected error: {str(e)}")
+            return False
+    async def list_vector_store_files(
+        self,
+        vector_store_id: str,
+        batch_id: Optional[str] = None,
+        status_filter: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista (paginando) los archivos de un vector store, o de un file batch si se indica batch_id.
+        status_filter acepta los valores del API: in_progress, completed, failed, cancelled.
+        """
+        if batch_id:
+            ruta = f"/vector_stores/{vector_store_id}/file_batches/{batch_id}/files"
+        else:
+            ruta = f"/vector_stores/{vector_store_id}/files"
+        params: Dict[str, Any] = {"limit": 100}
+        if status_filter:
+            params["filter"] = status_filter
+        files = []
+        async with self._client() as client:
+            while True:
+                await self.rate_limiter.adquirir("polling")
+                response = await client.get(self._url(ruta, params), headers=self.headers)
+                response.raise_for_status()
+                body = response.json()
+                data = body.get("data", [])
+                files.extend(data)
+                if not body.get("has_more") or not data:
+                    return files
+                params["after"] = data[-1].get("id")
+
+    async def wait_for_vector_store_files(
+        self,
+        vector_store_id: str,
+        file_ids: Optional[List[str]] = None,
+        batch_id: Optional[str] = None,
+        timeout: float = 300.0,
+        initial_interval: float = 1.0,
+        max_interval: float = 15.0,
+        backoff: float = 1.5,
+        fail_fast: bool = True
+    ) -> Dict[str, List[str]]:
+        """
+        Espera a que el vector store termine de indexar los archivos indicados (o el file batch).
+        Consulta con backoff adaptativo (initial_interval * backoff^n, hasta max_interval) y retorna
+        en cuanto todos los archivos estén 'completed', o antes si alguno queda en 'failed'/'cancelled'
+        (con fail_fast=False espera a que no quede ninguno en proceso).
+        Retorna {"completed": [...], "failed": [...], "pending": [...]}; si vence el plazo, los
+        archivos sin terminar quedan en "pending".
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        interval = initial_interval
+        pendientes = list(file_ids or [])
+        estado = {"completed": [], "failed": [], "pending": pendientes}
+        if not pendientes and not batch_id:
+            return estado
+        while True:
+            try:
+                if batch_id:
+                    await self.rate_limiter.adquirir("polling")
+                    async with self._client() as client:
+                        response = await client.get(
+                            self._url(f"/vector_stores/{vector_store_id}/file_batches/{batch_id}"),
+                            headers=self.headers
+                        )
+                        response.raise_for_status()
+                        counts = response.json().get("file_counts", {})
+                    terminado = counts.get("in_progress", 0) == 0
+                    fallo = counts.get("failed", 0) or counts.get("cancelled", 0)
+                    if terminado or (fail_fast and fallo):
+                        files = await self.list_vector_store_files(vector_store_id, batch_id=batch_id)
+                    else:
+                        files = None
+                else:
+                    files = await self.list_vector_store_files(vector_store_id)
+                if files is not None:
+                    objetivo = set(file_ids) if file_ids else {f.get("id") for f in files}
+                    status_by_id = {f.get("id"): f.get("status") for f in files if f.get("id") in objetivo}
+                    estado = {
+                        "completed": [fid for fid, st in status_by_id.items() if st == "completed"],
+                        "failed": [fid for fid, st in status_by_id.items() if st in ("failed", "cancelled")],
+                        "pending": [fid for fid in objetivo if status_by_id.get(fid) not in ("completed", "failed", "cancelled")]
+                    }
+                    print(f"[{self.transporte.nombre}] Vector store {vector_store_id}: {len(estado['completed'])} completados, "
+                          f"{len(estado['failed'])} fallidos, {len(estado['pending'])} pendientes")
+                    if (fail_fast and estado["failed"]) or not estado["pending"]:
+                        return estado
+            except httpx.HTTPStatusError as e:
+                print(f"[{self.transporte.nombre}][ERROR] wait_for_vector_store_files {e.response.status_code} - {e.response.text}")
+            except Exception as e:
+                print(f"[{self.transporte.nombre}][ERROR] wait_for_vector_store_files Unexpected error: {str(e)}")
+            restante = deadline - loop.time()
+            if restante <= 0:
+                print(f"[{self.transporte.nombre}][WARN] wait_for_vector_store_files plazo de {timeout}s vencido en vector store {vector_store_id}")
+                return estado
+            await asyncio.sleep(min(interval, restante))
+            interval = min(interval * backoff, max_interval)
+
+    async def create_vector_store_file_batch(self, vector_store_id: str, file_ids: List[str]) -> Optional[str]:
+        """
+        Adjunta varios archivos al vector store en una sola llamada (file_batches).
+        Retorna el batch_id, o None si falla (tras reintentar los errores transitorios).
+        """
+        async def crear():
+            async with self._client() as client:
+                response = await client.post(
+                    self._url(f"/vector_stores/{vector_store_id}/file_batches"),
+                    headers=self.headers,
+                    json={"file_ids": file_ids}
+                )
+                response.raise_for_status()
+                return response.json()["id"]
+
+        try:
+            batch_id = await self._reintentar("vector_stores", "create_vector_store_file_batch", crear)
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] create_vector_store_file_batch: {str(e)}")
+            return None
+        print(f"[{self.transporte.nombre}] File batch {batch_id} creado en vector store {vector_store_id} ({len(file_ids)} archivos)")
+        return batch_id
+
+    async def add_files_to_vector_store_batch(
+        self,
+        vector_store_id: str,
+        file_ids: List[str],
+        max_retries: int = 3,
+        timeout: float = 300.0,
+        batch_size: int = 500
+    ) -> Dict[str, List[str]]:
+        """
+        Agrega los archivos al vector store mediante file batches (hasta batch_size por lote),
+        espera a que se indexen y reintenta en un nuevo batch solo los archivos que fallaron.
+        timeout es el plazo total de la operación (todos los lotes y reintentos): cada espera recibe
+        el tiempo que queda, y lo que no alcanzó a intentarse queda en "pending".
+        Retorna {"completed": [...], "failed": [...], "pending": [...]}.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        resultado = {"completed": [], "failed": [], "pending": []}
+        for i in range(0, len(file_ids), batch_size):
+            restantes = file_ids[i:i+batch_size]
+            intento = 0
+            while restantes and intento < max_retries:
+                if deadline - loop.time() <= 0:
+                    # Plazo total vencido: lo que no se alcanzó a intentar sigue pendiente y lo que ya falló, fallido
+                    if not intento:
+                        resultado["pending"].extend(restantes)
+                        restantes = []
+                    break
+                intento += 1
+                batch_id = await self.create_vector_store_file_batch(vector_store_id, restantes)
+                if not batch_id:
+                    break
+                estado = await self.wait_for_vector_store_files(
+                    vector_store_id, file_ids=restantes, batch_id=batch_id,
+                    timeout=max(deadline - loop.time(), 0), fail_fast=False
+                )
+                resultado["completed"].extend(estado["completed"])
+                if estado["pending"]:
+                    # Plazo vencido: no se reintenta lo que sigue en proceso
+                    resultado["pending"].extend(estado["pending"])
+                restantes = estado["failed"]
+                if restantes:
+                    print(f"[{self.transporte.nombre}][WARN] {len(restantes)} archivos fallaron en batch {batch_id} (intento {intento}/{max_retries})")
+                    if intento < max_retries:
+                        # Quitar la asociación fallida antes de volver a adjuntar el archivo
+                        for file_id in restantes:
+                            await self.remove_file_from_vector_store(vector_store_id, file_id)
+            resultado["failed"].extend(restantes)
+        return resultado
+
+    async def remove_file_from_vector_store(self, vector_store_id: str, file_id: str) -> bool:
+        """
+        Quita un archivo del vector store (no lo elimina de /files).
+        """
+        try:
+            async with self._client() as client:
+                await self.rate_limiter.adquirir("vector_stores")
+                response = await client.delete(
+                    self._url(f"/vector_stores/{vector_store_id}/files/{file_id}"),
+                    headers=self.headers
+                )
+                response.raise_for_status()
+                return True
+        except Exception as e:
+            print(f"[{self.transporte.nombre}][ERROR] remove_file_from_vector_store {file_id}: {str(e)}")
+            return False
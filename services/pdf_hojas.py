@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from io import BytesIO
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from services.excel import LibroExcel
+from services.executors import run_cpu
+
+Tabla = List[List[str]]
+
+MARGEN = 30
+PADDING = 4
+# Fuentes de la tabla: encabezado en negrita 11 y cuerpo con la fuente por defecto de reportlab
+FUENTE_ENCABEZADO, TAMANO_ENCABEZADO = "Helvetica-Bold", 11
+FUENTE_CUERPO, TAMANO_CUERPO = "Helvetica", 10
+ANCHO_MIN_COLUMNA = 36
+ANCHO_MAX_COLUMNA = 220
+# Caracteres que se miden por celda: más allá del ancho máximo la celda se ajusta en varias líneas
+MAX_CARACTERES_MEDIDOS = 60
+
+ESTILO_TABLA = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#dbe5f1")),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor("#17375d")),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), FUENTE_ENCABEZADO),
+    ('FONTSIZE', (0, 0), (-1, 0), TAMANO_ENCABEZADO),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#f2f2f2")]),
+    ('LEFTPADDING', (0, 0), (-1, -1), PADDING),
+    ('RIGHTPADDING', (0, 0), (-1, -1), PADDING),
+]
+
+
+def tabla_hoja(libro: LibroExcel, nombre: str) -> Tabla:
+    """
+    Contenido de la hoja tal como lo mostraba extraer_hojas_excel_a_pdfs (encabezados y filas del DataFrame),
+    convertido a texto para poder medirlo y enviarlo al pool de procesos.
+    """
+    df = libro[nombre].dataframe().fillna("")
+    return [[str(valor) for valor in fila] for fila in [list(df.columns)] + df.values.tolist()]
+
+
+def tablas_excel_bytes(contents: bytes) -> List[Tuple[str, Tabla]]:
+    """
+    [(hoja, tabla)] de todas las hojas con columnas. Recibe bytes para ejecutarse en el pool de procesos.
+    """
+    libro = LibroExcel.desde_bytes(contents)
+    tablas = []
+    for nombre in libro.sheetnames:
+        tabla = tabla_hoja(libro, nombre)
+        if tabla and tabla[0]:
+            tablas.append((nombre, tabla))
+    return tablas
+
+
+def anchos_por_contenido(tabla: Tabla) -> List[float]:
+    """
+    Ancho natural de cada columna según el texto más largo (encabezado incluido), acotado entre
+    ANCHO_MIN_COLUMNA y ANCHO_MAX_COLUMNA.
+    """
+    anchos = []
+    for j, encabezado in enumerate(tabla[0]):
+        ancho = stringWidth(encabezado[:MAX_CARACTERES_MEDIDOS], FUENTE_ENCABEZADO, TAMANO_ENCABEZADO)
+        for fila in tabla[1:]:
+            ancho = max(ancho, stringWidth(fila[j][:MAX_CARACTERES_MEDIDOS], FUENTE_CUERPO, TAMANO_CUERPO))
+        anchos.append(min(max(ancho + 2 * PADDING, ANCHO_MIN_COLUMNA), ANCHO_MAX_COLUMNA))
+    return anchos
+
+
+def distribuir_columnas(anchos: List[float]) -> Tuple[tuple, List[List[int]]]:
+    """
+    Elige la orientación y reparte las columnas en grupos que caben en el ancho útil:
+    vertical si la tabla cabe, horizontal si cabe así, y si no, horizontal con la tabla dividida
+    en varios bloques de columnas (repitiendo la primera columna como referencia si es angosta).
+    """
+    for pagina in (letter, landscape(letter)):
+        if sum(anchos) <= pagina[0] - 2 * MARGEN:
+            return pagina, [list(range(len(anchos)))]
+    pagina = landscape(letter)
+    util = pagina[0] - 2 * MARGEN
+    repetir_primera = anchos[0] <= util * 0.3
+    grupos, actual, ocupado = [], [], anchos[0] if repetir_primera else 0
+    for j in range(1 if repetir_primera else 0, len(anchos)):
+        if actual and ocupado + anchos[j] > util:
+            grupos.append(actual)
+            actual, ocupado = [], anchos[0] if repetir_primera else 0
+        actual.append(j)
+        ocupado += anchos[j]
+    grupos.append(actual)
+    if repetir_primera:
+        grupos = [[0] + grupo for grupo in grupos]
+    return pagina, grupos
+
+
+def renderizar_tabla_pdf(titulo: str, tabla: Tabla) -> bytes:
+    """
+    Renderiza una hoja como PDF en memoria. Recibe y retorna datos serializables para el pool de procesos.
+    """
+    styles = getSampleStyleSheet()
+    estilo_cuerpo = ParagraphStyle("celda", fontName=FUENTE_CUERPO, fontSize=TAMANO_CUERPO,
+                                   leading=TAMANO_CUERPO + 2, alignment=TA_CENTER)
+    estilo_encabezado = ParagraphStyle("encabezado", parent=estilo_cuerpo, fontName=FUENTE_ENCABEZADO,
+                                       fontSize=TAMANO_ENCABEZADO, leading=TAMANO_ENCABEZADO + 2,
+                                       textColor=colors.HexColor("#17375d"))
+    anchos = anchos_por_contenido(tabla)
+    pagina, grupos = distribuir_columnas(anchos)
+    util = pagina[0] - 2 * MARGEN
+
+    elements = [Paragraph(f"Hoja: {escape(titulo)}", styles['Title']), Spacer(1, 12)]
+    for numero, grupo in enumerate(grupos):
+        # Las columnas se estiran en proporción para ocupar el ancho de la página
+        escala = util / sum(anchos[j] for j in grupo)
+        col_widths = [anchos[j] * escala for j in grupo]
+        data = []
+        for i, fila in enumerate(tabla):
+            fuente, tamano, estilo = (FUENTE_ENCABEZADO, TAMANO_ENCABEZADO, estilo_encabezado) if i == 0 \
+                else (FUENTE_CUERPO, TAMANO_CUERPO, estilo_cuerpo)
+            celdas = []
+            for j, ancho in zip(grupo, col_widths):
+                texto = fila[j]
+                # Solo las celdas que no caben se ajustan en varias líneas (Paragraph es más costoso)
+                if stringWidth(texto, fuente, tamano) > ancho - 2 * PADDING:
+                    celdas.append(Paragraph(escape(texto), estilo))
+                else:
+                    celdas.append(texto)
+            data.append(celdas)
+        if len(grupos) > 1:
+            elements.append(Paragraph(f"Columnas {grupo[0] + 1}-{grupo[-1] + 1} de {len(anchos)}", styles['Heading4']))
+        table = Table(data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(TableStyle(ESTILO_TABLA))
+        elements.append(table)
+        if numero < len(grupos) - 1:
+            elements.append(Spacer(1, 18))
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=pagina,
+        leftMargin=MARGEN,
+        rightMargin=MARGEN,
+        topMargin=MARGEN,
+        bottomMargin=MARGEN
+    )
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# Cache por hash del contenido de la hoja (LRU) de los PDFs ya renderizados en este proceso
+_cache_pdfs: "OrderedDict[str, bytes]" = OrderedDict()
+PDF_RENDER_CACHE_MAX_ENTRIES = int(os.getenv("PDF_RENDER_CACHE_MAX_ENTRIES", "64"))
+
+
+def hash_tabla(titulo: str, tabla: Tabla) -> str:
+    return hashlib.sha256(json.dumps([titulo, tabla], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def renderizar_tablas_pdf(tablas: List[Tuple[str, Tabla]]) -> List[bytes]:
+    """
+    Renderiza las hojas en paralelo en el pool de procesos y retorna los PDFs en el mismo orden.
+    Las hojas sin cambios (mismo título y contenido) se toman de la cache sin volver a renderizar.
+    """
+    claves = [hash_tabla(titulo, tabla) for titulo, tabla in tablas]
+
+    async def renderizar(clave: str, titulo: str, tabla: Tabla) -> bytes:
+        pdf = _cache_pdfs.get(clave)
+        if pdf is not None:
+            _cache_pdfs.move_to_end(clave)
+            return pdf
+        pdf = await run_cpu(renderizar_tabla_pdf, titulo, tabla)
+        _cache_pdfs[clave] = pdf
+        while len(_cache_pdfs) > PDF_RENDER_CACHE_MAX_ENTRIES:
+            _cache_pdfs.popitem(last=False)
+        return pdf
+
+    return list(await asyncio.gather(*(renderizar(clave, titulo, tabla) for clave, (titulo, tabla) in zip(claves, tablas))))
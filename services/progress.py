@@ -0,0 +1,59 @@
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional, Set
+
+# Etapas del pipeline de una solicitud: queued, decompressing, uploading, indexing, running, done, failed
+ETAPAS_FINALES = ("done", "failed")
+
+
+class ProgressBus:
+    """
+    Pub/sub en memoria de las transiciones de etapa por solicitud. El pipeline publica y los
+    endpoints SSE / long-poll se suscriben, evitando que los clientes consulten Mongo en bucle.
+    """
+
+    def __init__(self, queue_size: int = 32):
+        self.queue_size = queue_size
+        self._subs: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+    def publish(self, solicitud_id: str, etapa: str, **datos) -> Dict[str, Any]:
+        evento = {"SolicitudID": solicitud_id, "Etapa": etapa, "Fecha": datetime.utcnow().isoformat(), **datos}
+        if etapa in ETAPAS_FINALES:
+            self._last.pop(solicitud_id, None)
+        else:
+            self._last[solicitud_id] = evento
+        for queue in list(self._subs.get(solicitud_id, ())):
+            if queue.full():
+                # Un suscriptor lento solo necesita los eventos más recientes
+                queue.get_nowait()
+            queue.put_nowait(evento)
+        return evento
+
+    def last(self, solicitud_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Último evento publicado en este proceso para una solicitud en curso (None si terminó o si
+        su pipeline corre en otro proceso): los nuevos suscriptores lo usan como etapa actual sin leer Mongo.
+        """
+        return self._last.get(solicitud_id)
+
+    @contextmanager
+    def subscribe(self, solicitud_id: str):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subs[solicitud_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subs[solicitud_id].discard(queue)
+            if not self._subs[solicitud_id]:
+                del self._subs[solicitud_id]
+
+
+def format_sse(evento: Dict[str, Any], event: str = "etapa") -> str:
+    return f"event: {event}\ndata: {json.dumps(evento, ensure_ascii=False, default=str)}\n\n"
+
+
+progress_bus = ProgressBus()
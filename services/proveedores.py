@@ -0,0 +1,149 @@
+import os
+import random
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+import httpx
+
+from models import TipoAsistenteEnum
+from services.retry import host_degradado
+
+
+class AssistantBackend(Protocol):
+    """
+    Operaciones que el pipeline de solicitudes (routers/vigia.py) usa de un assistant. Las implementan
+    OpenAIAssistant y AzureOpenAIAssistant (REST, services/openai_assistant.py) y AzureOpenAISDKAssistant.
+    """
+
+    async def file_exists(self, file_id: str) -> bool: ...
+
+    async def upload_file_from_formdata_v2(self, file, filename: str, purpose: str = "assistants",
+                                           mime_type: Optional[str] = None) -> Optional[Dict[str, Any]]: ...
+
+    async def create_vector_store(self, name: str, expires_after_days: Optional[int] = None) -> Optional[str]: ...
+
+    async def delete_vector_store(self, vector_store_id: str) -> bool: ...
+
+    async def add_files_to_vector_store_batch(self, vector_store_id: str, file_ids: List[str]) -> Dict[str, List[str]]: ...
+
+    async def run_assistant_flow(self, user_message: str, tipo_asistente: TipoAsistenteEnum,
+                                 file_ids: Optional[List[str]] = None,
+                                 vector_store_id: Optional[str] = None) -> Optional[Dict[str, Any]]: ...
+
+    async def depureFiles(self, keep_file_ids: Optional[set] = None, min_age_seconds: float = 0): ...
+
+    async def depureFilesV2(self, current_file_ids: list): ...
+
+
+FabricaAssistant = Callable[[Optional[httpx.AsyncClient]], AssistantBackend]
+
+
+def _streaming() -> bool:
+    return os.getenv("OPENAI_RUN_STREAMING", "true").lower() in ("1", "true", "yes")
+
+
+def _crear_openai(http_client: Optional[httpx.AsyncClient]) -> AssistantBackend:
+    from services.openai_assistant import OpenAIAssistant
+    return OpenAIAssistant(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        assistant_id=os.getenv("OPENAI_ASSISTANT_ID"),
+        http_client=http_client,
+        stream_runs=_streaming()
+    )
+
+
+def _crear_azure(http_client: Optional[httpx.AsyncClient]) -> AssistantBackend:
+    from services.azureOpenAI import AzureOpenAIAssistant
+    return AzureOpenAIAssistant(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+        assistant_id=os.getenv("AZURE_OPENAI_ASSISTANT_ID"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-05-01-preview"),
+        http_client=http_client,
+        stream_runs=_streaming()
+    )
+
+
+def _crear_azure_sdk(http_client: Optional[httpx.AsyncClient]) -> AssistantBackend:
+    # El SDK de openai es opcional: solo se importa si se elige este proveedor
+    from services.azureOpenAISDK import AzureOpenAISDKAssistant
+    return AzureOpenAISDKAssistant(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+        assistant_id=os.getenv("AZURE_OPENAI_ASSISTANT_ID"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-05-01-preview"),
+        http_client=http_client,
+        stream_runs=_streaming()
+    )
+
+
+def _host_openai() -> str:
+    return httpx.URL("https://api.openai.com/v1").host
+
+
+def _host_azure() -> str:
+    return httpx.URL(os.getenv("AZURE_OPENAI_ENDPOINT", "")).host
+
+
+# Proveedores registrados: nombre -> (fábrica del assistant, host de su cuota)
+_proveedores: Dict[str, Tuple[FabricaAssistant, Callable[[], str]]] = {
+    "openai": (_crear_openai, _host_openai),
+    "azure": (_crear_azure, _host_azure),
+    "azure_sdk": (_crear_azure_sdk, _host_azure),
+}
+
+
+def registrar_proveedor(nombre: str, fabrica: FabricaAssistant, host: Callable[[], str]):
+    """
+    Registra (o reemplaza) un proveedor: fabrica(http_client) crea el assistant y host() retorna
+    el host de su cuota, para saber si está degradado sin crear el assistant.
+    """
+    _proveedores[nombre] = (fabrica, host)
+
+
+def crear_assistant(nombre: Optional[str] = None, http_client: Optional[httpx.AsyncClient] = None) -> AssistantBackend:
+    """
+    Crea el assistant del proveedor indicado (por defecto ASSISTANT_PROVIDER, "openai").
+    """
+    nombre = nombre or os.getenv("ASSISTANT_PROVIDER", "openai")
+    if nombre not in _proveedores:
+        raise ValueError(f"Proveedor de assistant desconocido: {nombre} (registrados: {', '.join(_proveedores)})")
+    fabrica, _ = _proveedores[nombre]
+    return fabrica(http_client)
+
+
+def pesos_proveedores() -> Dict[str, float]:
+    """
+    Pesos de ASSISTANT_PROVIDERS ("openai:3,azure:1"); sin esa variable, solo ASSISTANT_PROVIDER con peso 1.
+    Un peso 0 deja al proveedor solo como respaldo cuando los demás están degradados.
+    """
+    valor = os.getenv("ASSISTANT_PROVIDERS", "").strip()
+    if not valor:
+        return {os.getenv("ASSISTANT_PROVIDER", "openai"): 1.0}
+    pesos = {}
+    for parte in valor.split(","):
+        nombre, _, peso = parte.strip().partition(":")
+        if nombre:
+            pesos[nombre] = float(peso) if peso else 1.0
+    return pesos
+
+
+def elegir_proveedor(pesos: Optional[Dict[str, float]] = None) -> str:
+    """
+    Elige el proveedor para una solicitud completa: los file_id y vector stores son de cada proveedor,
+    así que el failover se decide al empezar y no a mitad del pipeline.
+    - Se sortea por peso entre los proveedores sanos (sin circuitos abiertos ni pausa por 429 en su host).
+    - Si todos los de peso positivo están degradados, se usa un sano de peso 0 (respaldo).
+    - Si ninguno está sano, se sortea entre todos: los reintentos esperan a que el circuito deje pasar.
+    """
+    pesos = {nombre: peso for nombre, peso in (pesos or pesos_proveedores()).items() if nombre in _proveedores}
+    if not pesos:
+        return os.getenv("ASSISTANT_PROVIDER", "openai")
+    sanos = [nombre for nombre in pesos if not host_degradado(_proveedores[nombre][1]())]
+    candidatos = [nombre for nombre in sanos if pesos[nombre] > 0] or sanos or list(pesos)
+    total = sum(pesos[nombre] for nombre in candidatos)
+    if total <= 0:
+        return candidatos[0]
+    elegido = random.choices(candidatos, weights=[pesos[nombre] for nombre in candidatos])[0]
+    if len(sanos) < len(pesos):
+        print(f"[Proveedores][WARN] Degradados: {', '.join(n for n in pesos if n not in sanos)}; se usa {elegido}")
+    return elegido
@@ -0,0 +1,177 @@
+import asyncio
+import math
+import os
+import random
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Clases de endpoint con presupuesto propio de requests por minuto, y el presupuesto de tokens por minuto.
+# Variables de entorno: RATE_LIMIT_<CLASE>_RPM y RATE_LIMIT_TPM (0 = sin límite).
+CLASES_LIMITE = {
+    "threads": 120,
+    "files": 120,
+    "vector_stores": 120,
+    "runs": 60,
+    "polling": 300,
+}
+CLASE_TOKENS = "tokens"
+
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimación de tokens de un texto sin tokenizador (~4 caracteres por token en español e inglés).
+    """
+    return math.ceil(len(texto or "") / 4)
+
+
+class TokenBucket:
+    """
+    Token bucket asíncrono: se recarga a por_minuto / 60 unidades por segundo hasta `capacidad`.
+    Las esperas se atienden en orden de llegada. Un pedido mayor que la capacidad (p. ej. un prompt
+    largo contra el presupuesto de tokens) espera al bucket lleno y lo deja en negativo, de modo que
+    los siguientes esperan lo que corresponde.
+    """
+
+    def __init__(self, por_minuto: float, capacidad: Optional[float] = None, reloj: Callable[[], float] = time.monotonic):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = max(capacidad if capacidad is not None else self.tasa, 1.0)
+        self.reloj = reloj
+        self.disponibles = self.capacidad
+        self.actualizado = reloj()
+        self._lock = asyncio.Lock()
+
+    def _recargar(self):
+        ahora = self.reloj()
+        self.disponibles = min(self.capacidad, self.disponibles + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+
+    def espera_necesaria(self, cantidad: float) -> float:
+        self._recargar()
+        faltante = min(cantidad, self.capacidad) - self.disponibles
+        return max(faltante / self.tasa, 0.0)
+
+    async def adquirir(self, cantidad: float = 1):
+        async with self._lock:
+            espera = self.espera_necesaria(cantidad)
+            while espera > 0:
+                await asyncio.sleep(espera)
+                espera = self.espera_necesaria(cantidad)
+            self.disponibles -= cantidad
+
+
+class ContadorMongo:
+    """
+    Contador compartido entre workers (varios procesos o máquinas) en ventanas fijas de un minuto:
+    cada reserva incrementa atómicamente el uso de la ventana y, si supera el límite, se devuelve
+    y se espera a la ventana siguiente. Los documentos expiran solos con un índice TTL.
+    """
+
+    def __init__(self, collection, ventana_segundos: float = 60):
+        self.collection = collection
+        self.ventana = ventana_segundos
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index([("Clave", 1), ("Ventana", 1)], unique=True)
+        await self.collection.create_index("Expira", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    async def reservar(self, clave: str, cantidad: float, limite_por_ventana: float):
+        await self.ensure_indexes()
+        while True:
+            ahora = time.time()
+            ventana = int(ahora // self.ventana)
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"Clave": clave, "Ventana": ventana},
+                    {
+                        "$inc": {"Usados": cantidad},
+                        "$setOnInsert": {"Expira": datetime.utcfromtimestamp((ventana + 2) * self.ventana)}
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Otro worker creó la ventana al mismo tiempo: se vuelve a intentar sobre el documento existente
+                continue
+            # Un pedido mayor que el límite pasa solo si es el primero de la ventana
+            if doc["Usados"] <= limite_por_ventana or doc["Usados"] == cantidad:
+                return
+            await self.collection.update_one({"_id": doc["_id"]}, {"$inc": {"Usados": -cantidad}})
+            await asyncio.sleep((ventana + 1) * self.ventana - ahora + random.uniform(0, 1))
+
+
+class RateLimiter:
+    """
+    Presupuesto de requests por minuto por clase de endpoint (CLASES_LIMITE) y de tokens por minuto,
+    para repartir las llamadas bajo los límites de la cuenta en lugar de provocar 429 y reintentar.
+    Cada clase usa un TokenBucket en el proceso; con un ContadorMongo, además, el límite se comparte
+    entre todos los workers. El burst permitido es RATE_LIMIT_BURST_SECONDS segundos de presupuesto.
+    """
+
+    def __init__(self, nombre: str, limites: Dict[str, float], burst_segundos: float = 1.0,
+                 contador: Optional[ContadorMongo] = None):
+        self.nombre = nombre
+        self.limites = {clase: limite for clase, limite in limites.items() if limite > 0}
+        self.contador = contador
+        self.buckets = {
+            clase: TokenBucket(limite, capacidad=limite * burst_segundos / 60.0)
+            for clase, limite in self.limites.items()
+        }
+
+    @classmethod
+    def desde_entorno(cls, nombre: str, contador: Optional[ContadorMongo] = None) -> "RateLimiter":
+        limites = {
+            clase: float(os.getenv(f"RATE_LIMIT_{clase.upper()}_RPM", str(defecto)))
+            for clase, defecto in CLASES_LIMITE.items()
+        }
+        limites[CLASE_TOKENS] = float(os.getenv("RATE_LIMIT_TPM", "0"))
+        return cls(nombre, limites, burst_segundos=float(os.getenv("RATE_LIMIT_BURST_SECONDS", "1")), contador=contador)
+
+    async def adquirir(self, clase: str, cantidad: float = 1):
+        """
+        Espera hasta que haya presupuesto para `cantidad` requests (o tokens) de la clase.
+        Las clases sin límite configurado no esperan.
+        """
+        bucket = self.buckets.get(clase)
+        if bucket is None:
+            return
+        await bucket.adquirir(cantidad)
+        if self.contador is not None:
+            try:
+                await self.contador.reservar(f"{self.nombre}:{clase}", cantidad, self.limites[clase])
+            except Exception as e:
+                # Sin Mongo se sigue con el límite local del proceso
+                print(f"[RateLimit][WARN] Contador compartido no disponible ({self.nombre}:{clase}): {str(e)}")
+
+    async def adquirir_tokens(self, tokens: int):
+        await self.adquirir(CLASE_TOKENS, tokens)
+
+
+# Limitadores por host (api.openai.com, cada recurso de Azure), compartidos por todos los assistants del proceso
+_limitadores: Dict[str, RateLimiter] = {}
+_contador_compartido: Optional[ContadorMongo] = None
+
+
+def configurar_contador_compartido(contador: Optional[ContadorMongo]):
+    """
+    Activa (o desactiva con None) el contador en Mongo para los limitadores que se creen desde ahora
+    y los ya creados.
+    """
+    global _contador_compartido
+    _contador_compartido = contador
+    for limitador in _limitadores.values():
+        limitador.contador = contador
+
+
+def obtener_rate_limiter(nombre: str) -> RateLimiter:
+    limitador = _limitadores.get(nombre)
+    if limitador is None:
+        limitador = _limitadores[nombre] = RateLimiter.desde_entorno(nombre, contador=_contador_compartido)
+    return limitador
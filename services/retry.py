@@ -0,0 +1,265 @@
+import asyncio
+import os
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# 408 (timeout), 409 (conflicto transitorio) y 429 (rate limit); además todos los 5xx
+STATUS_REINTENTABLES = {408, 409, 429}
+
+# Duraciones de x-ratelimit-reset-*: "1s", "6m0s", "20ms", "1h2m3.5s"
+_RE_DURACION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIDADES = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class CircuitoAbiertoError(Exception):
+    """
+    El circuito del endpoint está abierto: la llamada no se envía hasta que pase el tiempo de apertura.
+    """
+
+    def __init__(self, nombre: str, restante: float):
+        super().__init__(f"circuito {nombre} abierto ({restante:.1f}s restantes)")
+        self.nombre = nombre
+        self.restante = restante
+
+
+def es_reintentable(error: BaseException) -> bool:
+    """
+    Errores transitorios que vale la pena reintentar: status de STATUS_REINTENTABLES, fallas de red
+    o timeouts, y circuito abierto. Los demás 4xx (400, 401, 404...) fallan igual al reintentar.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in STATUS_REINTENTABLES or error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, CircuitoAbiertoError))
+
+
+def parsear_duracion(valor: str) -> Optional[float]:
+    """
+    Segundos de una duración con unidades ("6m0s", "20ms") o de un número simple ("1.5").
+    """
+    valor = valor.strip()
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    partes = _RE_DURACION.findall(valor)
+    if not partes or "".join(n + u for n, u in partes) != valor:
+        return None
+    return sum(float(numero) * _UNIDADES[unidad] for numero, unidad in partes)
+
+
+def espera_indicada(response: httpx.Response) -> Optional[float]:
+    """
+    Segundos que el servidor pide esperar antes de reintentar, según (en orden de prioridad)
+    retry-after-ms, Retry-After (segundos o fecha HTTP) y x-ratelimit-reset-requests/-tokens
+    (del límite agotado; si no se informa cuál, el mayor). None si la respuesta no indica nada.
+    """
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        try:
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        valor = headers["retry-after"].strip()
+        try:
+            return max(float(valor), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    resets = {}
+    for limite in ("requests", "tokens"):
+        valor = headers.get(f"x-ratelimit-reset-{limite}")
+        segundos = parsear_duracion(valor) if valor else None
+        if segundos is not None:
+            resets[limite] = segundos
+    if not resets:
+        return None
+    agotados = [segundos for limite, segundos in resets.items() if headers.get(f"x-ratelimit-remaining-{limite}") == "0"]
+    return max(agotados or resets.values())
+
+
+class PoliticaReintentos:
+    """
+    Reintentos con backoff exponencial y jitter completo: antes del intento n+1 se espera un tiempo
+    aleatorio entre 0 y min(max_espera, base * 2^(n-1)), para que las solicitudes que fallaron a la vez
+    no reintenten todas en el mismo instante. Si el servidor indica cuánto esperar (429 con Retry-After
+    o x-ratelimit-reset-*), se respeta esa espera (hasta max_espera_servidor) más un jitter de hasta base.
+    Configurable por entorno: RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY y RETRY_MAX_SERVER_DELAY.
+    """
+
+    def __init__(self, max_intentos: int = 3, base: float = 1.0, max_espera: float = 30.0,
+                 max_espera_servidor: float = 120.0):
+        self.max_intentos = max_intentos
+        self.base = base
+        self.max_espera = max_espera
+        self.max_espera_servidor = max_espera_servidor
+
+    @classmethod
+    def desde_entorno(cls) -> "PoliticaReintentos":
+        return cls(
+            max_intentos=int(os.getenv("RETRY_MAX_ATTEMPTS", "3")),
+            base=float(os.getenv("RETRY_BASE_DELAY", "1")),
+            max_espera=float(os.getenv("RETRY_MAX_DELAY", "30")),
+            max_espera_servidor=float(os.getenv("RETRY_MAX_SERVER_DELAY", "120"))
+        )
+
+    def con(self, max_intentos: Optional[int] = None, base: Optional[float] = None) -> "PoliticaReintentos":
+        """
+        Copia de la política con otro número de intentos o espera base (para métodos que los reciben por parámetro).
+        """
+        return PoliticaReintentos(
+            max_intentos=self.max_intentos if max_intentos is None else max_intentos,
+            base=self.base if base is None else base,
+            max_espera=self.max_espera,
+            max_espera_servidor=self.max_espera_servidor
+        )
+
+    def espera(self, intento: int, error: Optional[BaseException] = None) -> float:
+        """
+        Segundos a esperar después del intento número `intento` (desde 1) que falló con `error`.
+        """
+        indicada = None
+        if isinstance(error, httpx.HTTPStatusError):
+            indicada = espera_indicada(error.response)
+        elif isinstance(error, CircuitoAbiertoError):
+            indicada = error.restante
+        if indicada is not None:
+            return min(indicada, self.max_espera_servidor) + random.uniform(0, self.base)
+        return random.uniform(0, min(self.max_espera, self.base * 2 ** (intento - 1)))
+
+
+class CircuitBreaker:
+    """
+    Circuito por endpoint compartido por todas las solicitudes del proceso (ver obtener_circuito).
+    - Tras umbral_fallos errores transitorios seguidos se abre durante tiempo_apertura segundos:
+      las llamadas fallan de inmediato con CircuitoAbiertoError en lugar de insistir sobre un servicio caído.
+    - Pasado ese tiempo deja pasar una sola llamada de prueba: si funciona se cierra, si falla se vuelve a abrir.
+    - Un 429 con espera indicada pausa el endpoint: las demás solicitudes esperan a que venza la pausa
+      (con jitter) antes de enviar, en lugar de agotar la cuota reintentando por separado.
+    """
+
+    def __init__(self, nombre: str, umbral_fallos: int = 5, tiempo_apertura: float = 30.0,
+                 reloj: Callable[[], float] = time.monotonic):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.reloj = reloj
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.pausa_hasta = 0.0
+        self.probando = False
+
+    @property
+    def estado(self) -> str:
+        if self.fallos < self.umbral_fallos:
+            return "cerrado"
+        return "abierto" if self.reloj() < self.abierto_hasta else "semiabierto"
+
+    async def esperar_turno(self, jitter: float = 1.0):
+        """
+        Espera a que venza la pausa por rate limit (si hay) y verifica que el circuito deje pasar la llamada.
+        """
+        restante = self.pausa_hasta - self.reloj()
+        if restante > 0:
+            await asyncio.sleep(restante + random.uniform(0, jitter))
+        estado = self.estado
+        if estado == "abierto" or (estado == "semiabierto" and self.probando):
+            raise CircuitoAbiertoError(self.nombre, max(self.abierto_hasta - self.reloj(), 0.0))
+        if estado == "semiabierto":
+            self.probando = True
+
+    def registrar(self, error: Optional[BaseException]):
+        """
+        Registra el resultado de una llamada. Solo los errores transitorios cuentan como fallo:
+        un 400 o un 404 indican que el endpoint responde.
+        """
+        self.probando = False
+        if error is None or not es_reintentable(error):
+            if self.fallos >= self.umbral_fallos:
+                print(f"[Retry] Circuito {self.nombre} cerrado")
+            self.fallos = 0
+            return
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+            indicada = espera_indicada(error.response)
+            if indicada:
+                self.pausa_hasta = max(self.pausa_hasta, self.reloj() + indicada)
+        self.fallos += 1
+        if self.fallos >= self.umbral_fallos:
+            self.abierto_hasta = self.reloj() + self.tiempo_apertura
+            print(f"[Retry][WARN] Circuito {self.nombre} abierto por {self.tiempo_apertura}s tras {self.fallos} fallos seguidos")
+
+
+# Circuitos por endpoint, compartidos por todas las solicitudes concurrentes del proceso
+_circuitos: Dict[str, CircuitBreaker] = {}
+
+
+def obtener_circuito(nombre: str) -> CircuitBreaker:
+    """
+    Retorna (creándolo si no existe) el circuito del endpoint. Configurable por entorno:
+    CIRCUIT_FAILURE_THRESHOLD y CIRCUIT_OPEN_SECONDS.
+    """
+    circuito = _circuitos.get(nombre)
+    if circuito is None:
+        circuito = _circuitos[nombre] = CircuitBreaker(
+            nombre,
+            umbral_fallos=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            tiempo_apertura=float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+        )
+    return circuito
+
+
+def host_degradado(host: str) -> bool:
+    """
+    True si algún circuito de los endpoints del host está abierto o en pausa por un 429
+    (ver la elección de proveedor en services/proveedores.py).
+    """
+    prefijo = f"{host}/"
+    return any(
+        circuito.estado == "abierto" or circuito.pausa_hasta > circuito.reloj()
+        for nombre, circuito in _circuitos.items() if nombre.startswith(prefijo)
+    )
+
+
+async def ejecutar_con_reintentos(operacion: Callable[[], Awaitable[T]], politica: PoliticaReintentos,
+                                  circuito: Optional[CircuitBreaker] = None, descripcion: str = "") -> T:
+    """
+    Ejecuta operacion() (una corrutina que lanza httpx.HTTPStatusError con raise_for_status) aplicando la
+    política: reintenta solo los errores transitorios y propaga el último error si se agotan los intentos
+    o si el error no es reintentable.
+    """
+    intento = 0
+    while True:
+        intento += 1
+        try:
+            if circuito is not None:
+                await circuito.esperar_turno(politica.base)
+            try:
+                resultado = await operacion()
+            except Exception as e:
+                if circuito is not None:
+                    circuito.registrar(e)
+                raise
+            finally:
+                # Si la llamada de prueba se cancela (lease perdido, wait_for, apagado) registrar no corre:
+                # sin esto el circuito quedaría rechazando todas las llamadas hasta reiniciar el proceso
+                if circuito is not None:
+                    circuito.probando = False
+            if circuito is not None:
+                circuito.registrar(None)
+            return resultado
+        except Exception as e:
+            if intento >= politica.max_intentos or not es_reintentable(e):
+                raise
+            espera = politica.espera(intento, e)
+            print(f"[Retry][WARN] {descripcion} intento {intento}/{politica.max_intentos}: {str(e)}; "
+                  f"reintento en {espera:.1f}s")
+            await asyncio.sleep(espera)
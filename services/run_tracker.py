@@ -0,0 +1,182 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+ConsultaRun = Callable[[str, str], Awaitable[Dict[str, Any]]]
+CallbackRun = Callable[[Dict[str, Any]], Any]
+
+# Estados en los que el run sigue trabajando: el tracker lo sigue consultando
+ESTADOS_EN_CURSO = ("queued", "in_progress")
+
+
+class RunSeguido:
+    def __init__(self, thread_id: str, run_id: str, consulta: ConsultaRun, intervalo: float, ahora: float):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.consulta = consulta
+        self.intervalo = intervalo
+        self.registrado = ahora
+        self.proxima = ahora + intervalo
+        self.consultas = 0
+        # Hay una consulta en vuelo: el ciclo no lanza otra hasta que termine
+        self.consultando = False
+        self.estado: Optional[str] = None
+        self.futuro: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+
+
+class RunTracker:
+    """
+    Seguimiento centralizado de los runs en curso del proceso: una sola tarea consulta todos los runs
+    registrados según su calendario, en lugar de un ciclo de polling por evaluación.
+    - Calendario adaptativo por run: la primera consulta a los intervalo_inicial segundos, luego el
+      intervalo crece (x backoff, con jitter) hasta intervalo_maximo. Un run que se vuelve a registrar
+      tras enviar tool outputs empieza otra vez con el intervalo corto.
+    - Como máximo max_consultas consultas simultáneas (presupuesto global de polling del proceso).
+      Cada consulta corre en su propia tarea: una consulta lenta (con sus reintentos) solo retrasa a
+      su run, no al resto ni a los registros nuevos.
+    - Cada registro se resuelve con el estado del run cuando deja de estar en ESTADOS_EN_CURSO.
+    Configurable por entorno: RUN_POLL_INITIAL_INTERVAL, RUN_POLL_MAX_INTERVAL, RUN_POLL_BACKOFF
+    y RUN_POLL_MAX_CONCURRENT.
+    """
+
+    def __init__(self, intervalo_inicial: float = 1.0, intervalo_maximo: float = 10.0, backoff: float = 1.5,
+                 max_consultas: int = 10, reloj: Callable[[], float] = time.monotonic):
+        self.intervalo_inicial = intervalo_inicial
+        self.intervalo_maximo = intervalo_maximo
+        self.backoff = backoff
+        self.max_consultas = max_consultas
+        self.reloj = reloj
+        self._runs: Dict[Tuple[str, str], RunSeguido] = {}
+        self._tarea: Optional[asyncio.Task] = None
+        self._cambio: Optional[asyncio.Event] = None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._consultas: set = set()
+
+    @classmethod
+    def desde_entorno(cls) -> "RunTracker":
+        return cls(
+            intervalo_inicial=float(os.getenv("RUN_POLL_INITIAL_INTERVAL", "1")),
+            intervalo_maximo=float(os.getenv("RUN_POLL_MAX_INTERVAL", "10")),
+            backoff=float(os.getenv("RUN_POLL_BACKOFF", "1.5")),
+            max_consultas=int(os.getenv("RUN_POLL_MAX_CONCURRENT", "10"))
+        )
+
+    def registrar(self, thread_id: str, run_id: str, consulta: ConsultaRun,
+                  callback: Optional[CallbackRun] = None) -> "asyncio.Future[Dict[str, Any]]":
+        """
+        Registra un run para seguimiento. consulta(thread_id, run_id) retorna el estado del run
+        (p. ej. assistant.get_run_status, {} si falla). Retorna un future que se resuelve con el último
+        estado cuando el run deja de estar en curso; si se indica callback, se llama con ese estado.
+        Si el run ya estaba registrado, reinicia su calendario y retorna el mismo future.
+        """
+        clave = (thread_id, run_id)
+        seguido = self._runs.get(clave)
+        if seguido is None:
+            seguido = self._runs[clave] = RunSeguido(thread_id, run_id, consulta, self.intervalo_inicial, self.reloj())
+        else:
+            seguido.intervalo = self.intervalo_inicial
+            seguido.proxima = self.reloj() + self.intervalo_inicial
+        if callback is not None:
+            def notificar(futuro: "asyncio.Future[Dict[str, Any]]"):
+                if not futuro.cancelled():
+                    callback(futuro.result())
+            seguido.futuro.add_done_callback(notificar)
+        self._despertar()
+        return seguido.futuro
+
+    async def esperar(self, thread_id: str, run_id: str, consulta: ConsultaRun,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Registra el run y espera a que deje de estar en curso. Al vencer el timeout lo quita del
+        seguimiento y lanza asyncio.TimeoutError.
+        """
+        futuro = self.registrar(thread_id, run_id, consulta)
+        try:
+            return await asyncio.wait_for(asyncio.shield(futuro), timeout)
+        except asyncio.TimeoutError:
+            self.cancelar(thread_id, run_id)
+            raise
+
+    def cancelar(self, thread_id: str, run_id: str):
+        seguido = self._runs.pop((thread_id, run_id), None)
+        if seguido is not None and not seguido.futuro.done():
+            seguido.futuro.cancel()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Runs en seguimiento con su último estado, antigüedad y próxima consulta (en segundos).
+        """
+        ahora = self.reloj()
+        return [
+            {
+                "ThreadID": seguido.thread_id,
+                "RunID": seguido.run_id,
+                "Estado": seguido.estado,
+                "Consultas": seguido.consultas,
+                "SegundosActivo": round(ahora - seguido.registrado, 1),
+                "ProximaConsultaEn": round(max(seguido.proxima - ahora, 0.0), 1),
+                "Intervalo": round(seguido.intervalo, 2),
+            }
+            for seguido in self._runs.values()
+        ]
+
+    def _despertar(self):
+        if self._tarea is None or self._tarea.done() or self._tarea.get_loop() is not asyncio.get_running_loop():
+            self._cambio = asyncio.Event()
+            self._semaforo = asyncio.Semaphore(self.max_consultas)
+            self._tarea = asyncio.get_running_loop().create_task(self._ciclo())
+        else:
+            self._cambio.set()
+
+    async def _ciclo(self):
+        # La tarea termina cuando no quedan runs; el siguiente registro la vuelve a crear
+        while self._runs:
+            ahora = self.reloj()
+            libres = [seguido for seguido in self._runs.values() if not seguido.consultando]
+            vencidos = [seguido for seguido in libres if seguido.proxima <= ahora]
+            if not vencidos:
+                # Sin runs libres, solo despierta un registro nuevo o el fin de una consulta
+                self._cambio.clear()
+                espera = min(seguido.proxima for seguido in libres) - ahora if libres else None
+                try:
+                    await asyncio.wait_for(self._cambio.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for seguido in vencidos:
+                seguido.consultando = True
+                tarea = asyncio.get_running_loop().create_task(self._consultar(seguido))
+                self._consultas.add(tarea)
+                tarea.add_done_callback(self._consultas.discard)
+
+    async def _consultar(self, seguido: RunSeguido):
+        try:
+            async with self._semaforo:
+                try:
+                    run_status = await seguido.consulta(seguido.thread_id, seguido.run_id)
+                except Exception as e:
+                    print(f"[RunTracker][ERROR] Consulta de run {seguido.run_id}: {str(e)}")
+                    run_status = {}
+        finally:
+            seguido.consultando = False
+            self._cambio.set()
+        seguido.consultas += 1
+        if self._runs.get((seguido.thread_id, seguido.run_id)) is not seguido:
+            return
+        status = run_status.get("status")
+        if status and status not in ESTADOS_EN_CURSO:
+            seguido.estado = status
+            del self._runs[(seguido.thread_id, seguido.run_id)]
+            if not seguido.futuro.done():
+                seguido.futuro.set_result(run_status)
+            return
+        seguido.estado = status or seguido.estado
+        seguido.intervalo = min(seguido.intervalo * self.backoff, self.intervalo_maximo)
+        # Jitter de +-10% para que los runs registrados a la vez no se consulten siempre juntos
+        seguido.proxima = self.reloj() + seguido.intervalo * random.uniform(0.9, 1.1)
+
+
+# Tracker compartido por todas las evaluaciones del proceso
+run_tracker = RunTracker.desde_entorno()
@@ -0,0 +1,113 @@
+import importlib.util
+import re
+import zipfile
+from io import BytesIO
+from typing import Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+from services.excel import excel_a_texto_bytes
+
+# Tipos (según services/clasificacion.py) de los que se puede extraer texto localmente
+TIPOS_CON_TEXTO = ("pdf", "docx", "pptx", "xlsx")
+
+NS_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+NS_DRAWING = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+_RE_ESPACIOS = re.compile(r"[ \t\f\v\u00a0]+")
+_RE_LINEAS_VACIAS = re.compile(r"\n{3,}")
+
+
+def normalizar_espacios(texto: str) -> str:
+    """
+    Colapsa espacios y tabulaciones, recorta cada línea y deja como máximo una línea en blanco seguida.
+    """
+    lineas = (_RE_ESPACIOS.sub(" ", linea).strip() for linea in texto.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return _RE_LINEAS_VACIAS.sub("\n\n", "\n".join(lineas)).strip()
+
+
+def extraer_texto_local(contents: bytes, tipo: str, min_caracteres: int = 200,
+                        min_caracteres_por_pagina: int = 100) -> Optional[str]:
+    """
+    Extrae y normaliza el texto de un PDF, DOCX, PPTX o XLSX. Retorna None si el formato no está soportado,
+    falta la librería opcional (pypdf o PyMuPDF para PDF) o el texto es muy poco para reemplazar al original:
+    menos de min_caracteres en total o, en PDFs, menos de min_caracteres_por_pagina (escaneados).
+    Recibe y retorna datos serializables para el pool de procesos.
+    """
+    try:
+        resultado = _EXTRACTORES[tipo](contents) if tipo in _EXTRACTORES else None
+    except Exception as e:
+        print(f"[TextoLocal][WARN] No se pudo extraer texto ({tipo}): {str(e)}")
+        return None
+    if resultado is None:
+        return None
+    texto, paginas = resultado
+    texto = normalizar_espacios(texto)
+    if len(texto) < min_caracteres:
+        return None
+    if tipo == "pdf" and len(texto) / max(paginas, 1) < min_caracteres_por_pagina:
+        return None
+    return texto
+
+
+def _texto_pdf(contents: bytes) -> Optional[Tuple[str, int]]:
+    if importlib.util.find_spec("pypdf") is not None:
+        from pypdf import PdfReader
+
+        reader = PdfReader(BytesIO(contents))
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages), len(reader.pages)
+    if importlib.util.find_spec("fitz") is not None:
+        import fitz
+
+        with fitz.open(stream=contents, filetype="pdf") as doc:
+            return "\n\n".join(page.get_text() for page in doc), doc.page_count
+    return None
+
+
+def _texto_docx(contents: bytes) -> Tuple[str, int]:
+    # word/document.xml en streaming: párrafos <w:p> con runs de texto <w:t>, tabulaciones y saltos
+    partes = []
+    with zipfile.ZipFile(BytesIO(contents)) as zf, zf.open("word/document.xml") as xml:
+        for evento, elemento in iterparse(xml, events=("end",)):
+            if elemento.tag == f"{NS_WORD}t":
+                partes.append(elemento.text or "")
+            elif elemento.tag == f"{NS_WORD}tab":
+                partes.append("\t")
+            elif elemento.tag in (f"{NS_WORD}br", f"{NS_WORD}p"):
+                partes.append("\n")
+            elif elemento.tag == f"{NS_WORD}tc":
+                partes.append(" | ")
+            if elemento.tag in (f"{NS_WORD}p", f"{NS_WORD}tbl"):
+                elemento.clear()
+    return "".join(partes), 1
+
+
+def _texto_pptx(contents: bytes) -> Tuple[str, int]:
+    with zipfile.ZipFile(BytesIO(contents)) as zf:
+        diapositivas = sorted(
+            (n for n in zf.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", n)),
+            key=lambda n: int(re.search(r"(\d+)\.xml$", n).group(1))
+        )
+        textos = []
+        for numero, nombre in enumerate(diapositivas, start=1):
+            partes = [f"--- Diapositiva {numero} ---\n"]
+            with zf.open(nombre) as xml:
+                for evento, elemento in iterparse(xml, events=("end",)):
+                    if elemento.tag == f"{NS_DRAWING}t":
+                        partes.append(elemento.text or "")
+                    elif elemento.tag in (f"{NS_DRAWING}p", f"{NS_DRAWING}br"):
+                        partes.append("\n")
+            textos.append("".join(partes))
+    return "\n".join(textos), 1
+
+
+def _texto_xlsx(contents: bytes) -> Tuple[str, int]:
+    # Mismo texto CSV que se sube al assistant para los cuestionarios (services/excel.py)
+    return excel_a_texto_bytes(contents).decode("utf-8"), 1
+
+
+_EXTRACTORES = {
+    "pdf": _texto_pdf,
+    "docx": _texto_docx,
+    "pptx": _texto_pptx,
+    "xlsx": _texto_xlsx,
+}
@@ -0,0 +1,56 @@
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+class TransporteOpenAI:
+    """
+    Dónde y cómo se autentican las llamadas REST de la API de Assistants: URL base, headers de
+    autenticación y armado de la URL de cada ruta. Los assistants REST (services/openai_assistant.py)
+    arman todas sus llamadas con el transporte, de modo que reintentos, rate limit, polling, streaming
+    y vector stores se escriben una sola vez para todos los proveedores.
+    """
+    nombre = "OpenAI"
+
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1"):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+
+    @property
+    def host(self) -> str:
+        # Clave del rate limiter y de los circuitos: las cuotas son por host (cuenta o recurso)
+        return httpx.URL(self.base_url).host
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """
+        Headers de autenticación, sin Content-Type (las subidas de archivos usan multipart).
+        """
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "OpenAI-Beta": "assistants=v2"
+        }
+
+    def url(self, ruta: str, params: Optional[Dict[str, Any]] = None) -> str:
+        url = httpx.URL(f"{self.base_url}{ruta}")
+        return str(url.copy_merge_params(params)) if params else str(url)
+
+
+class TransporteAzure(TransporteOpenAI):
+    """
+    Azure OpenAI: rutas bajo {endpoint}/openai, header api-key y api-version en cada URL. Los params
+    de una llamada se pasan a url() y no a httpx, que reemplazaría el query string (y la api-version).
+    """
+    nombre = "AzureOpenAI"
+
+    def __init__(self, api_key: str, endpoint: str, api_version: str = "2024-05-01-preview"):
+        super().__init__(api_key, f"{endpoint.rstrip('/')}/openai")
+        self.endpoint = endpoint.rstrip("/")
+        self.api_version = api_version
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"api-key": self.api_key}
+
+    def url(self, ruta: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return super().url(ruta, {"api-version": self.api_version, **(params or {})})
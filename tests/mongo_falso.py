@@ -0,0 +1,115 @@
+"""
+Colección Mongo en memoria con el subconjunto de operaciones de Motor que usan FileCache, JobQueue
+y el pipeline de solicitudes (las pruebas no tienen MongoDB).
+"""
+import copy
+from types import SimpleNamespace
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+_OPERADORES = {
+    "$gt": lambda v, x: v is not None and v > x,
+    "$gte": lambda v, x: v is not None and v >= x,
+    "$lt": lambda v, x: v is not None and v < x,
+    "$lte": lambda v, x: v is not None and v <= x,
+    "$ne": lambda v, x: v != x,
+    "$in": lambda v, x: any(i in x for i in v) if isinstance(v, list) else v in x,
+}
+
+
+def coincide(doc, filtro):
+    for campo, condicion in filtro.items():
+        if campo == "$or":
+            if not any(coincide(doc, f) for f in condicion):
+                return False
+        elif isinstance(condicion, dict) and condicion and all(k.startswith("$") for k in condicion):
+            if not all(_OPERADORES[op](doc.get(campo), valor) for op, valor in condicion.items()):
+                return False
+        elif isinstance(doc.get(campo), list) and not isinstance(condicion, list):
+            if condicion not in doc[campo]:
+                return False
+        elif doc.get(campo) != condicion:
+            return False
+    return True
+
+
+class ColeccionFalsa:
+    def __init__(self, unicos=("ContentHash", "JobID")):
+        self.docs = []
+        self.unicos = unicos
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    def _aplicar(self, doc, update, insertando=False):
+        for campo, valor in update.get("$set", {}).items():
+            doc[campo] = valor
+        for campo, valor in update.get("$inc", {}).items():
+            doc[campo] = doc.get(campo, 0) + valor
+        for campo, valor in update.get("$push", {}).items():
+            doc.setdefault(campo, []).append(valor)
+        for campo, valor in update.get("$pull", {}).items():
+            doc[campo] = [v for v in doc.get(campo, []) if v != valor]
+        for campo, valor in update.get("$addToSet", {}).items():
+            if valor not in doc.setdefault(campo, []):
+                doc[campo].append(valor)
+        if insertando:
+            for campo, valor in update.get("$setOnInsert", {}).items():
+                doc[campo] = valor
+
+    def _verificar_unicos(self, doc):
+        for campo in self.unicos:
+            if campo in doc and any(d is not doc and d.get(campo) == doc[campo] for d in self.docs):
+                raise DuplicateKeyError(f"duplicado {campo}")
+
+    async def insert_one(self, doc):
+        doc = copy.deepcopy(doc)
+        self._verificar_unicos(doc)
+        self.docs.append(doc)
+
+    async def find_one(self, filtro):
+        return next((copy.deepcopy(d) for d in self.docs if coincide(d, filtro)), None)
+
+    async def find_one_and_update(self, filtro, update, upsert=False, sort=None, return_document=ReturnDocument.BEFORE):
+        candidatos = [d for d in self.docs if coincide(d, filtro)]
+        for campo, orden in reversed(sort or []):
+            candidatos.sort(key=lambda d: d.get(campo), reverse=orden < 0)
+        if candidatos:
+            doc = candidatos[0]
+            antes = copy.deepcopy(doc)
+            self._aplicar(doc, update)
+            return copy.deepcopy(doc) if return_document == ReturnDocument.AFTER else antes
+        if not upsert:
+            return None
+        doc = {k: v for k, v in filtro.items() if not k.startswith("$") and not isinstance(v, dict)}
+        self._aplicar(doc, update, insertando=True)
+        self._verificar_unicos(doc)
+        self.docs.append(doc)
+        return copy.deepcopy(doc) if return_document == ReturnDocument.AFTER else None
+
+    async def update_one(self, filtro, update):
+        doc = next((d for d in self.docs if coincide(d, filtro)), None)
+        if doc is not None:
+            self._aplicar(doc, update)
+        return SimpleNamespace(modified_count=int(doc is not None))
+
+    async def update_many(self, filtro, update):
+        docs = [d for d in self.docs if coincide(d, filtro)]
+        for doc in docs:
+            self._aplicar(doc, update)
+        return SimpleNamespace(modified_count=len(docs))
+
+    async def delete_one(self, filtro):
+        doc = next((d for d in self.docs if coincide(d, filtro)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    def find(self, filtro, proyeccion=None):
+        docs = [copy.deepcopy(d) for d in self.docs if coincide(d, filtro)]
+
+        async def iterar():
+            for doc in docs:
+                yield doc
+        return iterar()
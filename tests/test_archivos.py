@@ -0,0 +1,50 @@
+import asyncio
+import zipfile
+from io import BytesIO
+from services.archivos import ExtractorArchivos, LimitesDescompresion
+
+
+def _zip(miembros: dict) -> BytesIO:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre, contenido in miembros.items():
+            zf.writestr(nombre, contenido)
+    buffer.seek(0)
+    return buffer
+
+
+def test_omite_miembros_con_tasa_de_compresion_excesiva():
+    # Con los límites por defecto: ~4 MB que comprimen a pocos KB superan la tasa de 200:1
+    extractor = ExtractorArchivos(LimitesDescompresion(), spool_max_bytes=512)
+    archivo = _zip({"ok.txt": b"contenido", "bomba.txt": b"\0" * 4_000_000})
+    archivos = extractor.extraer(archivo, "anexos.zip")
+    assert [(nombre, f.read()) for nombre, f in archivos] == [("ok.txt", b"contenido")]
+    assert [nombre for nombre, _ in extractor.omitidos] == ["bomba.txt"]
+
+
+def test_limites_de_profundidad_y_total_de_bytes():
+    anidado = _zip({"c.zip": _zip({"profundo.txt": b"x"}).getvalue(), "b.txt": b"b"}).getvalue()
+    extractor = ExtractorArchivos(LimitesDescompresion(max_profundidad=2, max_total_bytes=10_000))
+    archivos = extractor.extraer(_zip({"a.txt": b"a", "b.zip": anidado}), "anexos.zip")
+    assert [nombre for nombre, _ in archivos] == ["a.txt", "b.txt"]
+    assert extractor.omitidos[0][0] == "c.zip"
+
+    extractor.limites.max_total_bytes = extractor.total_bytes + 5
+    assert extractor.extraer(_zip({"grande.txt": b"y" * 100}), "otro.zip") == []
+    assert extractor.detenido
+    # Los anexos que no son comprimidos se conservan
+    assert [n for n, _ in extractor.extraer(BytesIO(b"pdf"), "c.pdf")] == ["c.pdf"]
+
+
+def test_extraer_anexos_en_paralelo_conserva_el_orden():
+    def paquete():
+        internos = {f"sub{i}.zip": _zip({f"{i}-a.txt": b"a", f"{i}-b.txt": b"b"}).getvalue() for i in range(4)}
+        return _zip({"inicio.txt": b"i", **internos, "fin.txt": b"f"})
+
+    secuencial = ExtractorArchivos(LimitesDescompresion())
+    esperado = [n for n, _ in secuencial.extraer(paquete(), "p.zip")] + ["c.pdf"]
+    extractor = ExtractorArchivos(LimitesDescompresion(), max_memoria_bytes=0)
+    archivos = asyncio.run(extractor.extraer_anexos([("p.zip", paquete()), ("c.pdf", BytesIO(b"c"))], max_concurrency=2))
+    assert [n for n, _ in archivos] == esperado
+    assert esperado[:3] == ["inicio.txt", "0-a.txt", "0-b.txt"] and esperado[-2:] == ["fin.txt", "c.pdf"]
+    assert extractor.memoria_bytes == 0
@@ -0,0 +1,191 @@
+import asyncio
+import httpx
+import pytest
+from models import TipoAsistenteEnum
+from services.rate_limit import RateLimiter
+from services.run_tracker import RunTracker
+
+pytest.importorskip("openai")
+from services.azureOpenAISDK import AzureOpenAISDKAssistant  # noqa: E402
+
+
+def objeto_run(status, **extra):
+    return {"id": "run_1", "object": "thread.run", "created_at": 0, "thread_id": "thread_1", "assistant_id": "asst",
+            "status": status, "instructions": "", "tools": [], "model": "gpt", "parallel_tool_calls": False,
+            "metadata": {}, **extra}
+
+
+def objeto_mensaje(role, content):
+    return {"id": f"msg_{role}", "object": "thread.message", "created_at": 0, "thread_id": "thread_1", "role": role,
+            "content": content, "status": "completed", "attachments": [], "metadata": {}, "assistant_id": None,
+            "run_id": None, "completed_at": None, "incomplete_at": None, "incomplete_details": None}
+
+
+def test_run_assistant_flow_asincrono_con_sdk():
+    estado = {"enviado": False}
+    required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "evaluar", "arguments": "{}"}}
+    ]}}
+
+    def handler(request):
+        path = request.url.path
+        if path.endswith("/threads"):
+            return httpx.Response(200, json={"id": "thread_1", "object": "thread", "created_at": 0, "metadata": {}})
+        if path.endswith("/messages") and request.method == "POST":
+            return httpx.Response(200, json=objeto_mensaje("user", []))
+        if path.endswith("/messages"):
+            texto = {"type": "text", "text": {"value": "Evaluación lista", "annotations": []}}
+            return httpx.Response(200, json={"object": "list", "data": [objeto_mensaje("assistant", [texto])],
+                                             "has_more": False})
+        if path.endswith("/submit_tool_outputs"):
+            estado["enviado"] = True
+            return httpx.Response(200, json=objeto_run("queued"))
+        if path.endswith("/runs"):
+            return httpx.Response(200, json=objeto_run("queued"))
+        if estado["enviado"]:
+            return httpx.Response(200, json=objeto_run("completed"))
+        return httpx.Response(200, json=objeto_run("requires_action", required_action=required_action))
+
+    async def escenario():
+        assistant = AzureOpenAISDKAssistant(
+            "key", "https://recurso.openai.azure.com", "asst",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            rate_limiter=RateLimiter("test", {}), run_tracker=RunTracker(intervalo_inicial=0.01)
+        )
+        return await assistant.run_assistant_flow("Evalúa la solicitud", tipo_asistente=list(TipoAsistenteEnum)[0])
+
+    resultado = asyncio.run(escenario())
+    assert resultado["assistant_response"] == "Evaluación lista"
+    assert resultado["required_action"]["type"] == "submit_tool_outputs"
+    assert resultado["last_run_status"]["status"] == "completed"
+
+
+def test_run_failed_es_final_y_error_en_tool_outputs_no_aborta():
+    consultas = {"n": 0}
+    required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "evaluar", "arguments": "{}"}}
+    ]}}
+
+    def handler(request):
+        if request.url.path.endswith("/submit_tool_outputs"):
+            return httpx.Response(400, json={"error": {"message": "run expirado"}})
+        consultas["n"] += 1
+        if consultas["n"] == 1:
+            return httpx.Response(200, json=objeto_run("requires_action", required_action=required_action))
+        return httpx.Response(200, json=objeto_run("failed"))
+
+    async def escenario():
+        assistant = AzureOpenAISDKAssistant(
+            "key", "https://recurso.openai.azure.com", "asst",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            rate_limiter=RateLimiter("test", {}), run_tracker=RunTracker(intervalo_inicial=0.01)
+        )
+        return await assistant.wait_for_required_action("thread_1", "run_1", list(TipoAsistenteEnum)[0], timeout=5)
+
+    resultado = asyncio.run(escenario())
+    assert resultado["assistant_response"] == "failed"
+    assert consultas["n"] == 2
+
+
+def test_add_files_to_vector_store_batch_sigue_si_falla_quitar_un_archivo():
+    batches = []
+
+    def objeto_batch(n):
+        return {"id": f"batch_{n}", "object": "vector_store.files_batch", "created_at": 0, "vector_store_id": "vs_1",
+                "status": "completed", "file_counts": {"in_progress": 0, "completed": 1, "failed": 1, "cancelled": 0, "total": 2}}
+
+    def handler(request):
+        path = request.url.path
+        if request.method == "DELETE":
+            return httpx.Response(404, json={"error": {"message": "no existe"}})
+        if request.method == "POST" and path.endswith("/file_batches"):
+            batches.append(path)
+            return httpx.Response(200, json=objeto_batch(len(batches)))
+        if path.endswith("/files"):
+            fallidos = [{"id": "file-2", "object": "vector_store.file", "created_at": 0, "vector_store_id": "vs_1",
+                         "status": "failed", "usage_bytes": 0, "last_error": None}] if len(batches) == 1 else []
+            return httpx.Response(200, json={"object": "list", "data": fallidos, "has_more": False})
+        return httpx.Response(200, json=objeto_batch(len(batches)))
+
+    async def escenario():
+        assistant = AzureOpenAISDKAssistant(
+            "key", "https://recurso.openai.azure.com", "asst",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            rate_limiter=RateLimiter("test", {})
+        )
+        return await assistant.add_files_to_vector_store_batch("vs_1", ["file-1", "file-2"])
+
+    resultado = asyncio.run(escenario())
+    # El 404 al quitar file-2 no corta los reintentos
+    assert len(batches) == 2
+    assert sorted(resultado["completed"]) == ["file-1", "file-2"]
+
+
+def test_depure_files_v2_elimina_solo_los_indicados_aunque_uno_falle():
+    peticiones = []
+
+    def handler(request):
+        peticiones.append((request.method, request.url.path))
+        if request.url.path.endswith("/file-roto"):
+            return httpx.Response(404, json={"error": {"message": "no existe"}})
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1], "object": "file", "deleted": True})
+
+    async def escenario():
+        assistant = AzureOpenAISDKAssistant(
+            "key", "https://recurso.openai.azure.com", "asst",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            rate_limiter=RateLimiter("test", {})
+        )
+        await assistant.depureFilesV2(["file-roto", "file-1"])
+
+    asyncio.run(escenario())
+    # Sin listar /files y el 404 no detiene el resto
+    assert peticiones == [("DELETE", "/openai/files/file-roto"), ("DELETE", "/openai/files/file-1")]
+
+
+def test_run_assistant_flow_sdk_en_streaming():
+    import json
+    peticiones = []
+    required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "evaluar", "arguments": "{}"}}
+    ]}}
+
+    def sse(*eventos):
+        return "".join(f"event: {evento}\ndata: {json.dumps(datos)}\n\n" for evento, datos in eventos) + "event: done\ndata: [DONE]\n\n"
+
+    def handler(request):
+        path = request.url.path
+        peticiones.append((request.method, path))
+        if path.endswith("/threads"):
+            return httpx.Response(200, json={"id": "thread_1", "object": "thread", "created_at": 0, "metadata": {}})
+        if path.endswith("/messages") and request.method == "POST":
+            return httpx.Response(200, json=objeto_mensaje("user", []))
+        if path.endswith("/messages"):
+            texto = {"type": "text", "text": {"value": "Evaluación lista", "annotations": []}}
+            return httpx.Response(200, json={"object": "list", "data": [objeto_mensaje("assistant", [texto])],
+                                             "has_more": False})
+        if path.endswith("/runs"):
+            assert json.loads(request.content)["stream"] is True
+            body = sse(("thread.run.created", objeto_run("queued")),
+                       ("thread.run.requires_action", objeto_run("requires_action", required_action=required_action)))
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        if path.endswith("/submit_tool_outputs"):
+            body = sse(("thread.run.completed", objeto_run("completed")))
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        return httpx.Response(500, json={"error": {"message": "sin polling"}})
+
+    async def escenario():
+        assistant = AzureOpenAISDKAssistant(
+            "key", "https://recurso.openai.azure.com", "asst",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            rate_limiter=RateLimiter("test", {})
+        )
+        return await assistant.run_assistant_flow("Evalúa la solicitud", list(TipoAsistenteEnum)[0], file_ids=["file-1"],
+                                                  vector_store_id="vs_1")
+
+    resultado = asyncio.run(escenario())
+    assert resultado["assistant_response"] == "Evaluación lista"
+    assert resultado["required_action"]["type"] == "submit_tool_outputs"
+    # Un solo mensaje (los archivos van por el vector store) y sin consultas de polling
+    assert [p for m, p in peticiones if m == "POST" and p.endswith("/messages")] == ["/openai/threads/thread_1/messages"]
+    assert not any(p.endswith("/runs/run_1") for _, p in peticiones)
@@ -0,0 +1,36 @@
+from io import BytesIO
+from openpyxl import Workbook
+from services.clasificacion import clasificar_archivos
+
+
+def _xlsx():
+    buffer = BytesIO()
+    Workbook().save(buffer)
+    return buffer.getvalue()
+
+
+def test_clasifica_por_contenido_y_no_por_extension():
+    archivos = [
+        ("informe.pdf", b"%PDF-1.7 ..."),
+        ("foto", b"\x89PNG\r\n\x1a\n" + b"\0" * 20),
+        ("datos.csv", "a;b\nñ;1\n".encode("utf-8")),
+        ("planilla", _xlsx()),
+        (".DS_Store", b"\0\0\0\1Bud1"),
+        ("._informe.pdf", b"\x00\x05\x16\x07\x00\x02"),
+        ("vacio.txt", b""),
+        ("setup.txt", b"MZ\x90\x00\x03\x00\x00\x00"),
+        ("notas.md", b"# Titulo"),
+    ]
+    manifiesto = clasificar_archivos([(nombre, BytesIO(contenido)) for nombre, contenido in archivos])
+    resumen = [(e["NombreSubida"] if e["Incluido"] else None, e["MimeType"], e["Motivo"]) for e in manifiesto]
+    assert resumen == [
+        ("informe.pdf", "application/pdf", "indexable"),
+        (None, None, "imagen"),
+        ("datos.csv.txt", "text/plain", "indexable"),
+        ("planilla.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "indexable"),
+        (None, None, "metadatos del sistema operativo"),
+        (None, None, "metadatos del sistema operativo"),
+        (None, None, "archivo vacío"),
+        (None, None, "ejecutable"),
+        ("notas.md", "text/markdown", "indexable"),
+    ]
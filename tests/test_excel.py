@@ -0,0 +1,146 @@
+from io import BytesIO
+import pandas as pd
+from fastapi import UploadFile
+from openpyxl import Workbook
+from datetime import datetime
+import zipfile
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+import asyncio
+from services import excel
+from services.excel import LibroExcel, cargar_libro_excel, excel_a_texto_bytes, filas_como_texto, rangos_combinados_xlsx
+
+
+def _valores_modo_normal(ws):
+    # Referencia: openpyxl en modo normal, con las combinadas rellenadas desde ws.merged_cells
+    filas = [list(fila) for fila in ws.iter_rows(values_only=True)]
+    for rango in ws.merged_cells.ranges:
+        for fila in range(rango.min_row, rango.max_row + 1):
+            for columna in range(rango.min_col, rango.max_col + 1):
+                filas[fila - 1][columna - 1] = filas[rango.min_row - 1][rango.min_col - 1]
+    return filas
+
+
+def test_valores_rellena_celdas_combinadas():
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Encabezado", None, "Otro"])
+    ws.append(["a", "b", "c"])
+    ws.append([None, None, "d"])
+    ws.merge_cells("A1:B1")
+    ws.merge_cells("A2:A3")
+    buffer = BytesIO()
+    wb.save(buffer)
+    assert LibroExcel.desde_bytes(buffer.getvalue())["Sheet"].valores() == [
+        ["Encabezado", "Encabezado", "Otro"],
+        ["a", "b", "c"],
+        ["a", None, "d"],
+    ]
+
+
+def _libro_bytes():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Datos"
+    ws.append(["Nombre", "Valor", None, "Nombre"])
+    ws.append(["a", 1, None, "NA"])
+    ws.append([None, 2.5, None, None])
+    ws.append(["b", None, None, "123"])
+    ws.merge_cells("A2:A3")
+    wb.create_sheet("Vacia")
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def test_lectura_streaming_coincide_con_modo_normal():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Datos"
+    ws.append(["Encabezado", None, "Otro"])
+    ws.append(["a", 1, datetime(2024, 5, 1)])
+    ws["E7"].font = Font(bold=True)
+    ws.merge_cells("A1:B1")
+    ws.merge_cells("A2:A9")
+    wb.create_sheet("Otra").append(["x"])
+    buffer = BytesIO()
+    wb.save(buffer)
+    contents = buffer.getvalue()
+
+    libro = LibroExcel.desde_bytes(contents)
+    normal = load_workbook(BytesIO(contents), data_only=True)["Datos"]
+    assert libro["Datos"].filas == [list(fila) for fila in normal.iter_rows(values_only=True)]
+    assert libro["Datos"].valores() == _valores_modo_normal(normal)
+    # Solo se materializan las hojas pedidas
+    assert list(libro.hojas) == ["Datos"]
+    assert "Otra" in libro and libro.sheetnames == ["Datos", "Otra"]
+
+    with zipfile.ZipFile(BytesIO(contents)) as archive:
+        rangos = rangos_combinados_xlsx(archive, "xl/worksheets/sheet1.xml", chunk_size=16)
+    assert sorted(rangos) == [(1, 1, 1, 2), (2, 1, 9, 1)]
+
+
+def test_dataframe_coincide_con_pandas():
+    contents = _libro_bytes()
+    xls = pd.ExcelFile(BytesIO(contents))
+    libro = LibroExcel.desde_bytes(contents)
+    assert libro.sheetnames == xls.sheet_names
+    for hoja in xls.sheet_names:
+        pd.testing.assert_frame_equal(libro[hoja].dataframe(), xls.parse(hoja))
+
+
+def test_cargar_libro_excel_no_consume_el_archivo_y_usa_cache():
+    upload = UploadFile(file=BytesIO(_libro_bytes()), filename="cuestionario.xlsx")
+    libro = cargar_libro_excel(upload)
+    assert cargar_libro_excel(libro) is libro
+    assert upload.file.read(2) == b"PK"
+    # Mismo contenido: se reutiliza el libro cacheado por content_hash
+    assert cargar_libro_excel(upload) is libro
+    assert libro["Datos"].columnas[0] == ["Nombre", "a", "a", "b"]
+
+
+def test_filas_como_texto_coincide_con_iterrows():
+    df = pd.DataFrame({
+        "entero": [1, 2, None, 4],
+        "decimal": [0.5, None, None, 3.0],
+        "fecha": [datetime(2024, 1, 2), datetime(2024, 1, 2, 13, 30), None, None],
+        "texto": ["  a ", None, None, True],
+    }).fillna("")
+    enteros = pd.DataFrame({"n": [1, 2], "m": [3, 4]})
+    for frame in (df, df[["texto"]], enteros, enteros.assign(x=[0.5, 1.0])):
+        esperado = []
+        for _, row in frame.iterrows():
+            fila = [str(x).strip() for x in row]
+            if any(fila):
+                esperado.append(" | ".join(fila))
+        assert filas_como_texto(frame) == esperado
+    assert filas_como_texto(pd.DataFrame()) == []
+
+
+def test_excel_a_texto_incluye_todas_las_hojas_sin_filas_ni_columnas_vacias(monkeypatch):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Roles"
+    ws.append(["Rol", None, "Años"])
+    ws.append([None, None, "  "])
+    ws.append(["Jefe, proyecto", None, 5])
+    wb.create_sheet("Vacia")
+    wb.create_sheet("Experiencia")["B2"] = "Obra"
+    buffer = BytesIO()
+    wb.save(buffer)
+    contents = buffer.getvalue()
+
+    esperado = '=== Hoja: Roles ===\nRol,Años\n"Jefe, proyecto",5\n\n=== Hoja: Experiencia ===\nObra\n'
+    assert excel_a_texto_bytes(contents).decode("utf-8") == esperado
+
+    llamadas = []
+
+    async def run_cpu(func, *args):
+        llamadas.append(func)
+        return func(*args)
+
+    monkeypatch.setattr(excel, "run_cpu", run_cpu)
+    # La segunda conversión del mismo contenido sale de la cache
+    assert asyncio.run(excel.convertir_excel_a_texto(contents)).decode("utf-8") == esperado
+    assert asyncio.run(excel.convertir_excel_a_texto(contents)).decode("utf-8") == esperado
+    assert llamadas == [excel_a_texto_bytes]
@@ -0,0 +1,50 @@
+import asyncio
+import zipfile
+from io import BytesIO
+from openpyxl import Workbook
+from services import executors
+from services.excel import excel_a_texto_bytes
+from routers.vigia import descomprimir_anexos_recursivo, extraer_excel_para_assistant, extraer_excel_para_assistant_bytes
+from fastapi import UploadFile
+
+
+def _excel_bytes():
+    wb = Workbook()
+    wb.active.append(["Pregunta", "Respuesta"])
+    wb.active.append(["¿Cumple?", 1])
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def test_run_cpu_en_pool_de_procesos(monkeypatch):
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "1")
+    contents = _excel_bytes()
+
+    async def ejecutar():
+        executors.init_executors()
+        try:
+            return await asyncio.gather(
+                executors.run_cpu(excel_a_texto_bytes, contents),
+                executors.run_cpu(extraer_excel_para_assistant_bytes, contents)
+            )
+        finally:
+            executors.shutdown_executors()
+
+    csv, texto = asyncio.run(ejecutar())
+    assert csv == "=== Hoja: Sheet ===\nPregunta,Respuesta\n¿Cumple?,1\n".encode("utf-8")
+    assert texto == extraer_excel_para_assistant(UploadFile(file=BytesIO(contents), filename="c.xlsx"))
+
+
+def test_descomprimir_anexos_recursivo_zip_anidado():
+    interno = BytesIO()
+    with zipfile.ZipFile(interno, "w") as zf:
+        zf.writestr("docs/b.txt", b"b")
+    externo = BytesIO()
+    with zipfile.ZipFile(externo, "w") as zf:
+        zf.writestr("a.txt", b"a")
+        zf.writestr("anidado.zip", interno.getvalue())
+    externo.seek(0)
+    anexos = [UploadFile(file=externo, filename="anexos.zip"), UploadFile(file=BytesIO(b"c"), filename="c.pdf")]
+    archivos = asyncio.run(descomprimir_anexos_recursivo(anexos))
+    assert [(a.filename, a.file.read()) for a in archivos] == [("a.txt", b"a"), ("b.txt", b"b"), ("c.pdf", b"c")]
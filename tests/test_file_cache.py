@@ -0,0 +1,50 @@
+import asyncio
+import httpx
+from mongo_falso import ColeccionFalsa
+from services.file_cache import FileCache
+from services.openai_assistant import OpenAIAssistant
+from services.rate_limit import RateLimiter
+from services.retry import PoliticaReintentos
+
+
+def make_assistant(handler):
+    return OpenAIAssistant(
+        api_key="test", assistant_id="asst_test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        retry_policy=PoliticaReintentos(max_intentos=2, base=0.01), rate_limiter=RateLimiter("test", {})
+    )
+
+
+def test_file_exists_solo_404_es_inexistente():
+    status = {"file-caido": 503, "file-borrado": 404, "file-ok": 200}
+    assistant = make_assistant(lambda request: httpx.Response(status[request.url.path.rsplit("/", 1)[-1]], json={}))
+    # Un 503 persistente no invalida la cache: se asume que el archivo existe
+    assert asyncio.run(assistant.file_exists("file-caido")) is True
+    assert asyncio.run(assistant.file_exists("file-borrado")) is False
+    assert asyncio.run(assistant.file_exists("file-ok")) is True
+
+
+def test_invalidate_conserva_entrada_en_uso():
+    async def escenario():
+        cache = FileCache(ColeccionFalsa())
+        await cache.put("hash", "file-viejo", "a.pdf")
+        # Otra solicitud y la actual toman referencias
+        assert await cache.acquire("hash") == "file-viejo"
+        await cache.invalidate("hash", "file-viejo")
+        # La otra solicitud sigue usándolo: no sale de los archivos vivos, pero no se vuelve a entregar
+        assert "file-viejo" in await cache.live_file_ids()
+        assert await cache.acquire("hash") is None
+        # El archivo subido de nuevo reemplaza la entrada inválida
+        assert await cache.put("hash", "file-nuevo", "a.pdf") == "file-nuevo"
+        assert await cache.acquire("hash") == "file-nuevo"
+        # La otra solicitud suelta el archivo viejo: el nuevo conserva sus dos referencias vigentes
+        await cache.release(["file-viejo"])
+        await cache.release(["file-nuevo"])
+        assert (await cache.collection.find_one({"ContentHash": "hash"}))["RefCount"] == 1
+        assert "file-nuevo" in await cache.live_file_ids()
+
+        await cache.put("otro", "file-solo", "b.pdf")
+        await cache.invalidate("otro", "file-solo")
+        assert await cache.acquire("otro") is None
+        assert "file-solo" not in await cache.live_file_ids()
+
+    asyncio.run(escenario())
@@ -0,0 +1,67 @@
+import asyncio
+from mongo_falso import ColeccionFalsa
+from services.jobs import JobQueue, WorkerPool
+
+
+def test_claim_y_lease_vencido():
+    async def escenario():
+        queue = JobQueue(ColeccionFalsa(), lease_seconds=0.05)
+        await queue.enqueue("solicitud", {"SolicitudID": "s1"}, job_id="job-1")
+        job = await queue.claim("worker-a")
+        assert job["JobID"] == "job-1" and job["Estado"] == "running" and job["Intentos"] == 1
+        # Con el lease vigente nadie más lo toma
+        assert await queue.claim("worker-b") is None
+        assert await queue.heartbeat("job-1", "worker-a")
+        await asyncio.sleep(0.1)
+        # Worker caído: el lease vence y otro worker lo retoma; el primero ya no puede renovarlo
+        retomado = await queue.claim("worker-b")
+        assert retomado["WorkerID"] == "worker-b" and retomado["Intentos"] == 2
+        assert not await queue.heartbeat("job-1", "worker-a")
+
+    asyncio.run(escenario())
+
+
+def test_fallo_reintento_y_fallo_definitivo():
+    async def escenario():
+        queue = JobQueue(ColeccionFalsa(), max_attempts=2, retry_delay_seconds=0)
+        await queue.enqueue("solicitud", {}, job_id="job-1")
+        job = await queue.claim("w")
+        assert not await queue.fail(job, "w", "error 1")
+        job = await queue.claim("w")
+        assert job["Intentos"] == 2 and job["Error"] == "error 1"
+        assert await queue.fail(job, "w", "error 2")
+        assert await queue.claim("w") is None
+        assert (await queue.collection.find_one({"JobID": "job-1"}))["Estado"] == "failed"
+
+    asyncio.run(escenario())
+
+
+def test_worker_pool_reintenta_y_completa():
+    intentos = []
+    fallidos = []
+
+    async def handler(job):
+        intentos.append(job["Intentos"])
+        if job["Payload"]["falla"] or job["Intentos"] == 1:
+            raise RuntimeError("falla transitoria")
+
+    async def on_failed(job, error):
+        fallidos.append((job["JobID"], error))
+
+    async def escenario():
+        queue = JobQueue(ColeccionFalsa(), max_attempts=2, retry_delay_seconds=0)
+        await queue.enqueue("solicitud", {"falla": False}, job_id="job-ok")
+        await queue.enqueue("solicitud", {"falla": True}, job_id="job-malo")
+        pool = WorkerPool(queue, handler, on_failed=on_failed, size=2, poll_interval=0.01)
+        await pool.start()
+        for _ in range(200):
+            estados = [(await queue.collection.find_one({"JobID": j}))["Estado"] for j in ("job-ok", "job-malo")]
+            if estados == ["done", "failed"]:
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return estados
+
+    assert asyncio.run(escenario()) == ["done", "failed"]
+    assert sorted(intentos) == [1, 1, 2, 2]
+    assert fallidos == [("job-malo", "falla transitoria")]
@@ -4,7 +4,9 @@ from main import app
 
 
 @pytest.fixture
-def client():
+def client(monkeypatch):
+    # Sin workers de la cola: las pruebas no tienen MongoDB
+    monkeypatch.setenv("JOB_WORKERS", "0")
     with TestClient(app) as client:
         yield client
 
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import httpx
+from models import TipoAsistenteEnum
+from services.openai_assistant import OpenAIAssistant
+from services.rate_limit import RateLimiter
+
+
+def make_assistant(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return OpenAIAssistant(api_key="test", assistant_id="asst_test", http_client=client, rate_limiter=RateLimiter("test", {}))
+
+
+def test_wait_for_vector_store_files_returns_when_completed():
+    calls = {"n": 0}
+
+    def handler(request):
+        calls["n"] += 1
+        status = "completed" if calls["n"] > 1 else "in_progress"
+        return httpx.Response(200, json={
+            "data": [{"id": "file-1", "status": status}, {"id": "file-otro", "status": "failed"}],
+            "has_more": False
+        })
+
+    assistant = make_assistant(handler)
+    estado = asyncio.run(assistant.wait_for_vector_store_files("vs_1", ["file-1"], initial_interval=0.01))
+    assert estado == {"completed": ["file-1"], "failed": [], "pending": []}
+    assert calls["n"] == 2
+
+
+def test_wait_for_vector_store_files_fails_early():
+    def handler(request):
+        return httpx.Response(200, json={
+            "data": [{"id": "file-1", "status": "failed"}, {"id": "file-2", "status": "in_progress"}],
+            "has_more": False
+        })
+
+    assistant = make_assistant(handler)
+    estado = asyncio.run(assistant.wait_for_vector_store_files("vs_1", ["file-1", "file-2"], timeout=60))
+    assert estado["failed"] == ["file-1"]
+    assert estado["pending"] == ["file-2"]
+
+
+def test_add_files_to_vector_store_batch_retries_only_failed():
+    batches = []
+
+    def handler(request):
+        path = request.url.path
+        if request.method == "POST" and path.endswith("/file_batches"):
+            batches.append(json.loads(request.content)["file_ids"])
+            return httpx.Response(200, json={"id": f"batch_{len(batches)}"})
+        if request.method == "DELETE":
+            return httpx.Response(200, json={"deleted": True})
+        if path.endswith("/files"):
+            if len(batches) == 1:
+                data = [{"id": "file-1", "status": "completed"}, {"id": "file-2", "status": "failed"}]
+            else:
+                data = [{"id": "file-2", "status": "completed"}]
+            return httpx.Response(200, json={"data": data, "has_more": False})
+        return httpx.Response(200, json={"file_counts": {"in_progress": 0}})
+
+    assistant = make_assistant(handler)
+    resultado = asyncio.run(assistant.add_files_to_vector_store_batch("vs_1", ["file-1", "file-2"]))
+    assert batches == [["file-1", "file-2"], ["file-2"]]
+    assert sorted(resultado["completed"]) == ["file-1", "file-2"]
+    assert resultado["failed"] == []
+
+
+def sse(*events):
+    return "".join(f"event: {event}\ndata: {json.dumps(data) if isinstance(data, dict) else data}\n\n" for event, data in events)
+
+
+def test_stream_run_submits_tool_outputs_and_collects_response():
+    requests = []
+    required_action = {"submit_tool_outputs": {"tool_calls": [{"id": "call_1"}]}}
+
+    def handler(request):
+        requests.append((request.method, request.url.path))
+        if request.url.path.endswith("/runs"):
+            body = sse(
+                ("thread.run.created", {"id": "run_1", "status": "queued"}),
+                ("thread.run.step.created", {"id": "step_1"}),
+                ("thread.run.requires_action", {"id": "run_1", "status": "requires_action", "required_action": required_action}),
+                ("done", "[DONE]")
+            )
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        if request.url.path.endswith("/submit_tool_outputs"):
+            assert json.loads(request.content)["tool_outputs"] == [{"tool_call_id": "call_1", "output": "Ok, función ejecutada correctamente."}]
+            body = sse(("thread.run.completed", {"id": "run_1", "status": "completed"}), ("done", "[DONE]"))
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={"data": [{"role": "assistant", "content": [{"type": "text", "text": {"value": "Evaluado"}}]}]})
+
+    assistant = make_assistant(handler)
+    resultado = asyncio.run(assistant.stream_run("thread_1", TipoAsistenteEnum.ambiental))
+    assert resultado["required_action"] == required_action
+    assert resultado["assistant_response"] == "Evaluado"
+    assert [path for _, path in requests] == [
+        "/v1/threads/thread_1/runs",
+        "/v1/threads/thread_1/runs/run_1/submit_tool_outputs",
+        "/v1/threads/thread_1/messages"
+    ]
+
+
+def test_stream_run_cortado_tras_tool_outputs_conserva_la_accion():
+    requests = []
+    required_action = {"submit_tool_outputs": {"tool_calls": [{"id": "call_1"}]}}
+
+    def handler(request):
+        requests.append((request.method, request.url.path))
+        if request.url.path.endswith("/runs"):
+            body = sse(
+                ("thread.run.created", {"id": "run_1", "status": "queued"}),
+                ("thread.run.requires_action", {"id": "run_1", "status": "requires_action", "required_action": required_action}),
+                ("done", "[DONE]")
+            )
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        if request.url.path.endswith("/submit_tool_outputs"):
+            # El stream se corta sin estado final
+            body = sse(("thread.run.in_progress", {"id": "run_1", "status": "in_progress"}))
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        if request.url.path.endswith("/runs/run_1"):
+            return httpx.Response(200, json={"id": "run_1", "status": "completed"})
+        return httpx.Response(200, json={"data": [{"role": "assistant", "content": [{"type": "text", "text": {"value": "Evaluado"}}]}]})
+
+    assistant = make_assistant(handler)
+    resultado = asyncio.run(assistant.stream_run("thread_1", TipoAsistenteEnum.ambiental))
+    # El polling no vuelve a pedir la función: conserva la acción ya enviada en el stream
+    assert resultado["required_action"] == required_action
+    assert resultado["assistant_response"] == "Evaluado"
+    assert ("POST", "/v1/threads/thread_1/messages") not in requests
+
+
+def test_add_files_to_vector_store_batch_respeta_el_plazo_total():
+    def handler(request):
+        if request.method == "POST":
+            return httpx.Response(200, json={"id": "batch_1"})
+        return httpx.Response(200, json={"file_counts": {"in_progress": 1}})
+
+    async def escenario():
+        assistant = make_assistant(handler)
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        resultado = await assistant.add_files_to_vector_store_batch(
+            "vs_1", [f"file-{n}" for n in range(5)], timeout=0.2, batch_size=1
+        )
+        return resultado, loop.time() - inicio
+
+    resultado, duracion = asyncio.run(escenario())
+    # Un solo plazo para todos los lotes, no 0.2s por lote
+    assert duracion < 0.6
+    assert sorted(resultado["pending"]) == [f"file-{n}" for n in range(5)]
@@ -0,0 +1,34 @@
+import asyncio
+from services import pdf_hojas
+from services.pdf_hojas import anchos_por_contenido, distribuir_columnas, renderizar_tabla_pdf
+from reportlab.lib.pagesizes import landscape, letter
+
+
+def test_anchos_y_orientacion_segun_contenido():
+    angosta = [["N", "Descripción"], ["1", "Un texto bastante más largo que el número"]]
+    anchos = anchos_por_contenido(angosta)
+    assert anchos[0] < anchos[1]
+    assert distribuir_columnas(anchos) == (letter, [[0, 1]])
+
+    ancha = [["ID"] + [f"Columna {j}" for j in range(30)], ["1"] + ["valor largo de la celda"] * 30]
+    pagina, grupos = distribuir_columnas(anchos_por_contenido(ancha))
+    assert pagina == landscape(letter) and len(grupos) > 1
+    # Cada bloque repite la primera columna y entre todos cubren todas las columnas
+    assert all(grupo[0] == 0 for grupo in grupos)
+    assert sorted({j for grupo in grupos for j in grupo}) == list(range(31))
+    assert renderizar_tabla_pdf("Ancha", ancha).startswith(b"%PDF")
+
+
+def test_renderizar_tablas_pdf_usa_cache(monkeypatch):
+    llamadas = []
+
+    async def run_cpu(func, *args):
+        llamadas.append(args[0])
+        return func(*args)
+
+    monkeypatch.setattr(pdf_hojas, "run_cpu", run_cpu)
+    tablas = [("Roles", [["Rol"], ["Jefe"]]), ("Experiencia", [["Obra"], ["Puente"]])]
+    primera = asyncio.run(pdf_hojas.renderizar_tablas_pdf(tablas))
+    segunda = asyncio.run(pdf_hojas.renderizar_tablas_pdf([tablas[1], ("Roles", [["Rol"], ["Analista"]])]))
+    assert segunda[0] == primera[1]
+    assert llamadas == ["Roles", "Experiencia", "Roles"]
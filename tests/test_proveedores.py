@@ -0,0 +1,47 @@
+import asyncio
+import httpx
+import pytest
+from services.azureOpenAI import AzureOpenAIAssistant
+from services.openai_assistant import OpenAIAssistant
+from services.proveedores import crear_assistant, elegir_proveedor, pesos_proveedores
+from services.rate_limit import RateLimiter
+
+
+def test_azure_rest_usa_transporte_y_opciones_de_run():
+    peticiones = []
+
+    def handler(request):
+        peticiones.append(request)
+        return httpx.Response(200, json={"id": "run_1", "data": []})
+
+    assistant = AzureOpenAIAssistant(
+        "key", "https://recurso.openai.azure.com/", "asst", api_version="2024-05-01-preview",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), rate_limiter=RateLimiter("test", {})
+    )
+    assert asyncio.run(assistant.create_run("thread_1")) == "run_1"
+    asyncio.run(assistant.list_vector_store_files("vs_1", status_filter="failed"))
+    run, listado = peticiones
+    assert str(run.url) == "https://recurso.openai.azure.com/openai/threads/thread_1/runs?api-version=2024-05-01-preview"
+    assert run.headers["api-key"] == "key" and "authorization" not in run.headers
+    assert b'"temperature":0.5' in run.content.replace(b" ", b"")
+    # Los params de la llamada se agregan a la api-version de la URL
+    assert listado.url.params["api-version"] == "2024-05-01-preview" and listado.url.params["filter"] == "failed"
+
+
+def test_registro_y_failover(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://recurso.openai.azure.com")
+    monkeypatch.setenv("ASSISTANT_PROVIDERS", "openai:3, azure:0")
+    assert pesos_proveedores() == {"openai": 3.0, "azure": 0.0}
+    assert isinstance(crear_assistant("openai"), OpenAIAssistant)
+    assert isinstance(crear_assistant("azure"), AzureOpenAIAssistant)
+    with pytest.raises(ValueError):
+        crear_assistant("otro")
+
+    degradados = set()
+    monkeypatch.setattr("services.proveedores.host_degradado", lambda host: host in degradados)
+    assert elegir_proveedor() == "openai"
+    # Azure (peso 0) solo entra como respaldo cuando OpenAI tiene circuitos abiertos o pausa por 429
+    degradados.add("api.openai.com")
+    assert elegir_proveedor() == "azure"
+    degradados.add("recurso.openai.azure.com")
+    assert elegir_proveedor() == "openai"
@@ -0,0 +1,47 @@
+import asyncio
+from services.rate_limit import RateLimiter, TokenBucket, estimar_tokens
+
+
+def test_token_bucket_reparte_en_el_tiempo(monkeypatch):
+    ahora = [0.0]
+    esperas = []
+
+    async def sleep(segundos):
+        esperas.append(segundos)
+        ahora[0] += segundos
+
+    monkeypatch.setattr("services.rate_limit.asyncio.sleep", sleep)
+    bucket = TokenBucket(60, capacidad=2, reloj=lambda: ahora[0])
+
+    async def consumir():
+        for _ in range(4):
+            await bucket.adquirir()
+
+    asyncio.run(consumir())
+    # Dos pasan con el burst y los siguientes esperan un segundo cada uno (60 por minuto)
+    assert esperas == [1.0, 1.0]
+
+
+def test_pedido_mayor_que_la_capacidad_deja_deuda(monkeypatch):
+    ahora = [0.0]
+
+    async def sleep(segundos):
+        ahora[0] += segundos
+
+    monkeypatch.setattr("services.rate_limit.asyncio.sleep", sleep)
+    bucket = TokenBucket(6000, capacidad=100, reloj=lambda: ahora[0])
+
+    async def consumir():
+        await bucket.adquirir(1000)
+        await bucket.adquirir(100)
+
+    asyncio.run(consumir())
+    # 1000 tokens a 100/s: el segundo pedido espera a pagar la deuda (900) y juntar 100 más
+    assert ahora[0] == 10.0
+
+
+def test_clases_sin_limite_no_esperan():
+    limitador = RateLimiter("test", {"runs": 0})
+    asyncio.run(limitador.adquirir("runs", 1000))
+    assert limitador.buckets == {}
+    assert estimar_tokens("a" * 10) == 3
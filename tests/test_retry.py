@@ -0,0 +1,117 @@
+import asyncio
+import httpx
+import pytest
+from services.openai_assistant import OpenAIAssistant
+from services.rate_limit import RateLimiter
+from services.retry import (
+    CircuitBreaker, CircuitoAbiertoError, PoliticaReintentos, ejecutar_con_reintentos, espera_indicada,
+    parsear_duracion
+)
+
+
+def respuesta(status, headers=None):
+    return httpx.Response(status, headers=headers, request=httpx.Request("GET", "https://api.test/v1/runs"))
+
+
+def test_espera_indicada_por_headers():
+    assert parsear_duracion("6m0s") == 360
+    assert parsear_duracion("20ms") == pytest.approx(0.02)
+    assert parsear_duracion("abc") is None
+    assert espera_indicada(respuesta(429, {"retry-after": "7"})) == 7
+    assert espera_indicada(respuesta(429, {"retry-after-ms": "1500", "retry-after": "7"})) == 1.5
+    # Se usa el reset del límite agotado (tokens), no el de requests
+    assert espera_indicada(respuesta(429, {
+        "x-ratelimit-remaining-requests": "10", "x-ratelimit-reset-requests": "1s",
+        "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "12s"
+    })) == 12
+    assert espera_indicada(respuesta(500)) is None
+
+
+def test_reintenta_transitorios_y_no_los_4xx(monkeypatch):
+    esperas = []
+
+    async def sleep(segundos):
+        esperas.append(segundos)
+
+    monkeypatch.setattr("services.retry.asyncio.sleep", sleep)
+    politica = PoliticaReintentos(max_intentos=4, base=0.5)
+    status = iter([429, 503, 200])
+
+    async def operacion():
+        response = respuesta(next(status), {"retry-after": "3"})
+        response.raise_for_status()
+        return "ok"
+
+    assert asyncio.run(ejecutar_con_reintentos(operacion, politica)) == "ok"
+    # 429 respeta Retry-After (más jitter de hasta base); 503 con el mismo header también
+    assert len(esperas) == 2 and all(3 <= e <= 3.5 for e in esperas)
+
+    llamadas = []
+
+    async def no_reintentable():
+        llamadas.append(1)
+        respuesta(400).raise_for_status()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(ejecutar_con_reintentos(no_reintentable, politica))
+    assert len(llamadas) == 1
+
+
+def test_circuito_se_abre_y_deja_pasar_una_prueba():
+    ahora = [0.0]
+    circuito = CircuitBreaker("api.test/runs", umbral_fallos=2, tiempo_apertura=10, reloj=lambda: ahora[0])
+    error = httpx.HTTPStatusError("503", request=httpx.Request("GET", "https://api.test"), response=respuesta(503))
+    circuito.registrar(error)
+    circuito.registrar(error)
+    assert circuito.estado == "abierto"
+    with pytest.raises(CircuitoAbiertoError):
+        asyncio.run(circuito.esperar_turno())
+    ahora[0] = 11
+    asyncio.run(circuito.esperar_turno())
+    # Mientras la llamada de prueba está en curso, las demás se rechazan
+    with pytest.raises(CircuitoAbiertoError):
+        asyncio.run(circuito.esperar_turno())
+    circuito.registrar(None)
+    assert circuito.estado == "cerrado"
+
+
+def test_create_run_reintenta_500_y_no_404():
+    llamadas = {"n": 0}
+
+    def handler(request):
+        llamadas["n"] += 1
+        if "thread_404" in request.url.path:
+            return httpx.Response(404, json={"error": "not found"})
+        if llamadas["n"] == 1:
+            return httpx.Response(500, json={"error": "server"})
+        return httpx.Response(200, json={"id": "run_1"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    assistant = OpenAIAssistant(api_key="test", assistant_id="asst_test", http_client=client,
+                                retry_policy=PoliticaReintentos(max_intentos=3, base=0.01), rate_limiter=RateLimiter("test", {}))
+    assert asyncio.run(assistant.create_run("thread_1")) == "run_1"
+    assert llamadas["n"] == 2
+    assert asyncio.run(assistant.create_run("thread_404")) is None
+    assert llamadas["n"] == 3
+
+
+def test_prueba_cancelada_no_bloquea_el_circuito():
+    ahora = [0.0]
+    circuito = CircuitBreaker("api.test/files", umbral_fallos=1, tiempo_apertura=10, reloj=lambda: ahora[0])
+    circuito.registrar(httpx.HTTPStatusError("503", request=httpx.Request("GET", "https://api.test"), response=respuesta(503)))
+    ahora[0] = 11
+
+    async def colgada():
+        await asyncio.sleep(10)
+
+    async def escenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(ejecutar_con_reintentos(colgada, PoliticaReintentos(max_intentos=1), circuito), 0.01)
+        # La siguiente llamada puede hacer de prueba en lugar de recibir CircuitoAbiertoError
+
+        async def ok():
+            return "ok"
+        return await ejecutar_con_reintentos(ok, PoliticaReintentos(max_intentos=1), circuito)
+
+    assert asyncio.run(escenario()) == "ok"
+    assert circuito.estado == "cerrado"
@@ -0,0 +1,70 @@
+import asyncio
+from services.run_tracker import RunTracker
+
+
+def test_tracker_resuelve_cada_run_con_su_estado_final():
+    consultas = {}
+    finales = {"run_1": 2, "run_2": 4}
+
+    async def consulta(thread_id, run_id):
+        consultas[run_id] = consultas.get(run_id, 0) + 1
+        if consultas[run_id] >= finales[run_id]:
+            return {"id": run_id, "status": "requires_action" if run_id == "run_1" else "completed"}
+        return {"id": run_id, "status": "in_progress"}
+
+    async def escenario():
+        tracker = RunTracker(intervalo_inicial=0.01, intervalo_maximo=0.05, backoff=2)
+        avisos = []
+        futuro = tracker.registrar("thread_2", "run_2", consulta, callback=avisos.append)
+        snapshot = tracker.snapshot()
+        estado_1 = await tracker.esperar("thread_1", "run_1", consulta, timeout=5)
+        estado_2 = await futuro
+        await asyncio.sleep(0)
+        return snapshot, estado_1, estado_2, avisos, tracker.snapshot()
+
+    snapshot, estado_1, estado_2, avisos, final = asyncio.run(escenario())
+    assert [r["RunID"] for r in snapshot] == ["run_2"]
+    assert estado_1["status"] == "requires_action"
+    assert estado_2["status"] == "completed"
+    assert avisos == [estado_2]
+    assert consultas == {"run_1": 2, "run_2": 4}
+    assert final == []
+
+
+def test_tracker_timeout_quita_el_run():
+    async def consulta(thread_id, run_id):
+        return {"status": "queued"}
+
+    async def escenario():
+        tracker = RunTracker(intervalo_inicial=0.01, intervalo_maximo=0.01)
+        try:
+            await tracker.esperar("thread_1", "run_1", consulta, timeout=0.05)
+        except asyncio.TimeoutError:
+            return tracker.snapshot()
+
+    assert asyncio.run(escenario()) == []
+
+
+def test_tracker_consulta_lenta_no_bloquea_a_los_demas():
+    liberar = {}
+
+    async def consulta(thread_id, run_id):
+        if run_id == "run_lento":
+            await liberar["evento"].wait()
+            return {"status": "completed"}
+        return {"status": "completed"}
+
+    async def escenario():
+        liberar["evento"] = asyncio.Event()
+        tracker = RunTracker(intervalo_inicial=0.01, intervalo_maximo=0.01)
+        lento = tracker.registrar("thread_1", "run_lento", consulta)
+        await asyncio.sleep(0.05)
+        # El run lento sigue en su consulta; el nuevo se resuelve igual
+        estado = await tracker.esperar("thread_2", "run_rapido", consulta, timeout=1)
+        pendiente = not lento.done()
+        liberar["evento"].set()
+        return estado, pendiente, await asyncio.wait_for(lento, 1)
+
+    estado, pendiente, estado_lento = asyncio.run(escenario())
+    assert estado["status"] == "completed" and pendiente
+    assert estado_lento["status"] == "completed"
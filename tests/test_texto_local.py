@@ -0,0 +1,48 @@
+import importlib.util
+import zipfile
+from io import BytesIO
+from openpyxl import Workbook
+from services.texto_local import extraer_texto_local, normalizar_espacios
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+A = 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+
+
+def _zip(miembros: dict) -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for nombre, contenido in miembros.items():
+            zf.writestr(nombre, contenido)
+    return buffer.getvalue()
+
+
+def test_normalizar_espacios():
+    assert normalizar_espacios("  a \t b  c \r\n\n\n\n d  ") == "a b c\n\nd"
+
+
+def test_extraer_texto_docx_pptx_xlsx():
+    docx = _zip({"word/document.xml": f'<w:document {W}><w:body>'
+                 '<w:p><w:r><w:t>Experiencia</w:t></w:r><w:r><w:tab/><w:t>10 años</w:t></w:r></w:p>'
+                 '<w:p><w:r><w:t>Ingeniero civil</w:t></w:r></w:p></w:body></w:document>'})
+    assert extraer_texto_local(docx, "docx", min_caracteres=0) == "Experiencia 10 años\nIngeniero civil"
+
+    pptx = _zip({f"ppt/slides/slide{n}.xml": f'<p:sld xmlns:p="p" {A}><a:p><a:r><a:t>Lámina {n}</a:t></a:r></a:p></p:sld>'
+                 for n in (2, 10, 1)})
+    assert extraer_texto_local(pptx, "pptx", min_caracteres=0) == (
+        "--- Diapositiva 1 ---\nLámina 1\n\n--- Diapositiva 2 ---\nLámina 2\n\n--- Diapositiva 3 ---\nLámina 10"
+    )
+
+    wb = Workbook()
+    wb.active.append(["Rol", "Años"])
+    wb.active.append(["Jefe", 5])
+    buffer = BytesIO()
+    wb.save(buffer)
+    assert extraer_texto_local(buffer.getvalue(), "xlsx", min_caracteres=0) == "=== Hoja: Sheet ===\nRol,Años\nJefe,5"
+    # Muy poco texto: se conserva el original
+    assert extraer_texto_local(buffer.getvalue(), "xlsx") is None
+
+
+def test_pdf_sin_libreria_opcional_conserva_el_original():
+    if importlib.util.find_spec("pypdf") or importlib.util.find_spec("fitz"):
+        return
+    assert extraer_texto_local(b"%PDF-1.7", "pdf", min_caracteres=0) is None
@@ -0,0 +1,44 @@
+import asyncio
+from io import BytesIO
+from types import SimpleNamespace
+from fastapi import UploadFile
+from mongo_falso import ColeccionFalsa
+from routers import vigia
+from services.file_cache import FileCache, hash_fileobj
+
+
+class AssistantFalso:
+    def __init__(self):
+        self.subidos = []
+
+    async def file_exists(self, file_id):
+        return True
+
+    async def upload_file_from_formdata_v2(self, file, filename, purpose="assistants", mime_type=None):
+        if filename == "falla.pdf":
+            return None
+        self.subidos.append(filename)
+        return {"id": f"file-{filename}"}
+
+
+def test_subir_anexos_registra_cada_referencia_al_tomarla(monkeypatch):
+    solicitudes = ColeccionFalsa()
+    monkeypatch.setattr(vigia, "db", SimpleNamespace(Solicitud=solicitudes))
+
+    async def escenario():
+        await solicitudes.insert_one({"SolicitudID": "sol_1"})
+        cache = FileCache(ColeccionFalsa())
+        cacheado = BytesIO(b"ya subido")
+        await cache.put(hash_fileobj(cacheado), "file-cacheado", "cacheado.pdf")
+        anexos = [UploadFile(file=cacheado, filename="cacheado.pdf"), UploadFile(file=BytesIO(b"nuevo"), filename="nuevo.pdf"),
+                  UploadFile(file=BytesIO(b"roto"), filename="falla.pdf")]
+        referencias = []
+        resultados = await vigia.subir_anexos_concurrente(
+            AssistantFalso(), anexos, file_cache=cache, referencias=referencias, solicitud_id="sol_1"
+        )
+        return resultados, referencias, await solicitudes.find_one({"SolicitudID": "sol_1"})
+
+    resultados, referencias, doc = asyncio.run(escenario())
+    assert [r["id"] for r in resultados] == ["file-cacheado", "file-nuevo.pdf", None]
+    # Persistidas una a una: si el worker cae, el siguiente intento las suelta
+    assert sorted(doc["ReferenciasCache"]) == sorted(referencias) == ["file-cacheado", "file-nuevo.pdf"]
@@ -0,0 +1,25 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+load_dotenv()
+from routers.vigia import crear_worker_pool
+from services.http_client import init_http_client, close_http_client
+from services.executors import init_executors, shutdown_executors
+
+
+async def main():
+    # Proceso de workers independiente de la API; se pueden lanzar varios, en una o más máquinas
+    await init_http_client()
+    init_executors()
+    worker_pool = crear_worker_pool(int(os.getenv("JOB_WORKERS", "2")))
+    await worker_pool.start()
+    try:
+        await worker_pool.wait()
+    finally:
+        await worker_pool.stop()
+        shutdown_executors()
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())